@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the agent on emulated hardware: startup time,
+per-cycle wall time, per-sensor read latency, CPU time per published
+message, and peak memory, for increasing numbers of sensors.
+
+Each sensor count is run in a fresh interpreter, so startup time includes
+imports, and memory figures aren't shared between runs. Messages go to an
+in-process fake MQTT client by default (so no broker is needed), or to a
+real broker (e.g. a local Mosquitto) with --broker. Results are written as
+JSON, and can be compared against an earlier run, e.g. the last release:
+
+  python3 benchmarks/agent.py --output results.json
+  python3 benchmarks/agent.py --sensors 1 10 100 --compare results.json
+"""
+import os, sys, json, time, argparse, platform, resource, subprocess, threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Metrics where a higher value is worse, compared between runs
+METRICS = [ 'startup', 'first_cycle', 'cycle_wall_mean', 'cycle_wall_max',
+            'read_latency_mean', 'read_latency_p99', 'cpu_per_message', 'max_rss_kb' ]
+
+
+class FakeResult():
+
+  rc = 0
+
+
+class FakeClient():
+  """Stands in for paho's mqtt.Client: connects straight away, and counts (but discards) published messages."""
+
+  def __init__(self):
+    self.on_connect = None
+    self.on_disconnect = None
+    self.messages = 0
+    self._connecting = False
+    self._lock = threading.Lock()
+
+  def username_pw_set(self, username, password=None):
+    pass
+
+  def will_set(self, topic, payload=None, qos=0, retain=False):
+    pass
+
+  def connect(self, host, port=1883, keepalive=60):
+    self._connecting = True
+
+  def loop(self, timeout=1.0):
+    if self._connecting:
+      self._connecting = False
+      self.on_connect(self, None, {}, 0)
+    else:
+      time.sleep(timeout)
+    return 0
+
+  def publish(self, topic, payload=None, qos=0, retain=False):
+    with self._lock:
+      self.messages += 1
+    return FakeResult()
+
+  def subscribe(self, topic, qos=0):
+    return (0, 1)
+
+  def disconnect(self):
+    pass
+
+
+def run(count, options):
+  """Run the agent with count emulated sensors, returning its measurements (in a child process)."""
+  sys.path.insert(0, str(ROOT))
+  from sensors.agent import SensorAgent
+
+  clients = []
+  class BenchmarkAgent(SensorAgent):
+    if options.broker is None:
+      @staticmethod
+      def client_factory():
+        clients.append(FakeClient())
+        return clients[-1]
+
+  host, _, port = (options.broker or 'localhost').partition(':')
+  config = {
+    'mqtt_broker':        host,
+    'mqtt_port':          int(port or 1883),
+    'sensor_types':       [ 'emulator' ],
+    'emulator':           { device_type: 0 for device_type in ('bme280', 'sht31d', 'tmp117', 'mcp9808', 'ds18b20', 'bme680') },
+    'update_period':      options.period,
+    'max_workers':        options.workers,
+    'stats_period':       None,
+    'enumeration_cache':  None,
+    'spool_dir':          None,
+    'history_dir':        options.history,
+    'verbose':            False
+  }
+  config['emulator'][options.device] = count
+  agent = BenchmarkAgent(config)
+
+  # Time each sensor's reads, and the start and end of each of its polls
+  reads = []
+  polls = { sensor: [] for sensor in agent.sensors }
+  for plan in agent.plans.values():
+    def timed_read(read=plan.read):
+      start = time.perf_counter()
+      try:
+        return read()
+      finally:
+        reads.append(time.perf_counter() - start)
+    plan.read = timed_read
+  poll_sensor = agent.poll_sensor
+  def timed_poll(sensor):
+    start = time.perf_counter()
+    poll_sensor(sensor)
+    polls[sensor].append((start, time.perf_counter()))
+  agent.poll_sensor = timed_poll
+
+  threading.Thread(target=agent.start, daemon=True).start()
+  # Ready once every sensor has been polled once
+  while min(len(p) for p in polls.values()) < 1:
+    time.sleep(0.001)
+  ready = time.perf_counter()
+  first_cycle = max(p[0][1] for p in polls.values()) - min(p[0][0] for p in polls.values())
+  cpu_start, messages_start, reads_start = time.process_time(), published(clients), len(reads)
+  while min(len(p) for p in polls.values()) < options.cycles + 1:
+    time.sleep(0.01)
+  cpu = time.process_time() - cpu_start
+  messages = published(clients) - messages_start
+  latencies = sorted(reads[reads_start:])
+  cycles = [ max(p[cycle][1] for p in polls.values()) - min(p[cycle][0] for p in polls.values())
+             for cycle in range(1, options.cycles + 1) ]
+  return {
+    'sensors':            len(agent.sensors),
+    'ready':              ready,
+    'first_cycle':        first_cycle,
+    'cycle_wall_mean':    sum(cycles) / len(cycles),
+    'cycle_wall_max':     max(cycles),
+    'read_latency_mean':  sum(latencies) / len(latencies),
+    'read_latency_p99':   latencies[int(len(latencies) * 0.99)],
+    'messages':           messages,
+    'cpu_per_message':    cpu / messages if messages > 0 else None,
+    'max_rss_kb':         resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  }
+
+
+def published(clients):
+  return sum(client.messages for client in clients)
+
+
+def measure(count, args):
+  """Run one sensor count in a fresh interpreter, including its startup time."""
+  command = [ sys.executable, __file__, '--child', str(count) ] + args
+  start = time.perf_counter()
+  process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, cwd=str(ROOT))
+  # Child processes report time.perf_counter(), which is system-wide (CLOCK_MONOTONIC) on Linux
+  result = json.loads(process.stdout.decode('utf-8').strip().splitlines()[-1])
+  result['startup'] = result.pop('ready') - start
+  return result
+
+
+def compare(results, baseline, tolerance):
+  for count, result in results['results'].items():
+    previous = baseline['results'].get(count)
+    if previous is None:
+      continue
+    print("{} sensor(s), against {}:".format(count, baseline.get('label') or 'baseline'))
+    for metric in METRICS:
+      if result.get(metric) is None or not previous.get(metric):
+        continue
+      change = 100 * (result[metric] - previous[metric]) / previous[metric]
+      print("  {:<20} {:>12.6g} -> {:<12.6g} {:+7.1f}%{}".format(metric, previous[metric], result[metric], change,
+                                                              "  REGRESSION" if change > tolerance else ""))
+
+
+def main(args):
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--sensors', type=int, nargs='+', default=[1, 10, 100, 1000], help="numbers of sensors to benchmark")
+  parser.add_argument('--device', default='bme280', help="emulated device type to use for the sensors")
+  parser.add_argument('--period', type=float, default=2, help="update period, in seconds")
+  parser.add_argument('--cycles', type=int, default=5, help="number of update cycles to measure (after the first)")
+  parser.add_argument('--workers', type=int, default=None, help="size of the polling thread pool (default: one thread per sensor)")
+  parser.add_argument('--history', default=None, help="directory to keep readings history in (default: no history)")
+  parser.add_argument('--broker', default=None, help="host[:port] of an MQTT broker to publish to, rather than a fake client")
+  parser.add_argument('--output', default=None, help="file to write the results to, as JSON")
+  parser.add_argument('--compare', default=None, help="results file from an earlier run, to compare against")
+  parser.add_argument('--tolerance', type=float, default=10, help="percentage increase in a metric reported as a regression")
+  parser.add_argument('--label', default=None, help="label for these results, e.g. the release")
+  parser.add_argument('--child', type=int, default=None, help=argparse.SUPPRESS)
+  options = parser.parse_args(args)
+
+  if options.child is not None:
+    # Emulator output goes to stdout too, the results are the last line
+    print(json.dumps(run(options.child, options)), flush=True)
+    os._exit(0)
+
+  results = {
+    'label':      options.label,
+    'timestamp':  time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'python':     platform.python_version(),
+    'machine':    platform.machine(),
+    'settings':   { 'device': options.device, 'period': options.period, 'cycles': options.cycles,
+                    'workers': options.workers, 'broker': options.broker },
+    'results':    {}
+  }
+  for count in options.sensors:
+    result = measure(count, args)
+    results['results'][str(count)] = result
+    print("{:>5} sensor(s): startup {:.3f}s, cycle {:.4f}s (max {:.4f}s), read {:.1f} µs (p99 {:.1f} µs), {:.1f} µs CPU/message, {:.1f} MB".format(
+      count, result['startup'], result['cycle_wall_mean'], result['cycle_wall_max'],
+      result['read_latency_mean'] * 1e6, result['read_latency_p99'] * 1e6,
+      (result['cpu_per_message'] or 0) * 1e6, result['max_rss_kb'] / 1024))
+
+  if options.output is not None:
+    Path(options.output).write_text(json.dumps(results, indent=2))
+  if options.compare is not None:
+    compare(results, json.loads(Path(options.compare).read_text()), options.tolerance)
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the state payload encodings: CPU time to encode, and
+message size, for each sensor type's readings, comparing the original
+json.dumps (with an ISO 8601 timestamp) against the agent's encoders.
+
+Encoders whose packages (cbor2, msgpack) aren't installed are skipped.
+Run it on the target device (e.g. a Pi Zero) to see the figures that
+matter there:
+
+  python3 benchmarks/encoding.py --count 20000
+"""
+import sys, json, time, argparse
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from sensors.measurements import Measurement
+from sensors.encoding import ENCODERS, get_encoder
+
+
+SENSOR_TYPES = {
+  'bme280':   [ Measurement.TEMPERATURE, Measurement.PRESSURE, Measurement.HUMIDITY ],
+  'bme680':   [ Measurement.TEMPERATURE, Measurement.PRESSURE, Measurement.HUMIDITY,
+                Measurement.AIR_QUALITY, Measurement.IAQ_ACCURACY,
+                Measurement.STATIC_AIR_QUALITY, Measurement.S_IAQ_ACCURACY,
+                Measurement.CO2_EQUIV, Measurement.BVOC_EQUIV,
+                Measurement.GAS, Measurement.GAS_PERCENT ],
+  'ltr559':   [ Measurement.LIGHT, Measurement.PROXIMITY ],
+  'ds18b20':  [ Measurement.TEMPERATURE ]
+}
+
+
+def readings_for(measurements):
+  """Typical readings, rounded as the agent would publish them."""
+  readings = { 'timestamp': datetime.now().isoformat(timespec='seconds') }
+  for n, measurement in enumerate(measurements):
+    value = 1234.56789 / (n + 1)
+    readings[measurement['name']] = int(value) if measurement['precision'] == 0 else round(value, measurement['precision'])
+  return readings
+
+
+def measure(encode, readings, count):
+  start = time.process_time()
+  for _ in range(count):
+    payload = encode(readings)
+  return (time.process_time() - start) / count, len(payload.encode('utf-8') if isinstance(payload, str) else payload)
+
+
+def main(args):
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--count', type=int, default=20000, help="number of payloads to encode per sensor type and encoding")
+  options = parser.parse_args(args)
+
+  encoders = { 'legacy': json.dumps }
+  for name in ENCODERS:
+    try:
+      encoders[name] = get_encoder(name).encode
+    except ImportError as error:
+      print("Skipping {}: {}".format(name, error))
+
+  for sensor_type, measurements in SENSOR_TYPES.items():
+    readings = readings_for(measurements)
+    print("{} ({} measurements):".format(sensor_type, len(measurements)))
+    for name, encode in encoders.items():
+      cpu, size = measure(encode, readings, options.count)
+      print("  {:<8} {:8.2f} µs CPU per message, {:4d} bytes".format(name, cpu * 1e6, size))
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the CPU time the agent spends preparing each sensor's
+readings for publishing, per update cycle: the original inline code in
+SensorAgent.update versus executing a precompiled PublishPlan.
+
+No hardware or MQTT broker is needed, the sensors are stand-ins returning
+fixed values and publishing is a no-op. Run it on the target device (e.g.
+a Pi Zero) to see the figures that matter there:
+
+  python3 benchmarks/publish_plan.py --sensors 10 --cycles 2000
+"""
+import sys, json, time, argparse
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from sensors.measurements import Measurement
+from sensors.publish import PublishPlan
+
+
+class FakeSensor():
+
+  supported_measurements = [Measurement.TEMPERATURE,
+                            Measurement.PRESSURE,
+                            Measurement.HUMIDITY]
+
+  def __init__(self, number):
+    self.id = "fake--{:08x}".format(number)
+    self.temperature = 21.123456
+    self.pressure = 1013.254321
+    self.humidity = 45.678912
+
+  def update_sensor(self):
+    self.timestamp = datetime.now().isoformat(timespec='seconds')
+
+
+def publish_message(topic, payload, qos=0, retain=False):
+  pass
+
+
+def info(message, verbose=False):
+  if verbose:
+    print("INFO: {}".format(message))
+
+
+def legacy_cycle(sensors, config):
+  """The body of SensorAgent.update's loop, before publish plans."""
+  for sensor in sensors:
+    status_topic = "sensors/{}/status".format(sensor.id)
+    sensor.update_sensor()
+    publish_message(topic=status_topic, payload="online")
+    readings = {}
+    readings['timestamp'] = str(getattr(sensor, 'timestamp'))
+    for measurement in sensor.supported_measurements:
+      value = getattr(sensor, measurement['name'])
+      if type(config['sensor_offset']) is dict:
+        if sensor.id in config['sensor_offset']:
+          value += config['sensor_offset'][sensor.id]
+      else:
+        value += config['sensor_offset']
+      if value is not None:
+        readings[measurement['name']] = round(value, measurement['precision'] if measurement['precision']>0 else None)
+    info("Publishing readings for sensor {}: {}".format(sensor.id, ", ".join(['{0}={1}'.format(k, v) for k,v in readings.items()])))
+    publish_message(topic="sensors/{}/state".format(sensor.id), payload=json.dumps(readings))
+
+
+def plan_cycle(plans, config):
+  """The equivalent of SensorAgent.poll_sensor for each sensor, using publish plans."""
+  for plan in plans:
+    readings = plan.read()
+    publish_message(topic=plan.status_topic, payload="online")
+    if config['verbose']:
+      info("Publishing readings for sensor {}: {}".format(plan.sensor.id, ", ".join(['{0}={1}'.format(k, v) for k,v in readings.items()])))
+    publish_message(topic=plan.state_topic, payload=json.dumps(readings))
+
+
+def measure(cycle, cycles):
+  start = time.process_time()
+  for _ in range(cycles):
+    cycle()
+  return (time.process_time() - start) / cycles
+
+
+def main(args):
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--sensors', type=int, default=10, help="number of sensors per cycle")
+  parser.add_argument('--cycles', type=int, default=2000, help="number of cycles to time")
+  parser.add_argument('--period', type=float, default=30, help="update period, to express CPU time as a share of the cycle")
+  options = parser.parse_args(args)
+
+  config = { 'sensor_offset': { 'fake--00000001': 0.5 }, 'verbose': False }
+  sensors = [ FakeSensor(n) for n in range(options.sensors) ]
+  plans = [ PublishPlan(sensor, config['sensor_offset'].get(sensor.id, 0)) for sensor in sensors ]
+
+  results = {
+    'legacy': measure(lambda: legacy_cycle(sensors, config), options.cycles),
+    'plan':   measure(lambda: plan_cycle(plans, config), options.cycles)
+  }
+  for name, cpu in results.items():
+    print("{:<8} {:10.1f} µs CPU per cycle ({:.1f} µs per sensor, {:.5f}% of a {}s period)".format(
+      name, cpu * 1e6, cpu * 1e6 / options.sensors, 100 * cpu / options.period, options.period))
+  print("speed-up: {:.2f}x".format(results['legacy'] / results['plan']))
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -1,22 +1,62 @@
 #!/usr/bin/env python3
-import sys, socket, traceback
-import json, time, importlib
-from typing import List, Optional
+import os, sys, socket
+import json, time
+from queue import Queue, Full
 import paho.mqtt.client as mqtt
 from threading import Thread
-from sensors.measurements import Measurement, MeasurementError
+from sensors.measurements import MeasurementError
+from sensors.scheduler import SensorScheduler
+from sensors.cache import EnumerationCache
+from sensors.publish import PublishPlan, base_measurement
+from sensors.pipeline import Oversampler, SMOOTHERS
+from sensors.derived import derivations
+from sensors.status import StatusTracker
+from sensors.deadband import DeadbandFilter
+from sensors.spool import Spool, BACKFILL_SUFFIX
+from sensors.connection import MqttConnection
+from sensors.batch import Batch
+from sensors.encoding import get_encoder
+from sensors.events import CoalescingQueue
+from sensors.history import History
+from sensors.queries import HistoryRequest
+from sensors import i2c, registry
 
 
 class SensorAgent:
   mqtt_client           = None
+  connection            = None
   mqtt_connected        = False
   ha_registered         = False
   attributes_published  = False
   worker                = None
+  scheduler             = None
+  reporter              = None
+  drainer               = None
+  batcher               = None
+  publisher             = None
+  historian             = None
+  responder             = None
+  client_factory        = mqtt.Client   # Creates the MQTT client (overridden by the benchmarks, with a fake client)
 
   default_config = {
     'update_period':    30,
+    'sensor_period':    None,  # Optional dict of per-sensor id or per-sensor type -> update period, overriding update_period
+    'oversampling':     None,  # Optional dict of per-sensor id or per-sensor type -> number of reads per update, filtered for outliers and averaged
+    'outlier_threshold': 3.5,  # Modified z-score (median absolute deviations from the median) beyond which an oversampled read is an outlier
+    'smoothing':        None,  # Optional dict of measurement name -> time constant, in seconds, for also publishing the measurement smoothed (as <name>_smoothed)
+    'smoothing_method': 'ema', # How measurements are smoothed: ema (exponential moving average) or kalman (1-D Kalman filter)
+    'derived_measurements': None,  # Optional list of measurements to derive from each sensor's readings: dew_point, absolute_humidity, heat_index and/or sea_level_pressure
+    'altitude':         None,  # Altitude, in metres, for sea_level_pressure: single value or dict with per-sensor id->altitude
+    'max_workers':      None,  # Size of the sensor polling thread pool, defaults to one thread per sensor
+    'status_refresh':   None,  # Period, in seconds, between republishing unchanged sensor statuses (None to only publish changes)
+    'stats_period':     300,   # Period, in seconds, between reports of bus utilisation statistics and sensor metrics (0 or None to disable)
     'valid_time':       600,
+    'state_encodings':  [ 'json' ],  # Encodings to publish state in: json (always, on sensors/{id}/state, for Home Assistant), plus cbor and/or msgpack (on sensors/{id}/state/{encoding})
+    'event_publishing': False, # Publish samples from sensors that push them (e.g. the BME680's BSEC output) as they arrive, rather than polling
+    'batch_mode':       False, # Publish all sensors' readings together, as one message per batch_period, on sensors/{host}/batch
+    'batch_period':     None,  # Period, in seconds, between batch messages (default: update_period)
+    'deadband':         None,  # Optional dict of measurement name -> minimum change worth publishing (report-by-exception)
+    'max_silence':      None,  # Maximum period, in seconds, between publishing unchanged readings when using deadbands (default: half of valid_time)
     'verbose':          True,
     'host_device':      None,
     'sensor_types':     [ 
@@ -34,6 +74,10 @@ class SensorAgent:
                           "tmp117",
                           "ltr559"
                         ],       
+    'bsec_sample_interval': 3,     # Seconds between BME680 BSEC samples, matching the BSEC config: 3 (LP mode) or 300 (ULP mode)
+    'bsec_checkpoint_period': 3600, # Period, in seconds, between checkpoints of the BSEC calibration state
+    'emulator':         None,  # For the emulator sensor type, the number of each type of device to emulate, and other settings (see sensors/emulator.py)
+    'enumeration_cache': '/data/sensors.json',  # Record of discovered sensors, used to skip enumeration on restart (None to disable)
     'sensor_location':  None,  # Can be a string (for all/single sensor(s)), or dict with per-sensor entries, id->location
     'sensor_offset':    0,     # Single value or dict with per-sensor id->offset
     'mqtt_broker':      None,  # Must be overridden
@@ -41,6 +85,18 @@ class SensorAgent:
     'mqtt_username':    None,
     'mqtt_password':    None,
     'mqtt_ha_prefix':   'homeassistant',
+    'mqtt_reconnect_min': 1,    # Minimum delay, in seconds, before reconnecting to the broker (doubles, with jitter, on each failed attempt)
+    'mqtt_reconnect_max': 120,  # Maximum delay, in seconds, before reconnecting to the broker
+    'spool_dir':        '/data/spool',  # Where state messages are stored while the broker is unavailable (None to disable)
+    'spool_max_bytes':  8388608,        # Maximum size of the spool, the oldest messages are evicted beyond this
+    'spool_max_age':    604800,         # Maximum age, in seconds, of spooled messages
+    'spool_rate':       10,             # Maximum rate, in messages per second, at which spooled messages are sent after reconnecting
+    'history_dir':      '/data/history',  # Where the history of readings is kept, memory-mapped (None to disable)
+    'history_days':     28,             # Retention, in days, of raw readings and 1-minute rollups
+    'history_hourly_days': 365,         # Retention, in days, of 1-hour rollups
+    'history_resolution': None,         # Minimum interval, in seconds, between raw readings kept (default: update_period)
+    'history_flush':    600,            # Period, in seconds, between writing new history out to disk
+    'history_requests': 4,              # Maximum number of history requests (on sensors/{id}/history/request) waiting to be answered
     'precision_temperature':            1,
     'precision_pressure':               1,
     'precision_humidity':               1,
@@ -53,54 +109,226 @@ class SensorAgent:
     'precision_co2_equivalents':        0,
     'precision_breath_voc_equivalents': 0,
     'precision_gas_resistance':         0,
-    'precision_gas_percentage':         1
+    'precision_gas_percentage':         1,
+    'precision_dew_point':              1,
+    'precision_absolute_humidity':      1,
+    'precision_heat_index':             1,
+    'precision_sea_level_pressure':     1
   }
 
 
   def __init__(self, user_config):
     self.sensors = []
     self.sensor_types = {}
+    self.sensor_type_of = {}  # sensor -> sensor type (module name) it was enumerated by
     # Merge user config with base config parameters;
     # user_config _must_ override 'mqtt.broker' and 'sensor_types'!
     self.config = { **self.default_config, **user_config }
+    self.cache = EnumerationCache(self.config['enumeration_cache'], info=self.info)
+    self.status = StatusTracker(self.config['status_refresh'])
+    self.deadband = DeadbandFilter(self.config['deadband'], self.max_silence())
+    self.spool = self.open_spool()
+    self.history = self.open_history()
+    self.history_requests = Queue(maxsize=self.config['history_requests'])
+    self.host_name = self.config['host_device'] or socket.gethostname()
+    # The agent's own availability, set to offline by the broker (last will) if the agent goes away
+    self.status_topic = "sensors/{}/status".format(self.host_name)
+    self.batch_topic = "sensors/{}/batch".format(self.host_name)
+    self.batch = Batch()
+    self.events = CoalescingQueue()
+    encodings = list(self.config['state_encodings'] or [])
+    if 'json' not in encodings:
+      # Home Assistant's discovery value_templates read the JSON state topics
+      self.warning("JSON state is always published (on sensors/{id}/state) for Home Assistant, adding json to state_encodings")
+      encodings.insert(0, 'json')
+    try:
+      self.encoders = [ get_encoder(name) for name in encodings ]
+    except (ValueError, ImportError) as error:
+      self.error(str(error))
+    if self.config['smoothing_method'] not in SMOOTHERS:
+      self.error("Unknown smoothing method {}, must be one of: {}".format(self.config['smoothing_method'], ", ".join(SMOOTHERS)))
     # Enumerate available sensors
     if self.config['sensor_types'] is None or len(self.config['sensor_types']) == 0:
       self.error("No sensor types were specified")
     else:
-      for sensor_type in self.config['sensor_types']:
-        self.sensor_types[sensor_type] = importlib.import_module("sensors.{}".format(sensor_type))
-        self.sensors.extend(self.sensor_types[sensor_type].enumerate_sensors())
+      records = self.cache.load(self.config['sensor_types'], self.i2c_addresses())
+      if records:
+        # Only the modules for the cached sensors are needed, and those for
+        # sensor types that probe for sensors in the background (e.g. the
+        # DHT22), to look for sensors added since the cache was written
+        for sensor_type in dict.fromkeys(record['type'] for record in records):
+          self.load_sensor_type(sensor_type)
+        for sensor_type in self.config['sensor_types']:
+          if registry.rescanned(sensor_type) and sensor_type not in self.sensor_types:
+            self.load_sensor_type(sensor_type)
+        self.restore_sensors(records)
+      else:
+        # Only import the modules (and vendor libraries) for sensor types that may be present
+        for sensor_type in self.config['sensor_types']:
+          if registry.present(sensor_type):
+            self.load_sensor_type(sensor_type)
+          else:
+            self.info("No {} sensor found on its bus, skipping".format(sensor_type))
+        self.enumerate_sensors()
+      self.report_i2c_scan()
+      self.info("Sensor module import times: {}".format(", ".join(['{0}={1:.3f}s'.format(k, v) for k,v in registry.import_times().items()])))
     if len(self.sensors) == 0:
       self.error("No sensors found")
+    # Work out how to publish each sensor's readings up front, rather than on every update
+    self.plans = { sensor: self.publish_plan(sensor) for sensor in self.sensors }
+
+  def load_sensor_type(self, sensor_type):
+    module = registry.load(sensor_type)
+    self.sensor_types[sensor_type] = module
+    # Sensor types that need configuring (e.g. the emulator) get the whole config
+    if hasattr(module, 'configure'):
+      module.configure(self.config)
+
+  def enumerate_sensors(self):
+    for sensor_type, module in self.sensor_types.items():
+      for sensor in module.enumerate_sensors():
+        self.sensors.append(sensor)
+        self.sensor_type_of[sensor] = sensor_type
+    self.save_enumeration_cache()
+
+  def restore_sensors(self, records):
+    """Re-create the sensors recorded in the enumeration cache, then validate them in the background."""
+    self.info("Restoring {} sensor(s) from enumeration cache {}".format(len(records), self.cache.path))
+    for record in records:
+      try:
+        sensor = self.sensor_types[record['type']].restore_sensor(record['address'])
+      except Exception as error:
+        # Some drivers have already been started, so the full scan
+        # has to happen on a clean start rather than from here
+        self.cache.invalidate()
+        self.error("Unable to restore {} sensor {} from enumeration cache ({}), cache has been discarded".format(record['type'], record['id'], str(error)))
+      # Use the cached serial number rather than reading it from the device now;
+      # it's checked against the device itself in the background, below
+      sensor.serial_number = record['serial']
+      self.sensors.append(sensor)
+      self.sensor_type_of[sensor] = record['type']
+    # Sensor types that probe in the background (e.g. the DHT22) are told
+    # which sensors were restored, so rescan_sensors() probes for the rest
+    for sensor_type, module in self.sensor_types.items():
+      if hasattr(module, 'restored'):
+        module.restored([ sensor for sensor in self.sensors if self.sensor_type_of[sensor] == sensor_type ])
+    validation = Thread(target=self.validate_sensors, args=(list(zip(self.sensors, records)),))
+    validation.setDaemon(True)
+    validation.start()
+
+  def validate_sensors(self, restored):
+    for sensor, record in restored:
+      try:
+        serial = sensor.read_serial_number()
+      except Exception as error:
+        # The sensor may have been removed or replaced; as when restoring, the
+        # full scan has to happen on a clean start, now the cache is discarded
+        self.cache.invalidate()
+        self.fatal("Unable to validate sensor {} against the enumeration cache ({}), enumeration cache has been discarded".format(record['id'], str(error)))
+      if serial != record['serial']:
+        self.cache.invalidate()
+        self.fatal("Sensor {} at address {} has changed (serial number {} was cached, found {}), enumeration cache has been discarded".format(record['id'], record['address'], record['serial'], serial))
+    self.info("Validated {} sensor(s) against the enumeration cache".format(len(restored)))
+
+  def i2c_addresses(self):
+    """
+    The addresses found by the I2C bus scan, sorted, to check the enumeration
+    cache against; None if no configured sensor type is on the I2C bus, or
+    the bus couldn't be scanned.
+    """
+    if not any(registry.bus(sensor_type) == 'i2c' for sensor_type in self.config['sensor_types']):
+      return None
+    try:
+      addresses = i2c.scan()
+    except ImportError:
+      # No I2C support (e.g. not running on a board)
+      return None
+    return sorted(addresses) if addresses is not None else None
+
+  def report_i2c_scan(self):
+    scanned = i2c.scanned()
+    if scanned is None:
+      return
+    addresses, error = scanned
+    if addresses is None:
+      self.warning("Unable to scan I2C bus {}, all addresses will be probed: {}".format(i2c.DEFAULT_BUS, str(error)))
+    else:
+      self.info("I2C bus {} scan found devices at: {}".format(i2c.DEFAULT_BUS, ", ".join(["{:#x}".format(a) for a in sorted(addresses)]) or "(none)"))
+
+  def save_enumeration_cache(self):
+    self.cache.save(self.config['sensor_types'], [ (self.sensor_type_of[sensor], sensor) for sensor in self.sensors ], self.i2c_addresses())
+
+  def add_sensor(self, sensor, sensor_type):
+    """Add a sensor discovered after startup, e.g. by a background rescan."""
+    self.info("Adding sensor {} ({})".format(sensor.id, sensor_type))
+    self.sensors.append(sensor)
+    self.sensor_type_of[sensor] = sensor_type
+    self.save_enumeration_cache()
+    self.plans[sensor] = self.publish_plan(sensor)
+    if self.event_driven(sensor):
+      sensor.subscribe(lambda: self.events.put(sensor))
+    elif self.scheduler is not None:
+      self.scheduler.add(sensor, self.sensor_period(sensor))
+    # Otherwise, registration happens for all sensors once the broker is connected
+    if self.ha_registered:
+      self.publish_ha_discovery(sensor)
+    if self.attributes_published:
+      self.publish_attributes(sensor)
+    if self.connection is not None and self.history is not None:
+      self.connection.subscribe(self.history_request_topic(sensor))
+
+  def rescan_sensors(self):
+    """Start background rescans for sensor types that defer part of their enumeration."""
+    for sensor_type, module in self.sensor_types.items():
+      if hasattr(module, 'rescan_sensors'):
+        rescan = Thread(target=module.rescan_sensors, args=(lambda sensor, t=sensor_type: self.add_sensor(sensor, t),))
+        rescan.setDaemon(True)
+        rescan.start()
 
   def info(self, message):
     if self.config['verbose'] == True:
       print("INFO: {}".format(message))
 
+  def warning(self, message):
+    print("WARNING: {}".format(message))
+
   def error(self, message):
     sys.exit("ERROR: {}".format(message))
 
+  def fatal(self, message):
+    # sys.exit() only ends the calling thread, this exits the
+    # whole agent (so that its container is restarted) from any thread
+    print("ERROR: {}".format(message), file=sys.stderr, flush=True)
+    os._exit(1)
+
   def mqtt_connect(self):
-    broker = "{}:{}".format(self.config['mqtt_broker'], str(self.config['mqtt_port']))
-    if self.mqtt_broker_reachable():
-      self.info("Connecting to MQTT broker at {} ...".format(broker))
-      self.mqtt_client = mqtt.Client()
-      if self.config['mqtt_username'] is not None and self.config['mqtt_password'] is not None:
-        self.mqtt_client.username_pw_set(self.config['mqtt_username'], self.config['mqtt_password'])
-      self.mqtt_client.on_connect = self.mqtt_on_connect
-      self.mqtt_client.on_disconnect = self.mqtt_on_disconnect
-      try:
-        self.mqtt_client.connect(self.config['mqtt_broker'], int(self.config['mqtt_port']), 30)
-        self.mqtt_client.loop_forever()
-      except:
-        self.info(traceback.format_exc())
-        self.mqtt_client = None
-    else:
-      self.error("Unable to reach MQTT broker at {}".format(broker))
+    if self.config['mqtt_broker'] is None:
+      self.error("No MQTT broker was specified")
+    self.connection = MqttConnection(self.config['mqtt_broker'], self.config['mqtt_port'],
+                                     username=self.config['mqtt_username'],
+                                     password=self.config['mqtt_password'],
+                                     will={ 'topic': self.status_topic, 'payload': "offline", 'qos': 1, 'retain': True },
+                                     on_connect=self.mqtt_on_connect,
+                                     on_disconnect=self.mqtt_on_disconnect,
+                                     on_message=self.mqtt_on_message,
+                                     min_delay=self.config['mqtt_reconnect_min'],
+                                     max_delay=self.config['mqtt_reconnect_max'],
+                                     info=self.info,
+                                     client_factory=self.client_factory)
+    self.mqtt_client = self.connection.client
+    if self.history is not None:
+      for sensor in self.sensors:
+        self.connection.subscribe(self.history_request_topic(sensor))
+    self.connection.start()
 
-  def mqtt_on_connect(self, mqtt_client, userdata, flags, rc):
+  def mqtt_on_connect(self):
     self.mqtt_connected = True
     self.info('MQTT broker connected!')
+    self.publish_message(topic=self.status_topic, payload="online", qos=1, retain=True)
+    # Statuses are retained, but republish them in case the broker lost them
+    for topic, status in self.status.current().items():
+      self.publish_message(topic=topic, payload=status, qos=1, retain=True)
+    self.drain_spool()
     if self.ha_registered is False:
       for sensor in self.sensors:
         self.publish_ha_discovery(sensor)
@@ -110,61 +338,285 @@ class SensorAgent:
         self.publish_attributes(sensor)
       self.attributes_published = True
 
-  def mqtt_on_disconnect(self, mqtt_client, userdata, rc):
+  def mqtt_on_disconnect(self):
     self.mqtt_connected = False
     self.info('MQTT broker disconnected! Will reconnect ...')
-    if rc == 0:
-      self.mqtt_connect()
-    else:
-      time.sleep(5)
-      while not self.mqtt_broker_reachable():
-        time.sleep(10)
-      self.mqtt_client.reconnect()
-
-  def mqtt_broker_reachable(self):
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(5)
+
+  def mqtt_on_message(self, topic, payload):
+    # The only subscriptions are to history requests, sensors/{id}/history/request
+    sensor_id = topic.split('/')[1]
     try:
-      s.connect((self.config['mqtt_broker'], int(self.config['mqtt_port'])))
-      s.close()
-      return True
-    except socket.error:
+      self.queue_history_request(sensor_id, payload)
+    except Exception as error:
+      # Anything else is dropped; raised from here, it would end the MQTT network loop
+      self.info("Unable to handle history request for sensor {}, dropped: {!r}".format(sensor_id, error))
+
+  def queue_history_request(self, sensor_id, payload):
+    request = HistoryRequest(sensor_id)
+    try:
+      request.parse(payload)
+      request.check(self.history)
+      self.history_requests.put_nowait(request)
+    except ValueError as error:
+      self.info("Invalid history request for sensor {}: {}".format(sensor_id, str(error)))
+      self.publish_message(topic=request.response_topic, payload=request.error(str(error), 400), qos=1)
+    except LookupError as error:
+      self.info("Unable to answer history request for sensor {}: {}".format(sensor_id, str(error)))
+      self.publish_message(topic=request.response_topic, payload=request.error(str(error), 404), qos=1)
+    except Full:
+      self.info("Too many history requests waiting, rejected request for sensor {}".format(sensor_id))
+      self.publish_message(topic=request.response_topic, payload=request.error("too many requests waiting, try again later", 429), qos=1)
+
+  def history_request_topic(self, sensor):
+    return "sensors/{}/history/request".format(sensor.id)
+
+  def answer_history_requests(self):
+    while True:
+      request = self.history_requests.get()
+      self.info("Answering history request {} for sensor {} ({} to {}, {})".format(request.request, request.sensor_id, request.start, request.end, request.resolution))
+      try:
+        for page in request.pages(self.history):
+          if not self.publish_response(request.response_topic, page):
+            self.info("Stopped answering history request {} for sensor {}, the response couldn't be sent".format(request.request, request.sensor_id))
+            break
+      except Exception as error:
+        # One bad request mustn't stop the rest from being answered
+        self.info("Unable to answer history request {} for sensor {}, dropped: {!r}".format(request.request, request.sensor_id, error))
+
+  def publish_response(self, topic, payload):
+    # Wait for each page to be sent before making the next, so that pages
+    # aren't queued up in memory faster than the network can take them
+    if not self.mqtt_connected:
+      return False
+    try:
+      result = self.mqtt_client.publish(topic=topic, payload=payload, qos=1)
+      if result.rc != mqtt.MQTT_ERR_SUCCESS:
+        return False
+      result.wait_for_publish(timeout=30)
+    except (ValueError, RuntimeError):
       return False
+    return result.is_published()
 
   def publish_message(self, topic, payload, qos=0, retain=False):
     if self.mqtt_connected:
-      self.mqtt_client.publish(topic=topic, payload=str(payload), qos=qos, retain=retain)
+      if not isinstance(payload, (bytes, bytearray)):
+        payload = str(payload)
+      result = self.mqtt_client.publish(topic=topic, payload=payload, qos=qos, retain=retain)
+      return result.rc == mqtt.MQTT_ERR_SUCCESS
     else:
       self.info("Message publishing is unavailable when the MQTT broker is not connected")
+      return False
+
+  def publish_state(self, topic, payload):
+    # State messages are spooled while the broker is unavailable, rather
+    # than being dropped
+    if self.spool is not None and self.spool.capture(topic, payload, connected=self.mqtt_connected):
+      return
+    self.publish_message(topic=topic, payload=payload)
+
+  def drain_spool(self):
+    if self.spool is None or not self.spool.pending():
+      return
+    if self.drainer is not None and self.drainer.is_alive():
+      return
+    self.info("Sending readings stored while the MQTT broker was unavailable ...")
+    self.drainer = Thread(target=self.run_drain)
+    self.drainer.setDaemon(True)
+    self.drainer.start()
+
+  def run_drain(self):
+    # Stored readings go to <topic>/backfill (e.g. sensors/<id>/state/backfill),
+    # so the backlog doesn't replace the current state of the live topics
+    publish = lambda topic, payload, qos, retain: self.publish_message(topic + BACKFILL_SUFFIX, payload, qos, retain)
+    while not self.spool.drain(publish, self.config['spool_rate'], lambda: self.mqtt_connected):
+      if not self.mqtt_connected:
+        # Drained again once reconnected
+        return
+      # A message couldn't be sent while still connected (e.g. paho's queue
+      # was full), carry on from it shortly rather than leaving the backlog
+      self.info("Unable to send a stored reading, retrying in {}s".format(self.config['mqtt_reconnect_min']))
+      time.sleep(self.config['mqtt_reconnect_min'])
 
 
   def update(self):
+    self.scheduler.run()
+
+  def event_driven(self, sensor):
+    """True if the sensor's samples are published as they arrive (pushed by the sensor), rather than polled."""
+    return self.config['event_publishing'] and hasattr(sensor, 'subscribe')
+
+  def publish_events(self, sensors):
+    """Publish samples from event-driven sensors as they arrive."""
+    for sensor in sensors:
+      sensor.subscribe(lambda sensor=sensor: self.events.put(sensor))
     while True:
-      for sensor in self.sensors:
-        status_topic = "sensors/{}/status".format(sensor.id)
-        try:
-          sensor.update_sensor()
-        except MeasurementError as error:
-          self.publish_message(topic=status_topic, payload="offline")
-          self.info("Failed to update measurements for sensor {} ({}). Sensor status will be set to offline.".format(sensor.id, str(error)))
-        else:
-          self.publish_message(topic=status_topic, payload="online")
-          readings = {}
-          readings['timestamp'] = str(getattr(sensor, 'timestamp'))
-          for measurement in sensor.supported_measurements:
-            # Read the value and optionally correct using offset
-            value = getattr(sensor, measurement['name'])
-            if type(self.config['sensor_offset']) is dict:
-              if sensor.id in self.config['sensor_offset']:
-                value += self.config['sensor_offset'][sensor.id]
-            else:
-              value += self.config['sensor_offset']
-            # Round and format value to string for MQTT message
-            if value is not None:
-              readings[measurement['name']] = round(value, measurement['precision'] if measurement['precision']>0 else None)
-          self.info("Publishing readings for sensor {}: {}".format(sensor.id, ", ".join(['{0}={1}'.format(k, v) for k,v in readings.items()])))
-          self.publish_message(topic="sensors/{}/state".format(sensor.id), payload=json.dumps(readings))
-      time.sleep(self.config['update_period'])
+      sensor = self.events.get(timeout=self.config['update_period'])
+      if sensor is not None:
+        self.poll_sensor(sensor)
+      else:
+        # Nothing has arrived for a whole update period, poll them all so
+        # that a sensor that has stopped producing samples is marked offline
+        for sensor in [ sensor for sensor in self.sensors if self.event_driven(sensor) ]:
+          self.poll_sensor(sensor)
+
+  def sensor_period(self, sensor):
+    """The update period for a sensor: a per-sensor id override, else a per-sensor type override, else the global update_period."""
+    period = self.config['update_period']
+    if type(self.config['sensor_period']) is dict:
+      if sensor.id in self.config['sensor_period']:
+        period = self.config['sensor_period'][sensor.id]
+      elif self.sensor_type_of.get(sensor) in self.config['sensor_period']:
+        period = self.config['sensor_period'][self.sensor_type_of[sensor]]
+    return float(period)
+
+  def publish_plan(self, sensor):
+    return PublishPlan(sensor, self.sensor_offset(sensor), self.sensor_sampler(sensor), self.sensor_smoothers(sensor), self.sensor_derivations(sensor))
+
+  def sensor_derivations(self, sensor):
+    """The derivations of the configured derived measurements that can be made from the sensor's readings."""
+    if not self.config['derived_measurements']:
+      return None
+    altitude = self.config['altitude']
+    if type(altitude) is dict:
+      altitude = altitude.get(sensor.id)
+    try:
+      return derivations(sensor.supported_measurements, self.config['derived_measurements'], altitude)
+    except ValueError as error:
+      self.error(str(error))
+
+  def sensor_smoothers(self, sensor):
+    """A new smoother for each of the sensor's measurements that are also published smoothed."""
+    if type(self.config['smoothing']) is not dict:
+      return None
+    smoother = SMOOTHERS[self.config['smoothing_method']]
+    return { m['name']: smoother(float(self.config['smoothing'][m['name']])) for m in sensor.supported_measurements if m['name'] in self.config['smoothing'] }
+
+  def sensor_sampler(self, sensor):
+    """
+    The oversampler for a sensor (a per-sensor id, else per-sensor type,
+    number of reads), or None to read it once per update. The reads have to
+    fit in half of the sensor's update period.
+    """
+    if type(self.config['oversampling']) is not dict:
+      return None
+    if sensor.id in self.config['oversampling']:
+      samples = int(self.config['oversampling'][sensor.id])
+    elif self.sensor_type_of.get(sensor) in self.config['oversampling']:
+      samples = int(self.config['oversampling'][self.sensor_type_of[sensor]])
+    else:
+      return None
+    if getattr(sensor, 'sequence', None) is not None:
+      # Sensors that number their samples (e.g. the BME680's BSEC output) produce them at their own pace
+      self.info("Sensor {} produces its own samples, it will not be oversampled".format(sensor.id))
+      return None
+    interval = getattr(sensor, 'min_read_interval', 0)
+    if interval > 0:
+      limit = max(int(self.sensor_period(sensor) / 2 / interval), 1)
+      if samples > limit:
+        self.info("Sensor {} can only be read {} times in half of its update period, not {}".format(sensor.id, limit, samples))
+        samples = limit
+    if samples < 2:
+      return None
+    return Oversampler(samples, self.config['outlier_threshold'])
+
+  def open_spool(self):
+    if self.config['spool_dir'] is None:
+      return None
+    try:
+      return Spool(self.config['spool_dir'], max_bytes=self.config['spool_max_bytes'], max_age=self.config['spool_max_age'], info=self.info)
+    except OSError as error:
+      self.info("Unable to open spool directory {}, readings will not be stored while the MQTT broker is unavailable: {}".format(self.config['spool_dir'], str(error)))
+      return None
+
+  def open_history(self):
+    if self.config['history_dir'] is None:
+      return None
+    try:
+      return History(self.config['history_dir'], days=self.config['history_days'],
+                     resolution=self.config['history_resolution'] or self.config['update_period'],
+                     hourly_days=self.config['history_hourly_days'])
+    except OSError as error:
+      self.info("Unable to open history directory {}, readings history will not be kept: {}".format(self.config['history_dir'], str(error)))
+      return None
+
+  def flush_history(self):
+    while True:
+      time.sleep(self.config['history_flush'])
+      try:
+        self.history.flush()
+      except (OSError, ValueError) as error:
+        self.info("Unable to write readings history: {}".format(str(error)))
+
+  def max_silence(self):
+    # Unchanged readings must still be published within valid_time,
+    # otherwise Home Assistant will expire them (expire_after)
+    max_silence = self.config['max_silence']
+    if max_silence is None or max_silence >= self.config['valid_time']:
+      if max_silence is not None:
+        self.info("max_silence ({}s) must be less than valid_time ({}s), using {}s".format(max_silence, self.config['valid_time'], self.config['valid_time'] / 2))
+      max_silence = self.config['valid_time'] / 2
+    return max_silence
+
+  def sensor_offset(self, sensor):
+    """The offset applied to a sensor's readings: a per-sensor id value, or the single value for all sensors."""
+    if type(self.config['sensor_offset']) is dict:
+      return self.config['sensor_offset'].get(sensor.id, 0)
+    return self.config['sensor_offset']
+
+  def poll_sensor(self, sensor):
+    plan = self.plans[sensor]
+    try:
+      readings = plan.read()
+    except MeasurementError as error:
+      self.publish_status(plan.status_topic, "offline")
+      self.deadband.forget(plan.state_topic)
+      self.info("Failed to update measurements for sensor {} ({}). Sensor status will be set to offline.".format(sensor.id, str(error)))
+    else:
+      self.publish_status(plan.status_topic, "online")
+      if readings is None:
+        # No new sample since the last poll
+        return
+      if self.history is not None:
+        # Everything is kept in the history, whether or not it's published
+        self.history.record(sensor.id, readings)
+      if not self.deadband.update(plan.state_topic, readings):
+        return
+      if self.config['batch_mode']:
+        self.batch.update(sensor.id, readings)
+        return
+      if self.config['verbose']:
+        self.info("Publishing readings for sensor {}: {}".format(sensor.id, ", ".join(['{0}={1}'.format(k, v) for k,v in readings.items()])))
+      for encoder in self.encoders:
+        self.publish_state(plan.state_topic + encoder.topic_suffix, encoder.encode(readings))
+
+  def publish_batches(self):
+    period = self.config['batch_period'] or self.config['update_period']
+    deadline = time.monotonic()
+    while True:
+      # Fixed cadence, measured from the previous deadline
+      deadline += period
+      time.sleep(max(deadline - time.monotonic(), 0))
+      readings = self.batch.collect()
+      if readings is not None:
+        self.info("Publishing batched readings for {} sensor(s)".format(len(readings)))
+        for encoder in self.encoders:
+          self.publish_state(self.batch_topic + encoder.topic_suffix, encoder.encode_batch(readings))
+
+
+  def publish_status(self, topic, status):
+    # Availability is retained, so it only needs publishing when it changes (or a refresh is due)
+    if self.status.update(topic, status):
+      self.publish_message(topic=topic, payload=status, qos=1, retain=True)
+
+
+  def report_statistics(self):
+    while True:
+      time.sleep(self.config['stats_period'])
+      for bus_number, stats in i2c.statistics().items():
+        self.info("I2C bus {} statistics: {}".format(bus_number, ", ".join(['{0}={1}'.format(k, v) for k,v in stats.items()])))
+      for sensor in list(self.sensors):
+        if hasattr(sensor, 'metrics'):
+          self.publish_message(topic="sensors/{}/metrics".format(sensor.id), payload=json.dumps(sensor.metrics()))
 
 
   def publish_attributes(self, sensor):
@@ -191,14 +643,20 @@ class SensorAgent:
       device_info['via_device']   = self.config['host_device']
     device_info['name']         = "{} Environmental Sensor".format(sensor.model)
 
-    for measurement in sensor.supported_measurements:
+    for measurement in self.plans[sensor].published_measurements:
       self.info(" ... registering {} measurement".format(measurement['name']))
+      precision = self.config["precision_{}".format(base_measurement(measurement['name']))]
       uid = "{}--{}".format(sensor.id, measurement['name'])
       config_topic = "{}/sensor/{}/{}/config".format(self.config['mqtt_ha_prefix'], sensor.id, uid)
       config_data = {}
       config_data['unique_id']              = uid
-      config_data['state_topic']            = "sensors/{}/state".format(sensor.id)
-      config_data['availability_topic']     = "sensors/{}/status".format(sensor.id)
+      if self.config['batch_mode']:
+        config_data['state_topic']            = self.batch_topic
+      else:
+        config_data['state_topic']            = "sensors/{}/state".format(sensor.id)
+      # Unavailable if either the sensor is offline, or the agent itself has gone away
+      config_data['availability']           = [ { 'topic': "sensors/{}/status".format(sensor.id) }, { 'topic': self.status_topic } ]
+      config_data['availability_mode']      = 'all'
       config_data['json_attributes_topic']  = "sensors/{}/attributes".format(sensor.id) # See publish_attributes() above
       config_data['device']                 = device_info
       if measurement['ha_device_class'] is not None:
@@ -206,15 +664,46 @@ class SensorAgent:
       if measurement['units'] is not None:
         config_data['unit_of_measurement']    = measurement['units']
       config_data['name']                   = "{} ({}) {}".format(sensor.model, sensor.id, measurement['ha_title'])
-      config_data['value_template']         = "{{{{ value_json.{} | round({}) }}}}".format(measurement['name'], self.config["precision_{}".format(measurement['name'])])
+      if self.config['batch_mode']:
+        # Each batch message holds the readings of every sensor, keyed by sensor
+        # id, but a sensor is missing until its first reading; the template
+        # renders empty (which Home Assistant ignores) for batches without it
+        config_data['value_template']         = "{{% if '{0}' in value_json %}}{{{{ value_json['{0}'].{1} | round({2}) }}}}{{% endif %}}".format(sensor.id, measurement['name'], precision)
+      else:
+        config_data['value_template']         = "{{{{ value_json.{} | round({}) }}}}".format(measurement['name'], precision)
       config_data['force_update']           = True
       config_data['expire_after']           = self.config['valid_time']
       self.publish_message(topic=config_topic, payload=json.dumps(config_data, indent=2), qos=1, retain=True)
 
 
   def start(self):
+    events = [ sensor for sensor in self.sensors if self.event_driven(sensor) ]
+    self.scheduler = SensorScheduler([ sensor for sensor in self.sensors if sensor not in events ],
+                                     self.poll_sensor, self.sensor_period,
+                                     max_workers=self.config['max_workers'], info=self.info)
     self.worker = Thread(target=self.update)
     self.worker.setDaemon(True)
     self.worker.start()
+    if self.config['stats_period']:
+      self.reporter = Thread(target=self.report_statistics)
+      self.reporter.setDaemon(True)
+      self.reporter.start()
+    if self.history is not None:
+      self.historian = Thread(target=self.flush_history)
+      self.historian.setDaemon(True)
+      self.historian.start()
+      self.responder = Thread(target=self.answer_history_requests)
+      self.responder.setDaemon(True)
+      self.responder.start()
+    if len(events) > 0:
+      self.publisher = Thread(target=self.publish_events, args=(events,))
+      self.publisher.setDaemon(True)
+      self.publisher.start()
+    if self.config['batch_mode']:
+      self.batcher = Thread(target=self.publish_batches)
+      self.batcher.setDaemon(True)
+      self.batcher.start()
+    self.rescan_sensors()
     self.mqtt_connect()
+    self.worker.join()
     
\ No newline at end of file
@@ -1,15 +1,17 @@
 from datetime import datetime
 from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_ahtx0
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in [ adafruit_ahtx0.AHTX0_I2CADDR_DEFAULT ]:
+    if not i2c.present(i2c_address):
+      continue
     try:
       sensor = aht20(i2c_dev=bus, i2c_addr=i2c_address)
     except (OSError, ValueError, RuntimeError) as error:
@@ -22,12 +24,18 @@ def enumerate_sensors():
   return sensors
 
 
-class aht20(adafruit_ahtx0.AHTx0):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return aht20(i2c_dev=i2c.bus(), i2c_addr=address)
+
+
+class aht20(SensorIdentity, adafruit_ahtx0.AHTx0):
 
   manufacturer = 'ASAIR'
   model = 'AHT20'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 0.08  # Minimum seconds between reads (a measurement takes 80ms)
 
   def __init__(self, i2c_dev, i2c_addr=adafruit_ahtx0.AHTX0_I2CADDR_DEFAULT):
     super().__init__(i2c_bus=i2c_dev, address=i2c_addr)
@@ -51,15 +59,14 @@ class aht20(adafruit_ahtx0.AHTx0):
     return self._humidity
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # Doesn't look like the device supports reading a unique
     # identifier, this cobbles something together from the
     # sensor type and I2C address
     unique_string = ''.join("{}{}{:#x}".format(self.manufacturer, self.model, self.i2c_address).lower().split())
-    return crc32(unique_string.encode())
\ No newline at end of file
+    return crc32(unique_string.encode())
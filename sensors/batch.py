@@ -0,0 +1,28 @@
+import threading
+
+
+class Batch():
+  """
+  Collects the latest readings of every sensor, to be published together
+  as one message per period (rather than one message per sensor). Sensors
+  whose readings haven't been updated since the last batch carry their
+  previous readings (and timestamp) forward, so that every batch is complete.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._readings = {}   # sensor id -> readings
+    self._changed = False
+
+  def update(self, sensor_id, readings):
+    with self._lock:
+      self._readings[sensor_id] = readings
+      self._changed = True
+
+  def collect(self):
+    """The readings for all sensors, keyed by sensor id, or None if nothing has changed since the last batch."""
+    with self._lock:
+      if not self._changed:
+        return None
+      self._changed = False
+      return dict(self._readings)
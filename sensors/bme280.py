@@ -1,16 +1,23 @@
 from typing import Optional
 from datetime import datetime
-from busio import I2C
-from board import SCL, SDA
 from adafruit_bme280 import advanced as adafruit_bme280
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_ADDRESSES = [ 0x76, 0x77 ]
+CHIP_ID_REGISTER = 0xD0
+CHIP_ID = 0x60
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in I2C_ADDRESSES:
+    if not i2c.present(i2c_address):
+      continue
+    # BME280 and BME680 share addresses, check the (cached) chip ID before trying to initialise
+    if i2c.chip_id(i2c_address, CHIP_ID_REGISTER) not in (None, bytes([CHIP_ID])):
+      continue
     try:
       sensor = bme280(i2c_addr=i2c_address, i2c_dev=bus)
     except (OSError, ValueError, RuntimeError) as error:
@@ -23,19 +30,25 @@ def enumerate_sensors():
   return sensors
 
 
-class bme280(adafruit_bme280.Adafruit_BME280_I2C):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return bme280(i2c_addr=address, i2c_dev=i2c.bus())
+
+
+class bme280(SensorIdentity, adafruit_bme280.Adafruit_BME280_I2C):
 
   manufacturer = 'Bosch'
   model = 'BME280'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.PRESSURE,
                             Measurement.HUMIDITY]
-  _serial = None
+  min_read_interval = 0.01  # Minimum seconds between reads (measurement cycle at the default 1x oversampling)
 
   def __init__(self,
                i2c_addr:  Optional[int]     = I2C_ADDRESSES[0],
                i2c_dev:   Optional[object]  = None):
     super().__init__(i2c=i2c_dev, address=i2c_addr)
+    self.i2c_address = i2c_addr
     self._t = None
     self._p = None
     self._h = None
@@ -63,19 +76,12 @@ class bme280(adafruit_bme280.Adafruit_BME280_I2C):
     return self._h
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
-    # Cached property — the serial number is only fetched once,
-    # thereafter the stored property is returned. This avoids
-    # I2C errors causing the serial number to change, which I 
-    # observed with my BME680
-    if self._serial is None:
-      # See: https://community.bosch-sensortec.com/t5/MEMS-sensors-forum/Unique-IDs-in-Bosch-Sensors/m-p/6020/highlight/true#M62
-      i = self._read_register(0x83, 4)
-      self._serial = (((i[3] + (i[2] << 8)) & 0x7fff) << 16) + (i[1] << 8) + i[0]
-    return self._serial
+    # See: https://community.bosch-sensortec.com/t5/MEMS-sensors-forum/Unique-IDs-in-Bosch-Sensors/m-p/6020/highlight/true#M62
+    i = self._read_register(0x83, 4)
+    return (((i[3] + (i[2] << 8)) & 0x7fff) << 16) + (i[1] << 8) + i[0]
@@ -1,23 +1,43 @@
 from typing import Optional
-from datetime import datetime
-from busio import I2C
-from board import SCL, SDA
 # Use the Adafruit BME680 library to ease handling of probing the 
 # chip ID, etc., even though we'll use the Bosch BSEC library later 
 # to get access to the IAQ score output directly from the chip.
 import adafruit_bme680
-import subprocess, io, json, time
-from threading import Thread
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from .bsec import BsecReader, BsecSupervisor, read_version
+from . import i2c
 
 I2C_ADDRESSES = [ 0x76, 0x77 ]
+CHIP_ID_REGISTER = 0xD0
+CHIP_ID = 0x61
+
+# BSEC settings, from the agent's config (see configure())
+_settings = { 'sample_interval': 3, 'checkpoint_period': 3600 }
+
+
+def configure(config):
+  """
+  Take the BSEC settings from the agent's config; called by the agent
+  before enumeration. The sample interval must match the BSEC config in
+  use (3s in LP mode, 300s in ULP mode), as the watchdog restarts the BSEC
+  process when it has produced nothing for ten sample intervals.
+  """
+  _settings['sample_interval'] = float(config.get('bsec_sample_interval') or _settings['sample_interval'])
+  _settings['checkpoint_period'] = float(config.get('bsec_checkpoint_period') or _settings['checkpoint_period'])
+
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in I2C_ADDRESSES:
+    if not i2c.present(i2c_address):
+      continue
+    # BME280 and BME680 share addresses, check the (cached) chip ID before trying to initialise
+    if i2c.chip_id(i2c_address, CHIP_ID_REGISTER) not in (None, bytes([CHIP_ID])):
+      continue
     try:
-      sensor = bme680(i2c_addr=i2c_address, i2c_dev=bus)
+      sensor = bme680(i2c_addr=i2c_address, i2c_dev=bus, **_settings)
     except (OSError, ValueError, RuntimeError) as error:
       # If no device is found, a ValueError is raised;
       # if the chip ID doesn't match (i.e. it's not a BME680), RuntimeError is raised
@@ -28,7 +48,12 @@ def enumerate_sensors():
   return sensors
 
 
-class bme680():
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return bme680(i2c_addr=address, i2c_dev=i2c.bus(), **_settings)
+
+
+class bme680(SensorIdentity):
 
   manufacturer = 'Bosch'
   model = 'BME680'
@@ -43,8 +68,6 @@ class bme680():
                             Measurement.BVOC_EQUIV,
                             Measurement.GAS,
                             Measurement.GAS_PERCENT]
-  bsec_data = None
-  _serial = None
 
   def __init__(self,
                i2c_addr:    Optional[int]     = I2C_ADDRESSES[0],
@@ -52,61 +75,55 @@ class bme680():
                bsec_cmd:    Optional[str]     = '/opt/bsec/bsec_bme680',
                config_file: Optional[str]     = '/data/bsec/bsec_iaq.config',
                state_file:  Optional[str]     = '/data/bsec/bsec_iaq.state',
-               temp_offset: Optional[float]   = 0.0 ):
+               version_file: Optional[str]    = '/data/bsec/version',
+               temp_offset: Optional[float]   = 0.0,
+               sample_interval:   Optional[float] = 3,
+               checkpoint_period: Optional[float] = 3600 ):
     # Call the Adafruit BME680 class init() — if the sensor at the I2C address
     # is not a BME680, an error will be raised.
     self.bme680_i2c = adafruit_bme680.Adafruit_BME680_I2C(i2c=i2c_dev, address=i2c_addr)
+    self.i2c_address = i2c_addr
     self.bsec_command = [ bsec_cmd,
                           "--address",  f'{i2c_addr:#x}',
                           "--config",   config_file,
                           "--state",    state_file,
                           "--offset",   str(temp_offset) ]    
-    # Start the BSEC library process
-    self.bsec_process = Thread(target=self.bsec_capture)
-    self.bsec_process.start()
+    self.bsec_reader = BsecReader(self.supported_measurements)
+    self.sequence = 0
+    # Start the BSEC library process, restarting it if it exits or stalls
+    self.bsec_supervisor = BsecSupervisor(self.bsec_command, self.bsec_reader, state_file,
+                                          sample_interval=sample_interval, checkpoint_period=checkpoint_period,
+                                          version=read_version(version_file))
+    self.bsec_supervisor.start()
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
-    # Cached property — the serial number is only fetched once,
-    # thereafter the stored property is returned. This avoids
-    # I2C errors causing the serial number to change, which I 
-    # observed with my BME680
-    if self._serial is None:
-      # See: https://community.bosch-sensortec.com/t5/MEMS-sensors-forum/Unique-IDs-in-Bosch-Sensors/m-p/6020/highlight/true#M62
-      i = self.bme680_i2c._read(0x83, 4)
-      self._serial = (((i[3] + (i[2] << 8)) & 0x7fff) << 16) + (i[1] << 8) + i[0]
-    return self._serial
+    # See: https://community.bosch-sensortec.com/t5/MEMS-sensors-forum/Unique-IDs-in-Bosch-Sensors/m-p/6020/highlight/true#M62
+    i = self.bme680_i2c._read(0x83, 4)
+    return (((i[3] + (i[2] << 8)) & 0x7fff) << 16) + (i[1] << 8) + i[0]
 
   def update_sensor(self):
-    try:
-      assert type(self.bsec_data) is dict, "Incorrect type: BSEC data is not a dictionary (sensor not ready?)"
-      for m in self.supported_measurements:
-        assert m['name'] in self.bsec_data, "Reading not found: '{}' is not in BSEC data".format(m['name'])
-    except AssertionError as error:
-      raise MeasurementError(str(error))
-    else:
-      for key,value in self.bsec_data.items():
-        try:
-          precision = next(filter(lambda m: m['name'] == key, self.supported_measurements))
-          if precision == 0:
-            setattr(self, key, int(value))
-          else:
-            setattr(self, key, float(value))
-        except StopIteration:
-          pass
-      self.timestamp = datetime.now().isoformat(timespec='seconds')
-
-
-  def bsec_capture(self):
-    bsec = subprocess.Popen(self.bsec_command, stdout=subprocess.PIPE)
-    for line in io.TextIOWrapper(bsec.stdout, encoding="utf-8"):
-      self.bsec_data = json.loads(line.strip())
-    rc = bsec.poll()
-    time.sleep(2)
-    return rc
+    sequence, timestamp, values = self.bsec_reader.sample()
+    if sequence == 0:
+      raise MeasurementError(self.bsec_reader.error)
+    if self.bsec_supervisor.stale():
+      raise MeasurementError("no BSEC output for {}s (restarts: {})".format(self.bsec_supervisor.stale_after, self.bsec_supervisor.restarts))
+    for name, value in zip(self.bsec_reader.names, values):
+      setattr(self, name, value)
+    # The sequence number identifies the BSEC sample, so each is only published once
+    self.sequence = sequence
+    self.timestamp = timestamp
+
+
+  def subscribe(self, listener):
+    """Have listener() called as soon as each BSEC sample arrives, for event-driven publishing."""
+    self.bsec_reader.subscribe(listener)
+
+  def metrics(self):
+    """Health of the BSEC process, published periodically by the agent."""
+    return self.bsec_supervisor.metrics()
@@ -0,0 +1,195 @@
+import os, json, time, random, shutil, threading, subprocess
+from datetime import datetime
+
+
+class BsecReader():
+  """
+  Streaming parser for the output of the BSEC process, which writes one JSON
+  object per line per sample. Lines are read as bytes and decoded straight
+  into a preallocated slot per measurement, converted with a type worked out
+  once from the measurement's precision (int for whole numbers, otherwise
+  float). Each complete sample increments a monotonic sequence number, so
+  consumers can tell a new sample from one they've already seen.
+  """
+
+  def __init__(self, measurements):
+    self.names = [ m['name'] for m in measurements ]
+    self.types = [ int if m['precision'] == 0 else float for m in measurements ]
+    self.slots = [ None ] * len(self.names)
+    self.sequence = 0       # Number of complete samples parsed
+    self.timestamp = None   # When the latest sample was parsed, in ISO 8601 format
+    self.error = "no BSEC data received yet (sensor not ready?)"
+    self.received = None    # Monotonic time the latest complete sample was parsed
+    self.listeners = []     # Called with no arguments after each complete sample
+    self._fields = list(zip(self.names, self.types))
+    self._lock = threading.Lock()
+
+  def read(self, stream):
+    """Parse lines from the (binary) stream until it's closed."""
+    for line in iter(stream.readline, b''):
+      # Only output that parses counts as a sign of life
+      if self.parse(line):
+        self.received = time.monotonic()
+
+  def parse(self, line):
+    """Parse one line of BSEC output, returning True if it held a complete sample."""
+    try:
+      data = json.loads(line)
+      values = [ convert(data[name]) for name, convert in self._fields ]
+    except KeyError as error:
+      self.error = "reading not found: {} is not in BSEC data".format(error)
+      return False
+    except (ValueError, TypeError) as error:
+      self.error = "invalid BSEC data ({})".format(error)
+      return False
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    with self._lock:
+      self.slots[:] = values
+      self.timestamp = timestamp
+      self.sequence += 1
+    for listener in self.listeners:
+      listener()
+    return True
+
+  def subscribe(self, listener):
+    self.listeners.append(listener)
+
+  def sample(self):
+    """The sequence number, timestamp and values (in measurement order) of the latest sample."""
+    with self._lock:
+      return self.sequence, self.timestamp, tuple(self.slots)
+
+
+class BsecSupervisor():
+  """
+  Runs the BSEC process, and keeps it running: if it exits, or stops
+  producing output for stale_samples sample intervals (in which case it's
+  killed), it's restarted with jittered exponential backoff. The backoff is
+  reset once a restarted process produces a sample.
+
+  The BSEC process saves its calibration state to the state file itself;
+  the supervisor copies it to a checkpoint every checkpoint_period seconds
+  (atomically, so a crash mid-copy can't corrupt it), and restores the
+  checkpoint before starting the process if the state file is missing or
+  empty, so that the IAQ calibration (which takes days) survives a crash.
+  The checkpoint is tagged with the BSEC library version, where known, as
+  state saved by one version can't be loaded by another; a checkpoint from
+  another version is never restored.
+  """
+
+  def __init__(self, command, reader, state_file, sample_interval=3, stale_samples=10,
+               checkpoint_period=3600, min_delay=2, max_delay=300, version=None, cwd=None, info=print):
+    self.command = command
+    self.cwd = cwd
+    self.reader = reader
+    self.state_file = state_file
+    self.checkpoint_file = state_file + ('.{}.checkpoint'.format(version) if version else '.checkpoint')
+    self.stale_after = sample_interval * stale_samples
+    self.checkpoint_period = checkpoint_period
+    self.min_delay = min_delay
+    self.max_delay = max_delay
+    self.info = info
+    self.process = None
+    self.started = None     # Monotonic time the process was last started
+    self.restarts = 0       # Number of times the process has been restarted
+    self.attempts = 0       # Consecutive restarts without a sample
+    self._lock = threading.Lock()
+
+  def start(self):
+    for target, name in ((self.run, 'bsec'), (self.watch, 'bsec-watchdog')):
+      thread = threading.Thread(target=target, name=name)
+      thread.setDaemon(True)
+      thread.start()
+
+  def run(self):
+    while True:
+      self.restore_checkpoint()
+      sequence = self.reader.sequence
+      try:
+        process = subprocess.Popen(self.command, stdout=subprocess.PIPE, cwd=self.cwd)
+      except OSError as error:
+        self.info("Failed to start BSEC process {}: {}".format(self.command[0], error))
+      else:
+        with self._lock:
+          self.process = process
+          self.started = time.monotonic()
+        self.reader.read(process.stdout)
+        rc = process.wait()
+        with self._lock:
+          self.process = None
+        self.info("BSEC process exited with return code {}".format(rc))
+      if self.reader.sequence != sequence:
+        self.attempts = 0
+      self.attempts += 1
+      self.restarts += 1
+      time.sleep(self.backoff())
+
+  def backoff(self):
+    """Delay before restarting the process: exponential in the number of consecutive failures, with full jitter."""
+    delay = min(self.max_delay, self.min_delay * 2 ** min(self.attempts - 1, 16))
+    return random.uniform(self.min_delay, max(self.min_delay, delay))
+
+  def watch(self):
+    """Kill the process if it has gone stale, and checkpoint the calibration state periodically."""
+    checkpointed = time.monotonic()
+    while True:
+      time.sleep(self.stale_after / 4)
+      with self._lock:
+        if self.process is not None and self.stale():
+          self.info("BSEC process has produced no output for {}s, restarting".format(self.stale_after))
+          self.process.kill()
+      if time.monotonic() - checkpointed >= self.checkpoint_period:
+        self.checkpoint()
+        checkpointed = time.monotonic()
+
+  def stale(self):
+    """True if the process hasn't produced any output within the staleness timeout."""
+    if self.started is None:
+      return False
+    last = max(self.started, self.reader.received or self.started)
+    return time.monotonic() - last > self.stale_after
+
+  def checkpoint(self):
+    try:
+      if os.path.getsize(self.state_file) == 0:
+        return
+      temporary = self.checkpoint_file + '.tmp'
+      shutil.copyfile(self.state_file, temporary)
+      os.replace(temporary, self.checkpoint_file)
+    except OSError as error:
+      self.info("Failed to checkpoint BSEC state file {}: {}".format(self.state_file, error))
+
+  def restore_checkpoint(self):
+    try:
+      if os.path.exists(self.state_file) and os.path.getsize(self.state_file) > 0:
+        return
+      if not os.path.exists(self.checkpoint_file):
+        return
+      self.info("Restoring BSEC state file {} from checkpoint".format(self.state_file))
+      temporary = self.state_file + '.tmp'
+      shutil.copyfile(self.checkpoint_file, temporary)
+      os.replace(temporary, self.state_file)
+    except OSError as error:
+      self.info("Failed to restore BSEC state file {}: {}".format(self.state_file, error))
+
+  def metrics(self):
+    """Restart count, and the ages (in seconds) of the latest sample and of the saved calibration state."""
+    try:
+      state_age = round(time.time() - os.path.getmtime(self.state_file))
+    except OSError:
+      state_age = None
+    received = self.reader.received
+    return {
+      'bsec_restarts':          self.restarts,
+      'bsec_output_age':        None if received is None else round(time.monotonic() - received),
+      'calibration_state_age':  state_age
+    }
+
+
+def read_version(version_file):
+  """The BSEC library version recorded in the version file, or None if it can't be read."""
+  try:
+    with open(version_file) as f:
+      return f.read().strip() or None
+  except OSError:
+    return None
@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+
+class EnumerationCache():
+  """
+  On-disk record of the sensors discovered by a full enumeration (type,
+  bus address, serial number and id of each), so that on the next start
+  the agent can re-create the same sensors directly, without probing.
+
+  The addresses found by the I2C bus scan are recorded too, so that a
+  cheap scan on the next start shows whether devices have been added or
+  removed since, in which case the cache isn't used.
+  """
+
+  def __init__(self, path, info=print):
+    self.path = Path(path) if path is not None else None
+    self.info = info
+
+  def load(self, sensor_types, i2c_addresses=None):
+    """
+    The cached sensor records, or None if there's no usable cache for these
+    sensor types and the addresses (a sorted list, or None if not scanned)
+    now found on the I2C bus.
+    """
+    if self.path is None:
+      return None
+    try:
+      cache = json.loads(self.path.read_text())
+      if cache['sensor_types'] != list(sensor_types):
+        return None
+      if cache.get('i2c_addresses') != i2c_addresses:
+        self.info("Devices on the I2C bus have changed since enumeration cache {} was written, ignoring it".format(self.path))
+        return None
+      return cache['sensors']
+    except (OSError, ValueError, KeyError, TypeError):
+      return None
+
+  def save(self, sensor_types, sensors, i2c_addresses=None):
+    """Record the sensors, given as (sensor type, sensor) pairs, and the addresses found on the I2C bus."""
+    if self.path is None or not self.path.parent.exists():
+      return
+    cache = {
+      'sensor_types':   list(sensor_types),
+      'i2c_addresses':  i2c_addresses,
+      'sensors':        [ record(sensor_type, sensor) for sensor_type, sensor in sensors ]
+    }
+    try:
+      # Write then rename, so a crash mid-write can't leave a truncated cache behind
+      temp_path = self.path.with_suffix('.tmp')
+      temp_path.write_text(json.dumps(cache, indent=2))
+      temp_path.replace(self.path)
+    except OSError as error:
+      print("Unable to write sensor enumeration cache {}: {}".format(self.path, str(error)))
+
+  def invalidate(self):
+    if self.path is not None:
+      self.path.unlink(missing_ok=True)
+
+
+def record(sensor_type, sensor):
+  return {
+    'type':     sensor_type,
+    'address':  sensor.bus_address,
+    'serial':   sensor.serial_number,
+    'id':       sensor.id
+  }
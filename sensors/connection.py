@@ -0,0 +1,128 @@
+import random, threading
+import paho.mqtt.client as mqtt
+
+
+class MqttConnection():
+  """
+  Manages the connection to the MQTT broker on its own thread, as a small
+  state machine (disconnected -> connecting -> connected -> disconnected ...).
+  Lost or failed connections are retried with jittered exponential backoff,
+  so callers (sensor polling, spooling) never block on the broker, and a
+  fleet of agents doesn't reconnect in lock-step after a broker restart.
+
+  The network loop is driven with paho's loop() from this thread, rather
+  than loop_start(), because loop_start()'s own reconnect logic has no jitter.
+  """
+
+  DISCONNECTED  = 'disconnected'
+  CONNECTING    = 'connecting'
+  CONNECTED     = 'connected'
+
+  def __init__(self, host, port, username=None, password=None, keepalive=30, will=None,
+               on_connect=None, on_disconnect=None, on_message=None, min_delay=1, max_delay=120,
+               info=print, client_factory=mqtt.Client):
+    self.host = host
+    self.port = int(port)
+    self.keepalive = keepalive
+    self.on_connect = on_connect        # Called with no arguments once connected
+    self.on_disconnect = on_disconnect  # Called with no arguments when the connection is lost
+    self.on_message = on_message        # Called with the topic and payload of each message received
+    self.subscriptions = {}             # topic -> QoS, (re)subscribed on each connection
+    self.min_delay = min_delay
+    self.max_delay = max_delay
+    self.info = info
+    self.state = self.DISCONNECTED
+    self.attempts = 0                   # Consecutive failed connection attempts
+    self._stopped = threading.Event()
+    self._thread = None
+    self.client = client_factory()
+    if username is not None and password is not None:
+      self.client.username_pw_set(username, password)
+    if will is not None:
+      self.client.will_set(**will)
+    self.client.on_connect = self._on_connect
+    self.client.on_disconnect = self._on_disconnect
+    self.client.on_message = self._on_message
+
+  @property
+  def connected(self):
+    return self.state == self.CONNECTED
+
+  def start(self):
+    self._thread = threading.Thread(target=self.run, name='mqtt-connection')
+    self._thread.setDaemon(True)
+    self._thread.start()
+
+  def stop(self):
+    self._stopped.set()
+    if self.connected:
+      self.client.disconnect()
+
+  def subscribe(self, topic, qos=1):
+    self.subscriptions[topic] = qos
+    if self.connected:
+      self.client.subscribe(topic, qos)
+
+  def run(self):
+    while not self._stopped.is_set():
+      if self.state == self.DISCONNECTED:
+        if self.attempts > 0 and self._stopped.wait(self.backoff()):
+          break
+        self.connect()
+        continue
+      try:
+        rc = self.client.loop(timeout=1.0)
+      except Exception as error:
+        # Raised by a callback or by paho itself; the connection is dropped
+        # and made again, rather than this thread ending (and with it any
+        # reconnection) while the state still says connected
+        self.failed("network loop exception: {!r}".format(error))
+        continue
+      if rc != mqtt.MQTT_ERR_SUCCESS and self.state != self.DISCONNECTED:
+        # The connection failed (or was lost) without the disconnect callback
+        self.failed("network loop error: {}".format(mqtt.error_string(rc)))
+
+  def connect(self):
+    self.state = self.CONNECTING
+    self.info("Connecting to MQTT broker at {}:{} ...".format(self.host, self.port))
+    try:
+      self.client.connect(self.host, self.port, self.keepalive)
+    except (OSError, ValueError) as error:
+      self.failed(str(error))
+
+  def failed(self, reason):
+    was_connected = self.connected
+    self.state = self.DISCONNECTED
+    self.attempts += 1
+    self.info("MQTT broker connection failed ({}), attempt {}".format(reason, self.attempts))
+    if was_connected and self.on_disconnect is not None:
+      self.on_disconnect()
+
+  def backoff(self):
+    """Delay before the next connection attempt: exponential in the number of failed attempts, with full jitter."""
+    delay = min(self.max_delay, self.min_delay * 2 ** min(self.attempts - 1, 16))
+    return random.uniform(self.min_delay, max(self.min_delay, delay))
+
+  def _on_connect(self, client, userdata, flags, rc):
+    if rc != 0:
+      self.failed(mqtt.connack_string(rc))
+      return
+    self.state = self.CONNECTED
+    self.attempts = 0
+    # A clean session is used, so subscriptions don't survive a reconnection
+    for topic, qos in list(self.subscriptions.items()):
+      self.client.subscribe(topic, qos)
+    if self.on_connect is not None:
+      self.on_connect()
+
+  def _on_disconnect(self, client, userdata, rc):
+    if self.state == self.DISCONNECTED:
+      return
+    if self._stopped.is_set():
+      self.state = self.DISCONNECTED
+      return
+    self.failed("disconnected, rc={}".format(rc))
+
+  def _on_message(self, client, userdata, message):
+    if self.on_message is not None:
+      self.on_message(message.topic, message.payload)
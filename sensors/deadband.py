@@ -0,0 +1,60 @@
+import time, threading
+from sensors.publish import METADATA, base_measurement
+
+
+class DeadbandFilter():
+  """
+  Report-by-exception for sensor readings: a reading is only published if a
+  measurement has moved by at least its deadband since the readings were last
+  published, or if nothing has been published for max_silence seconds (so
+  that consumers, e.g. Home Assistant's expire_after, still see a heartbeat).
+  Smoothed measurements use the deadband of the measurement they're made
+  from. Only the measurements with a deadband decide whether a sensor's
+  readings have moved; the rest (e.g. humidity, with only temperature
+  configured, or a derived dew point) are published along with them, and
+  at least every max_silence. A sensor none of whose measurements has a
+  deadband (e.g. a light sensor, with only temperature configured) is
+  published on any change.
+  """
+
+  def __init__(self, deadbands=None, max_silence=None):
+    self.deadbands = deadbands or {}  # measurement name -> threshold
+    self.max_silence = max_silence
+    self._lock = threading.Lock()
+    self._published = {}              # topic -> (readings, monotonic time published)
+
+  def update(self, topic, readings):
+    """Return True if the readings should be published on the topic (recording them as published)."""
+    if len(self.deadbands) == 0:
+      return True
+    now = time.monotonic()
+    with self._lock:
+      published = self._published.get(topic)
+      if published is None or self.due(published[1], now) or self.moved(published[0], readings):
+        self._published[topic] = (readings, now)
+        return True
+      return False
+
+  def forget(self, topic):
+    """Forget the readings published on the topic (e.g. when the sensor goes offline), so the next are published."""
+    with self._lock:
+      self._published.pop(topic, None)
+
+  def due(self, published_at, now):
+    return self.max_silence is not None and now - published_at >= self.max_silence
+
+  def moved(self, previous, readings):
+    if previous.keys() != readings.keys():
+      return True
+    # Smoothed measurements share the deadband of the measurement they're made from
+    thresholds = { name: self.deadbands.get(name, self.deadbands.get(base_measurement(name))) for name in readings if name not in METADATA }
+    deciding = { name: threshold for name, threshold in thresholds.items() if threshold is not None }
+    if len(deciding) == 0:
+      deciding = dict.fromkeys(thresholds, 0)
+    for name, threshold in deciding.items():
+      if threshold:
+        if abs(readings[name] - previous[name]) >= threshold:
+          return True
+      elif readings[name] != previous[name]:
+        return True
+    return False
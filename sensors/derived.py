@@ -0,0 +1,85 @@
+"""
+Measurements derived on the device from a sensor's own (offset corrected)
+readings, so that every consumer doesn't have to work them out for itself,
+e.g. with Home Assistant template sensors. A sensor gets the derived
+measurements whose inputs it measures; sea-level pressure also needs the
+altitude of the sensor.
+"""
+import math
+from functools import partial
+from sensors.measurements import Measurement
+
+# Magnus formula coefficients, for saturation vapour pressure over water (-45 to 60°C)
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12     # °C
+MAGNUS_E0 = 6.112     # hPa, at 0°C
+
+
+def dew_point(temperature, humidity):
+  """Dew point (°C) from temperature (°C) and relative humidity (%)."""
+  if humidity <= 0:
+    return None
+  gamma = math.log(humidity / 100) + MAGNUS_A * temperature / (MAGNUS_B + temperature)
+  return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+def absolute_humidity(temperature, humidity):
+  """Absolute humidity (g/m³) from temperature (°C) and relative humidity (%)."""
+  vapour_pressure = MAGNUS_E0 * math.exp(MAGNUS_A * temperature / (MAGNUS_B + temperature)) * humidity / 100
+  # Ideal gas law, with the specific gas constant of water vapour (461.5 J/(kg·K)), in g/m³ from hPa
+  return 100000 * vapour_pressure / (461.5 * (temperature + 273.15))
+
+
+def heat_index(temperature, humidity):
+  """
+  Heat index (°C) from temperature (°C) and relative humidity (%), as
+  calculated by the US National Weather Service: Steadman's simple formula,
+  or the Rothfusz regression (with its adjustments) from 80°F up.
+  """
+  t = temperature * 9 / 5 + 32
+  index = 0.5 * (t + 61 + (t - 68) * 1.2 + humidity * 0.094)
+  if (index + t) / 2 >= 80:
+    index = (-42.379 + 2.04901523 * t + 10.14333127 * humidity - 0.22475541 * t * humidity
+             - 0.00683783 * t * t - 0.05481717 * humidity * humidity + 0.00122874 * t * t * humidity
+             + 0.00085282 * t * humidity * humidity - 0.00000199 * t * t * humidity * humidity)
+    if humidity < 13 and 80 <= t <= 112:
+      index -= (13 - humidity) / 4 * math.sqrt((17 - abs(t - 95)) / 17)
+    elif humidity > 85 and 80 <= t <= 87:
+      index += (humidity - 85) / 10 * (87 - t) / 5
+  return (index - 32) * 5 / 9
+
+
+def sea_level_pressure(pressure, temperature, altitude):
+  """Pressure (hPa) reduced to sea level, from the pressure (hPa) and temperature (°C) at altitude (m)."""
+  return pressure * (1 - 0.0065 * altitude / (temperature + 0.0065 * altitude + 273.15)) ** -5.257
+
+
+# Derived measurement name -> (measurement, function, names of the measurements it's derived from)
+DERIVED = {
+  'dew_point':          (Measurement.DEW_POINT,          dew_point,          ('temperature', 'humidity')),
+  'absolute_humidity':  (Measurement.ABSOLUTE_HUMIDITY,  absolute_humidity,  ('temperature', 'humidity')),
+  'heat_index':         (Measurement.HEAT_INDEX,         heat_index,         ('temperature', 'humidity')),
+  'sea_level_pressure': (Measurement.SEA_LEVEL_PRESSURE, sea_level_pressure, ('pressure', 'temperature'))
+}
+
+
+def derivations(measurements, names, altitude=None):
+  """
+  The derivations, as (measurement, function, input names) tuples, of the
+  named derived measurements that can be made from a sensor's measurements
+  (sea-level pressure only if the altitude, in metres, is known).
+  """
+  available = set(measurement['name'] for measurement in measurements)
+  result = []
+  for name in names:
+    if name not in DERIVED:
+      raise ValueError("Unknown derived measurement {}, must be one of: {}".format(name, ", ".join(DERIVED)))
+    measurement, function, inputs = DERIVED[name]
+    if not available.issuperset(inputs):
+      continue
+    if function is sea_level_pressure:
+      if altitude is None:
+        continue
+      function = partial(sea_level_pressure, altitude=float(altitude))
+    result.append((measurement, function, inputs))
+  return result
@@ -1,10 +1,13 @@
 from datetime import datetime
 from zlib import crc32
 from retrying import retry
-import re
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+import re, json
 import board
 import adafruit_dht
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
 
 # All the generally available GPIO pins on a Raspberry Pi
 GPIO_PINS = [
@@ -23,21 +26,109 @@ GPIO_PINS = [
 ]
 
 
+PROBE_BUDGET  = 20  # Overall time, in seconds, allowed for probing GPIO pins at startup
+HINT_FILE     = Path('/data/dht22_pins.json')  # GPIO pins on which sensors were found last time
+
+# The driver bit-bangs the pin, timing each bit in Python, so probes running
+# side by side (competing for the GIL) corrupt each other's reads; pins are
+# probed one at a time, on this one thread, at startup and in the background
+_prober   = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dht22-probe')
+_found    = []  # Sensors found so far, used to update the hint file
+_deferred = []  # (gpio, future) pairs for pins not probed within the startup budget (future is None if not yet queued)
+
+
 def enumerate_sensors():
-  sensors = []
-  for gpio in GPIO_PINS:
-    try:
-      sensor = dht22(pin=gpio)
-      # To see if there is a DHT device on the GPIO pin, try taking a measurement
-      try_measurement(sensor)
-    except RuntimeError as error:
-      print("Error initialising DHT sensor on GPIO pin {}: {}".format(gpio.id, str(error)))
-    else:
-      print("Found DHT22 sensor with ID {:x} on GPIO pin {}".format(sensor.serial_number, sensor.pin.id))
-      sensors.append(sensor)
+  """
+  Probe the GPIO pins in the background, one at a time, within an overall
+  time budget. If the hint file lists pins on which sensors were found last
+  time, only those pins are probed here, the rest are left for
+  rescan_sensors() to probe in the background; pins not probed within the
+  budget are also deferred (those already queued are left to finish).
+  """
+  global _deferred
+  hinted = read_hints()
+  if len(hinted) > 0:
+    pins = [ gpio for gpio in GPIO_PINS if gpio.id in hinted ]
+    remaining = [ gpio for gpio in GPIO_PINS if gpio.id not in hinted ]
+  else:
+    pins = GPIO_PINS
+    remaining = []
+  futures = [ (gpio, _prober.submit(probe_pin, gpio)) for gpio in pins ]
+  done, not_done = wait([ future for _, future in futures ], timeout=PROBE_BUDGET)
+  sensors = [ future.result() for _, future in futures if future in done and future.result() is not None ]
+  _found.extend(sensors)
+  _deferred = [ (gpio, future) for gpio, future in futures if future in not_done ] + [ (gpio, None) for gpio in remaining ]
+  if len(not_done) > 0:
+    print("DHT sensor probes on GPIO pin(s) {} did not complete within {}s, deferring".format(", ".join([str(gpio.id) for gpio, future in futures if future in not_done]), PROBE_BUDGET))
+  if len(_deferred) == 0:
+    write_hints(_found)
   return sensors
 
 
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  pin = next(gpio for gpio in GPIO_PINS if gpio.id == address)
+  return dht22(pin=pin)
+
+
+def restored(sensors):
+  """
+  Called, in place of enumerate_sensors(), with the sensors re-created from
+  the enumeration cache: the other pins are left for rescan_sensors() to
+  probe in the background, so that sensors added since are still found.
+  """
+  global _deferred
+  _found.extend(sensors)
+  pins = set(sensor.pin.id for sensor in sensors)
+  _deferred = [ (gpio, None) for gpio in GPIO_PINS if gpio.id not in pins ]
+
+
+def rescan_sensors(on_found):
+  """Probe the pins deferred by enumerate_sensors(), calling on_found(sensor) for each sensor found."""
+  global _deferred
+  deferred, _deferred = _deferred, []
+  if len(deferred) == 0:
+    return
+  # Queued behind any probes left over from startup, so still one at a time
+  futures = [ future if future is not None else _prober.submit(probe_pin, gpio) for gpio, future in deferred ]
+  for future in futures:
+    sensor = future.result()
+    if sensor is not None:
+      _found.append(sensor)
+      on_found(sensor)
+  write_hints(_found)
+
+
+def probe_pin(gpio):
+  """Return a DHT22 sensor for the GPIO pin, or None if there is no sensor on that pin."""
+  try:
+    sensor = dht22(pin=gpio)
+    # To see if there is a DHT device on the GPIO pin, try taking a measurement
+    try_measurement(sensor)
+  except RuntimeError as error:
+    print("Error initialising DHT sensor on GPIO pin {}: {}".format(gpio.id, str(error)))
+    return None
+  else:
+    print("Found DHT22 sensor with ID {:x} on GPIO pin {}".format(sensor.serial_number, sensor.pin.id))
+    return sensor
+
+
+def read_hints():
+  """The GPIO pin numbers on which sensors were found last time (empty if unknown)."""
+  try:
+    return set(json.loads(HINT_FILE.read_text()))
+  except (OSError, ValueError, TypeError):
+    return set()
+
+
+def write_hints(sensors):
+  if HINT_FILE.parent.exists():
+    try:
+      HINT_FILE.write_text(json.dumps(sorted([ sensor.pin.id for sensor in sensors ])))
+    except OSError as error:
+      print("Unable to record DHT sensor GPIO pins in {}: {}".format(HINT_FILE, str(error)))
+
+
 def retry_if_try_again(error):
   """Return True if the error string is recommending to try again, False otherwise (likely a true failure)."""
   if "Try again" in str(error):
@@ -59,12 +150,14 @@ def try_measurement(sensor):
   return True
 
 
-class dht22(adafruit_dht.DHT22):
+class dht22(SensorIdentity, adafruit_dht.DHT22):
 
   manufacturer = 'ASAIR'
   model = 'DHT22'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 2.1  # Minimum seconds between reads (adafruit_dht returns its cached reading unless more than 2s have passed)
+  quantization = { 'temperature': 0.1, 'humidity': 0.1 }  # Smallest step between readings
 
   def __init__(self, pin=board.D24):
     self.pin = pin
@@ -87,12 +180,11 @@ class dht22(adafruit_dht.DHT22):
     return self._humidity
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.pin.id
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # Doesn't look like the device supports reading a unique
     # identifier, this cobbles something together from the
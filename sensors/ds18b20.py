@@ -3,6 +3,7 @@ from datetime import datetime
 from w1thermsensor import W1ThermSensor, Sensor
 from w1thermsensor import NoSensorFoundError, SensorNotReadyError, ResetValueError
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
 
 def enumerate_sensors():
   sensors = []
@@ -17,11 +18,19 @@ def enumerate_sensors():
   return sensors
 
 
-class ds18b20():
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return ds18b20(address)
+
+
+class ds18b20(SensorIdentity):
 
   manufacturer = 'MAXIM'
   model = 'DS18B20'
   supported_measurements = [Measurement.TEMPERATURE]
+  min_read_interval = 0.75  # Minimum seconds between reads (12-bit temperature conversion time)
+  quantization = { 'temperature': 0.0625 }  # Smallest step between readings (12-bit resolution)
+  serial_format = '012x'  # 48-bit 1-Wire ROM serial
 
   def __init__(self, sensor_id: Optional[str] = None):
     self._w1therm = W1ThermSensor(sensor_type=Sensor.DS18B20, sensor_id=sensor_id)
@@ -37,12 +46,11 @@ class ds18b20():
       self.timestamp = datetime.now().isoformat(timespec='seconds')
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:012x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self._id
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     serial = int(self._id, 16)
     return serial
@@ -0,0 +1,461 @@
+"""
+Emulated sensor hardware, so that the agent can be run (and load-tested,
+with hundreds of virtual sensors) off-device, without any of the hardware
+libraries. Selected with the 'emulator' sensor type, and configured with
+the 'emulator' config entry: the number of each type of device to emulate,
+e.g. { 'bme280': 100, 'ds18b20': 20 }, plus the settings in DEFAULT_CONFIG.
+
+- I2C devices (BME280, SHT31-D, TMP117, MCP9808) are emulated as register
+  maps on emulated buses, installed in the shared I2C registry, so their
+  reads go through the same locking and statistics as real bus traffic.
+  The register maps are simplified: the chip ID is at the real chip's
+  register, but each measurement is a 16-bit raw value in one register.
+- DS18B20s are read from an emulated 1-Wire sysfs tree, in the layout the
+  w1_therm kernel driver presents, which is updated in the background.
+- BME680s run this module as their BSEC process (python -m sensors.emulator
+  bsec), which writes scripted BSEC output, under the same supervisor as
+  the real BSEC process.
+
+Emulated devices have 'EMU-' model names, so their ids can't clash with
+real sensors publishing to the same broker.
+"""
+import os, sys, json, time, random, struct, argparse, tempfile, threading
+from pathlib import Path
+from zlib import crc32
+from datetime import datetime
+from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from .bsec import BsecReader, BsecSupervisor
+from . import i2c
+
+DEFAULT_CONFIG = {
+  'bme280':       1,      # Number of devices of each type to emulate
+  'sht31d':       1,
+  'tmp117':       1,
+  'mcp9808':      0,
+  'ds18b20':      1,
+  'bme680':       1,
+  'seed':         0,      # Seed for serial numbers and readings, so runs are repeatable
+  'directory':    None,   # Where the 1-Wire tree and BSEC state are kept (default: a temporary directory)
+  'w1_interval':  5,      # Period, in seconds, between DS18B20 temperature updates in the 1-Wire tree
+  'bsec_interval': 3,     # BSEC sample interval, in seconds (3 is LP mode, 300 is ULP mode)
+  'failure_rate': 0.0     # Probability of an I2C measurement read failing, to exercise error handling
+}
+
+FIRST_BUS = 10            # Emulated buses are numbered from here, clear of the board's own
+FIRST_ADDRESS = 0x08
+DEVICES_PER_BUS = 0x70    # Addresses 0x08-0x77, the 7-bit addresses that aren't reserved
+SERIAL_REGISTER = 0xF8    # 4 bytes, big-endian
+
+# Emulated I2C devices: the chip ID register and value (None if the device
+# has none), and each measurement's register, scale (units per count of the
+# raw value), baseline value and random walk step
+I2C_DEVICES = {
+  'bme280':   { 'manufacturer': 'Bosch', 'model': 'EMU-BME280', 'chip_id': (0xD0, 0x60), 'measurements': [
+                  (Measurement.TEMPERATURE, 0xFA, 0.01,  21.0,   0.05),
+                  (Measurement.PRESSURE,    0xF7, 0.1,   1013.0, 0.1),
+                  (Measurement.HUMIDITY,    0xFD, 0.01,  45.0,   0.2) ] },
+  'bme680':   { 'manufacturer': 'Bosch', 'model': 'EMU-BME680', 'chip_id': (0xD0, 0x61), 'measurements': [] },
+  'sht31d':   { 'manufacturer': 'Sensirion', 'model': 'EMU-SHT31-D', 'chip_id': None, 'measurements': [
+                  (Measurement.TEMPERATURE, 0x00, 0.01,  21.0,   0.05),
+                  (Measurement.HUMIDITY,    0x02, 0.01,  45.0,   0.2) ] },
+  'tmp117':   { 'manufacturer': 'Texas Instruments', 'model': 'EMU-TMP117', 'chip_id': (0x0F, 0x01), 'measurements': [
+                  (Measurement.TEMPERATURE, 0x00, 0.0078125, 21.0, 0.02) ] },
+  'mcp9808':  { 'manufacturer': 'Microchip', 'model': 'EMU-MCP9808', 'chip_id': (0x07, 0x04), 'measurements': [
+                  (Measurement.TEMPERATURE, 0x05, 0.0625, 21.0,  0.05) ] }
+}
+
+BSEC_MEASUREMENTS = [Measurement.TEMPERATURE,
+                     Measurement.PRESSURE,
+                     Measurement.HUMIDITY,
+                     Measurement.AIR_QUALITY,
+                     Measurement.IAQ_ACCURACY,
+                     Measurement.STATIC_AIR_QUALITY,
+                     Measurement.S_IAQ_ACCURACY,
+                     Measurement.CO2_EQUIV,
+                     Measurement.BVOC_EQUIV,
+                     Measurement.GAS,
+                     Measurement.GAS_PERCENT]
+
+_lock     = threading.Lock()
+_config   = {}
+_buses    = {}    # bus number -> EmulatedI2C
+_handles  = {}    # bus number -> shared handle from the I2C registry
+_layout   = {}    # (bus number, address) -> device type
+_w1       = []    # Single-entry list holding the EmulatedW1Tree, once created
+
+
+def configure(config):
+  """Set up the emulated hardware from the agent's config; called by the agent before enumeration."""
+  with _lock:
+    if _config:
+      return
+    _config.update(DEFAULT_CONFIG)
+    _config.update(config.get('emulator') or {})
+    if _config['directory'] is None:
+      _config['directory'] = tempfile.mkdtemp(prefix='sensors-emulator-')
+    rng = random.Random(_config['seed'])
+    slot = 0
+    for device_type in I2C_DEVICES:
+      for _ in range(int(_config[device_type])):
+        bus_number, address = FIRST_BUS + slot // DEVICES_PER_BUS, FIRST_ADDRESS + slot % DEVICES_PER_BUS
+        if bus_number not in _buses:
+          _buses[bus_number] = EmulatedI2C(_config['failure_rate'], rng.random())
+          _handles[bus_number] = i2c.install(_buses[bus_number], bus_number)
+        _buses[bus_number].add(address, EmulatedDevice(I2C_DEVICES[device_type], serial(device_type, bus_number, address), rng.random()))
+        _layout[(bus_number, address)] = device_type
+        slot += 1
+    if int(_config['ds18b20']) > 0:
+      tree = EmulatedW1Tree(Path(_config['directory']).joinpath('w1'), int(_config['ds18b20']), rng.random())
+      tree.start(_config['w1_interval'])
+      _w1.append(tree)
+
+
+def serial(device_type, bus_number, address):
+  """A repeatable 32-bit serial number for an emulated I2C device."""
+  return crc32("{}:{}:{}:{}".format(device_type, bus_number, address, _config['seed']).encode('ascii'))
+
+
+def enumerate_sensors():
+  if not _config:
+    configure({})
+  sensors = []
+  for bus_number, handle in sorted(_handles.items()):
+    for address in handle.scan():
+      try:
+        sensor = create(_layout[(bus_number, address)], bus_number, address)
+        serial_number = sensor.serial_number
+      except OSError as error:
+        print("Error initialising emulated sensor at I2C bus {} address {:#x}: {}".format(bus_number, address, str(error)))
+        continue
+      print("Found {} sensor with ID {:x} at emulated I2C bus {} address {:#x}".format(sensor.model, sensor.serial_number, bus_number, address))
+      sensors.append(sensor)
+  if len(_w1) > 0:
+    for device_id in _w1[0].devices():
+      sensor = EmulatedDS18B20(_w1[0], device_id)
+      print("Found {} sensor with ID {:012x}".format(sensor.model, sensor.serial_number))
+      sensors.append(sensor)
+  return sensors
+
+
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache (which includes its device type)."""
+  if not _config:
+    configure({})
+  device_type, _, location = address.partition(':')
+  if device_type == 'ds18b20':
+    if len(_w1) == 0 or location not in _w1[0].devices():
+      raise OSError("No emulated DS18B20 with ID {}".format(location))
+    return EmulatedDS18B20(_w1[0], location)
+  bus_number, i2c_address = (int(part, 0) for part in location.split(':'))
+  if _layout.get((bus_number, i2c_address)) != device_type:
+    raise OSError("No emulated {} at I2C bus {} address {:#x}".format(device_type, bus_number, i2c_address))
+  return create(device_type, bus_number, i2c_address)
+
+
+def create(device_type, bus_number, address):
+  if device_type == 'bme680':
+    return EmulatedBME680(_handles[bus_number], bus_number, address)
+  return EmulatedI2CSensor(device_type, _handles[bus_number], bus_number, address)
+
+
+class EmulatedDevice():
+  """
+  The register map of an emulated I2C device. Its measurements follow a
+  mean-reverting random walk, advanced each time a measurement register is
+  read, as if the device had made a new conversion.
+  """
+
+  def __init__(self, spec, serial_number, seed):
+    self.registers = bytearray(256)
+    self.pointer = 0
+    self._rng = random.Random(seed)
+    if spec['chip_id'] is not None:
+      register, value = spec['chip_id']
+      self.registers[register] = value
+    self.registers[SERIAL_REGISTER:SERIAL_REGISTER + 4] = struct.pack('>I', serial_number)
+    # register -> [ scale, baseline, step, current value ]
+    self.channels = { register: [ scale, baseline, step, baseline ] for _, register, scale, baseline, step in spec['measurements'] }
+
+  def read(self, register, length):
+    channel = self.channels.get(register)
+    if channel is not None:
+      scale, baseline, step, value = channel
+      value += (baseline - value) * 0.05 + self._rng.gauss(0, step)
+      channel[3] = value
+      self.registers[register:register + 2] = struct.pack('>h', max(-32768, min(32767, round(value / scale))))
+    return bytes(self.registers[register:register + length])
+
+
+class EmulatedI2C():
+  """
+  An emulated bus, compatible with the parts of busio.I2C that the agent
+  uses. Locking is left to the shared handle from the I2C registry.
+  """
+
+  def __init__(self, failure_rate=0.0, seed=None):
+    self.devices = {}   # address -> EmulatedDevice
+    self.failure_rate = failure_rate
+    self._rng = random.Random(seed)
+
+  def add(self, address, device):
+    self.devices[address] = device
+
+  def try_lock(self):
+    return True
+
+  def unlock(self):
+    pass
+
+  def scan(self):
+    return sorted(self.devices)
+
+  def writeto(self, address, buffer, *, start=0, end=None):
+    device = self._device(address)
+    device.pointer = buffer[start]
+
+  def readfrom_into(self, address, buffer, *, start=0, end=None):
+    device = self._device(address)
+    if device.pointer in device.channels and self.failure_rate > 0 and self._rng.random() < self.failure_rate:
+      raise OSError(121, "Remote I/O error")
+    end = len(buffer) if end is None else end
+    buffer[start:end] = device.read(device.pointer, end - start)
+
+  def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0, out_end=None, in_start=0, in_end=None):
+    self.writeto(address, buffer_out, start=out_start, end=out_end)
+    self.readfrom_into(address, buffer_in, start=in_start, end=in_end)
+
+  def _device(self, address):
+    device = self.devices.get(address)
+    if device is None:
+      raise OSError(121, "Remote I/O error")
+    return device
+
+
+class EmulatedI2CSensor(SensorIdentity):
+
+  def __init__(self, device_type, bus, bus_number, address):
+    spec = I2C_DEVICES[device_type]
+    self.device_type = device_type
+    self.manufacturer = spec['manufacturer']
+    self.model = spec['model']
+    self.supported_measurements = [ measurement for measurement, *_ in spec['measurements'] ]
+    self._channels = [ (measurement['name'], register, scale) for measurement, register, scale, *_ in spec['measurements'] ]
+    self._bus = bus
+    self.bus_number = bus_number
+    self.i2c_address = address
+    for name, _, _ in self._channels:
+      setattr(self, name, None)
+
+  @property
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return "{}:{}:{:#x}".format(self.device_type, self.bus_number, self.i2c_address)
+
+  def read_serial_number(self):
+    """The hardware identifier (serial number) for the device."""
+    return struct.unpack('>I', self._read(SERIAL_REGISTER, 4))[0]
+
+  def update_sensor(self):
+    try:
+      values = [ (name, struct.unpack('>h', self._read(register, 2))[0] * scale) for name, register, scale in self._channels ]
+    except OSError as error:
+      raise MeasurementError(str(error))
+    for name, value in values:
+      setattr(self, name, value)
+    self.timestamp = datetime.now().isoformat(timespec='seconds')
+
+  def _read(self, register, length):
+    result = bytearray(length)
+    while not self._bus.try_lock():
+      pass
+    try:
+      self._bus.writeto_then_readfrom(self.i2c_address, bytes([register]), result)
+    finally:
+      self._bus.unlock()
+    return bytes(result)
+
+
+class EmulatedW1Tree():
+  """
+  An emulated 1-Wire sysfs tree, laid out as the w1_therm kernel driver
+  presents it: a directory per device (named for its family code, 28 for
+  the DS18B20, and ROM serial), holding a w1_slave file with the scratchpad,
+  its CRC check, and the temperature in thousandths of a degree.
+  """
+
+  def __init__(self, directory, count, seed):
+    self.directory = Path(directory)
+    self.directory.mkdir(parents=True, exist_ok=True)
+    self._rng = random.Random(seed)
+    self._temperatures = { "{:012x}".format(self._rng.getrandbits(48)): 21.0 for _ in range(count) }
+    self.update()
+
+  def devices(self):
+    return list(self._temperatures)
+
+  def path(self, device_id):
+    return self.directory.joinpath("28-{}".format(device_id), 'w1_slave')
+
+  def start(self, interval):
+    thread = threading.Thread(target=self.run, args=(interval,), name='emulator-w1')
+    thread.setDaemon(True)
+    thread.start()
+
+  def run(self, interval):
+    while True:
+      time.sleep(interval)
+      self.update()
+
+  def update(self):
+    for device_id, temperature in self._temperatures.items():
+      temperature += (21.0 - temperature) * 0.05 + self._rng.gauss(0, 0.05)
+      self._temperatures[device_id] = temperature
+      path = self.path(device_id)
+      path.parent.mkdir(exist_ok=True)
+      # The DS18B20 reports in 1/16ths of a degree, as a 16-bit two's complement value
+      counts = round(temperature * 16)
+      raw = counts & 0xffff
+      scratchpad = "{:02x} {:02x} 4b 46 7f ff 0c 10 1c".format(raw & 0xff, raw >> 8)
+      temporary = path.with_suffix('.tmp')
+      temporary.write_text("{} : crc=1c YES\n{} t={}\n".format(scratchpad, scratchpad, counts * 625 // 10))
+      os.replace(temporary, path)
+
+
+class EmulatedDS18B20(SensorIdentity):
+
+  manufacturer = 'MAXIM'
+  model = 'EMU-DS18B20'
+  supported_measurements = [Measurement.TEMPERATURE]
+  serial_format = '012x'  # 48-bit 1-Wire ROM serial
+
+  def __init__(self, tree, device_id):
+    self._path = tree.path(device_id)
+    self._id = device_id
+    self.temperature = None
+
+  @property
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return "ds18b20:{}".format(self._id)
+
+  def read_serial_number(self):
+    """The hardware identifier (serial number) for the device."""
+    return int(self._id, 16)
+
+  def update_sensor(self):
+    try:
+      lines = self._path.read_text().splitlines()
+    except OSError as error:
+      raise MeasurementError(str(error))
+    if len(lines) < 2 or not lines[0].endswith('YES') or 't=' not in lines[1]:
+      raise MeasurementError("Sensor {} is not ready to read".format(self._id))
+    self.temperature = int(lines[1].rsplit('t=', 1)[1]) / 1000.0
+    self.timestamp = datetime.now().isoformat(timespec='seconds')
+
+
+class EmulatedBME680(SensorIdentity):
+
+  manufacturer = 'Bosch'
+  model = 'EMU-BME680'
+  supported_measurements = BSEC_MEASUREMENTS
+
+  def __init__(self, bus, bus_number, address):
+    self._bus = bus
+    self.bus_number = bus_number
+    self.i2c_address = address
+    directory = Path(_config['directory']).joinpath('bsec')
+    directory.mkdir(parents=True, exist_ok=True)
+    state_file = str(directory.joinpath("{}-{:x}.state".format(bus_number, address)))
+    command = [ sys.executable, '-m', 'sensors.emulator', 'bsec',
+                '--interval', str(_config['bsec_interval']),
+                '--seed',     str(serial('bme680', bus_number, address)),
+                '--state',    state_file ]
+    self.bsec_reader = BsecReader(self.supported_measurements)
+    self.sequence = 0
+    self.bsec_supervisor = BsecSupervisor(command, self.bsec_reader, state_file,
+                                          sample_interval=_config['bsec_interval'],
+                                          cwd=str(Path(__file__).resolve().parent.parent))
+    self.bsec_supervisor.start()
+
+  @property
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return "bme680:{}:{:#x}".format(self.bus_number, self.i2c_address)
+
+  def read_serial_number(self):
+    """The hardware identifier (serial number) for the device."""
+    result = bytearray(4)
+    while not self._bus.try_lock():
+      pass
+    try:
+      self._bus.writeto_then_readfrom(self.i2c_address, bytes([SERIAL_REGISTER]), result)
+    finally:
+      self._bus.unlock()
+    return struct.unpack('>I', result)[0]
+
+  def update_sensor(self):
+    sequence, timestamp, values = self.bsec_reader.sample()
+    if sequence == 0:
+      raise MeasurementError(self.bsec_reader.error)
+    if self.bsec_supervisor.stale():
+      raise MeasurementError("no BSEC output for {}s (restarts: {})".format(self.bsec_supervisor.stale_after, self.bsec_supervisor.restarts))
+    for name, value in zip(self.bsec_reader.names, values):
+      setattr(self, name, value)
+    self.sequence = sequence
+    self.timestamp = timestamp
+
+  def subscribe(self, listener):
+    """Have listener() called as soon as each BSEC sample arrives, for event-driven publishing."""
+    self.bsec_reader.subscribe(listener)
+
+  def metrics(self):
+    """Health of the BSEC process, published periodically by the agent."""
+    return self.bsec_supervisor.metrics()
+
+
+def bsec(interval, seed, state_file):
+  """Write scripted BSEC output: one JSON sample per interval, with IAQ calibration settling over time."""
+  rng = random.Random(seed)
+  temperature, pressure, humidity, iaq = 21.0, 1013.0, 45.0, 50.0
+  samples = 0
+  while True:
+    temperature += (21.0 - temperature) * 0.05 + rng.gauss(0, 0.05)
+    pressure += (1013.0 - pressure) * 0.05 + rng.gauss(0, 0.1)
+    humidity += (45.0 - humidity) * 0.05 + rng.gauss(0, 0.2)
+    iaq = max(0.0, iaq + (50.0 - iaq) * 0.05 + rng.gauss(0, 2))
+    accuracy = min(3, samples // 100)
+    sample = {
+      'temperature':            temperature,
+      'pressure':               pressure,
+      'humidity':               humidity,
+      'iaq':                    iaq,
+      'iaq_accuracy':           accuracy,
+      's_iaq':                  iaq * 1.1,
+      's_iaq_accuracy':         accuracy,
+      'co2_equivalents':        500 + iaq * 4,
+      'breath_voc_equivalents': 0.5 + iaq / 100,
+      'gas_resistance':         100000 - iaq * 200,
+      'gas_percentage':         max(0.0, 100 - iaq / 5)
+    }
+    try:
+      print(json.dumps(sample), flush=True)
+    except BrokenPipeError:
+      return
+    samples += 1
+    if samples % 100 == 0:
+      # The real BSEC process saves its calibration state periodically, too
+      with open(state_file, 'w') as file:
+        file.write(json.dumps({ 'samples': samples }))
+    time.sleep(interval)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Emulated hardware processes")
+  subcommands = parser.add_subparsers(dest='command', required=True)
+  bsec_parser = subcommands.add_parser('bsec', help="write scripted BSEC output, in place of /opt/bsec/bsec_bme680")
+  bsec_parser.add_argument('--interval', type=float, default=3)
+  bsec_parser.add_argument('--seed', type=int, default=0)
+  bsec_parser.add_argument('--state', default=os.devnull)
+  options = parser.parse_args()
+  bsec(options.interval, options.seed, options.state)
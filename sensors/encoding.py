@@ -0,0 +1,99 @@
+"""
+Payload encoders for sensor state messages.
+
+JSON is always available, and is what Home Assistant consumes (on the
+sensors/{id}/state topic). The compact binary encodings are for machine
+consumers (published on sensors/{id}/state/{encoding}), and replace the
+ISO 8601 timestamp string with an integer epoch timestamp.
+"""
+import json
+from datetime import datetime
+try:
+  import cbor2
+except ImportError:
+  cbor2 = None
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+
+def epoch_timestamps(readings):
+  """A copy of the readings with the ISO 8601 timestamp replaced by integer seconds since the epoch."""
+  encoded = dict(readings)
+  if 'timestamp' in encoded:
+    encoded['timestamp'] = int(datetime.fromisoformat(encoded['timestamp']).timestamp())
+  return encoded
+
+
+class Encoder():
+  """Base class for encoders, which implement dumps(), and prepare() if the readings need converting first."""
+
+  name = None
+  topic_suffix = None
+
+  def prepare(self, readings):
+    return readings
+
+  def encode(self, readings):
+    """Encode one sensor's readings."""
+    return self.dumps(self.prepare(readings))
+
+  def encode_batch(self, batch):
+    """Encode a batch of readings, keyed by sensor id."""
+    return self.dumps({ sensor_id: self.prepare(readings) for sensor_id, readings in batch.items() })
+
+
+class JsonEncoder(Encoder):
+
+  name = 'json'
+  topic_suffix = ''   # Published on the plain state topic, for Home Assistant
+
+  def dumps(self, data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+class CborEncoder(Encoder):
+
+  name = 'cbor'
+  topic_suffix = '/cbor'
+
+  def __init__(self):
+    if cbor2 is None:
+      raise ImportError("The cbor2 package is required for CBOR encoding")
+
+  def prepare(self, readings):
+    return epoch_timestamps(readings)
+
+  def dumps(self, data):
+    return cbor2.dumps(data)
+
+
+class MsgpackEncoder(Encoder):
+
+  name = 'msgpack'
+  topic_suffix = '/msgpack'
+
+  def __init__(self):
+    if msgpack is None:
+      raise ImportError("The msgpack package is required for MessagePack encoding")
+
+  def prepare(self, readings):
+    return epoch_timestamps(readings)
+
+  def dumps(self, data):
+    return msgpack.packb(data, use_bin_type=True)
+
+
+ENCODERS = {
+  JsonEncoder.name:     JsonEncoder,
+  CborEncoder.name:     CborEncoder,
+  MsgpackEncoder.name:  MsgpackEncoder
+}
+
+
+def get_encoder(name):
+  """An encoder instance for the named encoding; raises ValueError if it's unknown, ImportError if unavailable."""
+  if name not in ENCODERS:
+    raise ValueError("Unknown state encoding '{}' (choose from: {})".format(name, ", ".join(ENCODERS)))
+  return ENCODERS[name]()
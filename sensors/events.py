@@ -0,0 +1,32 @@
+import threading
+from collections import OrderedDict
+
+
+class CoalescingQueue():
+  """
+  Queue of sensors with new samples to publish, for sensors that push their
+  samples as they arrive rather than being polled. Each sensor is queued at
+  most once: if it already has a sample waiting (i.e. the publisher is
+  behind), the new one is coalesced into it, and the publisher only reads
+  the latest sample, rather than working through a backlog of old ones.
+  """
+
+  def __init__(self):
+    self._condition = threading.Condition()
+    self._pending = OrderedDict()   # sensor -> None, in the order they were queued
+    self.coalesced = 0              # Number of samples superseded before they were published
+
+  def put(self, sensor):
+    with self._condition:
+      if sensor in self._pending:
+        self.coalesced += 1
+        return
+      self._pending[sensor] = None
+      self._condition.notify()
+
+  def get(self, timeout=None):
+    """The next sensor with a new sample, or None if there isn't one within the timeout."""
+    with self._condition:
+      if not self._condition.wait_for(lambda: len(self._pending) > 0, timeout):
+        return None
+      return self._pending.popitem(last=False)[0]
@@ -0,0 +1,212 @@
+import re, mmap, struct, threading
+from pathlib import Path
+from datetime import datetime
+from sensors.publish import METADATA, base_measurement
+
+RAW, MINUTE, HOUR = 'raw', '1m', '1h'
+LEVELS = [ RAW, MINUTE, HOUR ]
+BUCKETS = { MINUTE: 60, HOUR: 3600 }
+NAME = re.compile(r'[a-z0-9_]+')  # Measurement names, which name the history files
+
+MAGIC = b'SRH1'
+HEADER = struct.Struct('<4s9I')   # magic, then the capacity, head and count of each ring
+HEADER_SIZE = 64
+RECORDS = {
+  RAW:    struct.Struct('<If'),     # epoch, value
+  MINUTE: struct.Struct('<IfffI'),  # bucket start epoch, min, max, mean, count
+  HOUR:   struct.Struct('<IfffI')
+}
+
+
+class History():
+  """
+  On-device history of sensor readings: a ring buffer per sensor
+  measurement of raw values (one per resolution seconds, on average), plus
+  ring buffers of 1-minute and 1-hour rollups (min, max, mean and count of
+  every reading), memory-mapped to a file per measurement in the history
+  directory, so that they survive restarts.
+
+  Records are fixed width (a 32-bit epoch and 32-bit floats), and new
+  records are held in memory and copied into the mapped files every
+  flush_period seconds, so each page of a file is written out to the SD
+  card once per flush, rather than being dirtied (and written back) with
+  every reading. Up to flush_period seconds of history (and the rollup
+  buckets in progress) are lost if the agent exits uncleanly.
+  """
+
+  def __init__(self, directory, days=28, resolution=30, hourly_days=365):
+    self.directory = Path(directory)
+    self.directory.mkdir(parents=True, exist_ok=True)
+    self.resolution = resolution
+    self.capacities = {
+      RAW:    int(days * 86400 / resolution),
+      MINUTE: int(days * 1440),
+      HOUR:   int(hourly_days * 24)
+    }
+    self._lock = threading.Lock()
+    self._rings = {}  # (sensor id, measurement name) -> RingFile
+
+  def record(self, sensor_id, readings):
+    """
+    Add a sensor's readings (as published, with an ISO 8601 timestamp) to its
+    history. Smoothed measurements aren't kept, the rollups serve instead.
+    """
+    epoch = int(datetime.fromisoformat(readings['timestamp']).timestamp())
+    for name, value in readings.items():
+      if name not in METADATA and base_measurement(name) == name:
+        self.ring(sensor_id, name).add(epoch, float(value))
+
+  def ring(self, sensor_id, name, create=True):
+    """The ring file for a sensor measurement, or None if there's none and create is False."""
+    if not NAME.fullmatch(name):
+      # The name is a path component, e.g. '../other/temperature' mustn't reach another file
+      raise ValueError("invalid measurement name: {}".format(name[:64]))
+    key = (sensor_id, name)
+    with self._lock:
+      if key not in self._rings:
+        path = self.directory.joinpath(sensor_id, "{}.hist".format(name))
+        if not create and not path.exists():
+          return None
+        self._rings[key] = RingFile(path, self.capacities, self.resolution)
+      return self._rings[key]
+
+  def measurements(self, sensor_id):
+    """The names of the measurements with history for the sensor."""
+    return sorted(path.stem for path in self.directory.joinpath(sensor_id).glob('*.hist'))
+
+  def query(self, sensor_id, name, start, end, level=RAW):
+    """
+    Iterate over the records of a sensor measurement between the start and
+    end epochs (inclusive), oldest first: (epoch, value) tuples for raw
+    history, or (epoch, min, max, mean, count) tuples for rollups.
+    """
+    ring = self.ring(sensor_id, name, create=False)
+    if ring is None:
+      return iter(())
+    return ring.query(level, start, end)
+
+  def flush(self):
+    with self._lock:
+      rings = list(self._rings.values())
+    for ring in rings:
+      ring.flush()
+
+
+class RingFile():
+  """The ring buffers for one sensor measurement, in a memory-mapped file."""
+
+  def __init__(self, path, capacities, resolution):
+    self.path = path
+    self.resolution = resolution
+    self.capacities = [ capacities[level] for level in LEVELS ]
+    self.offsets = {}
+    offset = HEADER_SIZE
+    for level, capacity in zip(LEVELS, self.capacities):
+      self.offsets[level] = offset
+      offset += capacity * RECORDS[level].size
+    self._lock = threading.Lock()
+    self._pending = { level: [] for level in LEVELS }   # Records not yet copied into the file
+    self._buckets = {}              # level -> [ start, min, max, sum, count ] of the rollup bucket in progress
+    self._next_raw = 0              # Epoch the next raw value is due, on a grid of resolution seconds
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    self._open(offset)
+
+  def _open(self, size):
+    with open(self.path, 'a+b') as file:
+      file.seek(0)
+      header = file.read(HEADER.size)
+      if len(header) == HEADER.size and struct.unpack_from('<4s3I', header)[0] == MAGIC and list(struct.unpack_from('<3I', header, 4)) != self.capacities:
+        # The retention settings have changed, so the layout no longer fits
+        print("History file {} has different capacities, starting it afresh".format(self.path))
+        file.truncate(0)
+      if file.seek(0, 2) < size:
+        file.truncate(size)
+    self._file = open(self.path, 'r+b')
+    self._map = mmap.mmap(self._file.fileno(), size)
+    fields = HEADER.unpack_from(self._map, 0)
+    if fields[0] != MAGIC:
+      fields = (MAGIC, *self.capacities, 0, 0, 0, 0, 0, 0)
+      HEADER.pack_into(self._map, 0, *fields)
+    self.heads = dict(zip(LEVELS, fields[4:7]))
+    self.counts = dict(zip(LEVELS, fields[7:10]))
+    if self.counts[RAW] > 0:
+      self._next_raw = self._read(RAW, self.counts[RAW] - 1, self.heads[RAW], self.counts[RAW])[0] + self.resolution
+
+  def add(self, epoch, value):
+    with self._lock:
+      # Readings are taken every update period, with jitter, and their epochs
+      # truncated to whole seconds, so one that's up to half the resolution
+      # early is kept; the next is then due on the grid, keeping the average
+      # interval at the resolution (or after at least half the resolution,
+      # after a gap)
+      if epoch >= self._next_raw - self.resolution / 2:
+        self._pending[RAW].append((epoch, value))
+        self._next_raw = max(self._next_raw + self.resolution, epoch + self.resolution)
+      for level, length in BUCKETS.items():
+        start = epoch - epoch % length
+        bucket = self._buckets.get(level)
+        if bucket is not None and bucket[0] != start:
+          self._pending[level].append(rollup(bucket))
+          bucket = None
+        if bucket is None:
+          self._buckets[level] = [ start, value, value, value, 1 ]
+        else:
+          bucket[1] = min(bucket[1], value)
+          bucket[2] = max(bucket[2], value)
+          bucket[3] += value
+          bucket[4] += 1
+
+  def flush(self):
+    with self._lock:
+      if not any(self._pending.values()):
+        return
+      for level, capacity in zip(LEVELS, self.capacities):
+        record = RECORDS[level]
+        for fields in self._pending[level]:
+          record.pack_into(self._map, self.offsets[level] + self.heads[level] * record.size, *fields)
+          self.heads[level] = (self.heads[level] + 1) % capacity
+          self.counts[level] = min(self.counts[level] + 1, capacity)
+        self._pending[level] = []
+      HEADER.pack_into(self._map, 0, MAGIC, *self.capacities,
+                       *[ self.heads[level] for level in LEVELS ], *[ self.counts[level] for level in LEVELS ])
+      self._map.flush()
+
+  def _read(self, level, index, head, count):
+    """The index'th oldest record at the level in the file, given the ring's head and count."""
+    capacity = self.capacities[LEVELS.index(level)]
+    slot = (head - count + index) % capacity
+    record = RECORDS[level]
+    return record.unpack_from(self._map, self.offsets[level] + slot * record.size)
+
+  def query(self, level, start, end):
+    with self._lock:
+      head, count = self.heads[level], self.counts[level]
+      pending = list(self._pending[level])
+    # Records are in time order, so binary search for the first in range
+    low, high = 0, count
+    while low < high:
+      middle = (low + high) // 2
+      if self._read(level, middle, head, count)[0] < start:
+        low = middle + 1
+      else:
+        high = middle
+    previous = 0
+    for index in range(low, count):
+      fields = self._read(level, index, head, count)
+      if fields[0] > end:
+        return
+      if fields[0] < previous:
+        # Overwritten by a flush while reading, the rest is newer than the range so far
+        break
+      previous = fields[0]
+      yield fields
+    for fields in pending:
+      if fields[0] > end:
+        return
+      if fields[0] >= max(start, previous + 1):
+        yield fields
+
+
+def rollup(bucket):
+  start, minimum, maximum, total, count = bucket
+  return (start, minimum, maximum, total / count, count)
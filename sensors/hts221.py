@@ -2,14 +2,16 @@ from typing import Optional
 from datetime import datetime
 from waiting import wait, TimeoutExpired
 from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_hts221
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
+  if not i2c.present(adafruit_hts221._HTS221_DEFAULT_ADDRESS):
+    return sensors
   try:
     sensor = hts221(i2c_dev=bus, i2c_addr=adafruit_hts221._HTS221_DEFAULT_ADDRESS)
   except (OSError, ValueError, RuntimeError) as error:
@@ -22,12 +24,18 @@ def enumerate_sensors():
   return sensors
 
 
-class hts221(adafruit_hts221.HTS221):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return hts221(i2c_dev=i2c.bus(), i2c_addr=address)
+
+
+class hts221(SensorIdentity, adafruit_hts221.HTS221):
 
   manufacturer = 'STMicroelectronics'
   model = 'HTS221'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 1.0  # Minimum seconds between reads (new readings at the default 1Hz output data rate)
 
   def __init__(self, i2c_dev=None,
                i2c_addr: Optional[int] = adafruit_hts221._HTS221_DEFAULT_ADDRESS):
@@ -58,12 +66,11 @@ class hts221(adafruit_hts221.HTS221):
     return self._humidity
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # Doesn't look like the device supports reading a unique
     # identifier, this cobbles something together from the
@@ -1,18 +1,24 @@
 from datetime import datetime
-from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_htu21d
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_ADDRESS = 0x40
 _ID1_CMD = bytearray([0xFA, 0x0F])
 _ID2_CMD = bytearray([0xFC, 0xC9])
+_ID2_DEVICE_ID = 0x32  # First byte of the 2nd half of the serial number, common to all HTU21D sensors
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in [ I2C_ADDRESS ]:
+    if not i2c.present(i2c_address):
+      continue
+    # Si70xx and MS8607 sensors also live at 0x40, check the (cached) device ID before trying to initialise
+    device_id = i2c.chip_id(i2c_address, _ID2_CMD, 6)
+    if device_id is not None and device_id[0] != _ID2_DEVICE_ID:
+      continue
     try:
       sensor = htu21d(i2c_dev=bus, i2c_addr=i2c_address)
     except (OSError, ValueError, RuntimeError) as error:
@@ -26,6 +32,11 @@ def enumerate_sensors():
   return sensors
 
 
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return htu21d(i2c_dev=i2c.bus(), i2c_addr=address)
+
+
 def _convert_to_integer(bytes_to_convert):
     """Use bitwise operators to convert the bytes into integers."""
     integer = None
@@ -38,15 +49,17 @@ def _convert_to_integer(bytes_to_convert):
     return integer
 
 
-class htu21d(adafruit_htu21d.HTU21D):
+class htu21d(SensorIdentity, adafruit_htu21d.HTU21D):
 
   manufacturer = 'Measurement Specialities'
   model = 'HTU21D'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 0.066  # Minimum seconds between reads (14-bit temperature plus 12-bit humidity conversion times)
 
   def __init__(self, i2c_dev, i2c_addr=I2C_ADDRESS):
     super().__init__(i2c_bus=i2c_dev, address=i2c_addr)
+    self.i2c_address = i2c_addr
     self._temperature = None
     self._humidity = None
 
@@ -70,12 +83,11 @@ class htu21d(adafruit_htu21d.HTU21D):
     return self._humidity
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # The registers and format of the serial number is the same as for Si7021
     # See also: getSerialNumber() from https://www.espruino.com/modules/HTU21D.js
@@ -90,7 +102,7 @@ class htu21d(adafruit_htu21d.HTU21D):
     with self.i2c_device as i2c:
         i2c.write_then_readinto(data, id2)
     # Common/fixed bytes for all HTU21D sensors
-    if id2[3] != 0x48 or id2[4] != 0x54 or id1[0] != 0x00 or id2[0] != 0x32:
+    if id2[3] != 0x48 or id2[4] != 0x54 or id1[0] != 0x00 or id2[0] != _ID2_DEVICE_ID:
       raise RuntimeError("Invalid serial number")
     # The unique serial number part is formed from the remaining bytes
     serial = (id1[2] << 24) | (id1[4] << 16) | (id1[6] << 8) | id2[1]
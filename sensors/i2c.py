@@ -0,0 +1,227 @@
+"""
+Shared I2C bus registry.
+
+Hands out a single bus object per physical I2C bus to all of the sensor
+modules (rather than each module opening its own), serialises transactions
+on the bus with a lock so that sensors can be polled concurrently, and
+records the time spent in each transaction so that bus utilisation can be
+monitored. It also performs a one-shot scan of the bus, so that sensor
+modules only attempt to initialise drivers at addresses where a device
+actually responded, and caches chip ID reads so that drivers which share
+candidate addresses don't each re-probe the same device.
+"""
+import time, threading
+from contextlib import contextmanager
+
+DEFAULT_BUS = 1   # The I2C bus on the Raspberry Pi GPIO header (board.SCL, board.SDA)
+
+_registry_lock = threading.Lock()
+_locks  = {}  # bus number -> RLock, shared by every handle on that bus
+_stats  = {}  # bus number -> BusStatistics
+_busio  = {}  # bus number -> SharedI2C
+_smbus  = {}  # bus number -> SharedSMBus
+
+_probe_lock = threading.Lock()
+_scan       = []  # Single-entry list holding the (addresses, error) scan result once made (addresses None if the bus couldn't be scanned)
+_chip_ids   = {}  # (address, command, length) -> bytes read (None if the read failed)
+
+
+class BusStatistics():
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.started = time.monotonic()
+    self.transactions = 0
+    self.busy_time = 0.0
+    self.max_time = 0.0
+
+  def record(self, duration):
+    with self._lock:
+      self.transactions += 1
+      self.busy_time += duration
+      self.max_time = max(self.max_time, duration)
+
+  def summary(self):
+    with self._lock:
+      elapsed = time.monotonic() - self.started
+      return {
+        'transactions':     self.transactions,
+        'busy_time':        round(self.busy_time, 3),
+        'max_transaction':  round(self.max_time, 6),
+        'mean_transaction': round(self.busy_time / self.transactions, 6) if self.transactions > 0 else None,
+        'utilisation':      round(self.busy_time / elapsed, 4) if elapsed > 0 else None
+      }
+
+
+class SharedI2C():
+  """
+  Wraps a busio.I2C object, so that the bus lock that the Adafruit drivers
+  take for each transaction (via try_lock/unlock) is a real, thread-safe lock
+  shared with every other handle on the same physical bus.
+  """
+
+  def __init__(self, bus, lock, stats):
+    self._bus = bus
+    self._lock = lock
+    self._stats = stats
+    self._locked_at = None
+
+  def try_lock(self):
+    # Wait briefly rather than failing straight away, otherwise the
+    # drivers just spin on try_lock() while another transaction completes
+    if not self._lock.acquire(timeout=0.01):
+      return False
+    if not self._bus.try_lock():
+      self._lock.release()
+      return False
+    self._locked_at = time.monotonic()
+    return True
+
+  def unlock(self):
+    self._stats.record(time.monotonic() - self._locked_at)
+    self._bus.unlock()
+    self._lock.release()
+
+  def __getattr__(self, name):
+    return getattr(self._bus, name)
+
+
+class SharedSMBus():
+  """Wraps an SMBus object, performing each call as a locked transaction on the shared bus."""
+
+  def __init__(self, bus, lock, stats):
+    self._bus = bus
+    self._lock = lock
+    self._stats = stats
+
+  def __getattr__(self, name):
+    attr = getattr(self._bus, name)
+    if not callable(attr):
+      return attr
+    def locked_call(*args, **kwargs):
+      with transaction(self._lock, self._stats):
+        return attr(*args, **kwargs)
+    return locked_call
+
+
+@contextmanager
+def transaction(lock, stats):
+  with lock:
+    start = time.monotonic()
+    try:
+      yield
+    finally:
+      stats.record(time.monotonic() - start)
+
+
+def _bus_state(bus_number):
+  # Caller must hold _registry_lock
+  if bus_number not in _locks:
+    _locks[bus_number] = threading.RLock()
+    _stats[bus_number] = BusStatistics()
+  return _locks[bus_number], _stats[bus_number]
+
+
+def bus():
+  """The shared busio.I2C bus for the board's default I2C pins."""
+  with _registry_lock:
+    if DEFAULT_BUS not in _busio:
+      from busio import I2C
+      from board import SCL, SDA
+      lock, stats = _bus_state(DEFAULT_BUS)
+      _busio[DEFAULT_BUS] = SharedI2C(I2C(SCL, SDA), lock, stats)
+    return _busio[DEFAULT_BUS]
+
+
+def install(i2c, bus_number=DEFAULT_BUS):
+  """
+  Use the given busio.I2C-compatible object as the bus with that number
+  (e.g. an emulated bus), in place of opening the board's own. Returns the
+  shared handle, which is also what bus() returns for the default bus.
+  """
+  with _registry_lock:
+    lock, stats = _bus_state(bus_number)
+    _busio[bus_number] = SharedI2C(i2c, lock, stats)
+    return _busio[bus_number]
+
+
+def smbus(bus_number=DEFAULT_BUS):
+  """The shared SMBus handle for the given bus number."""
+  with _registry_lock:
+    if bus_number not in _smbus:
+      try:
+        from smbus import SMBus
+      except ImportError:
+        from smbus2 import SMBus
+      lock, stats = _bus_state(bus_number)
+      _smbus[bus_number] = SharedSMBus(SMBus(bus_number), lock, stats)
+    return _smbus[bus_number]
+
+
+def statistics():
+  """Transaction timing statistics for each bus in use, keyed by bus number."""
+  with _registry_lock:
+    return { bus_number: stats.summary() for bus_number, stats in _stats.items() }
+
+
+@contextmanager
+def _locked(shared_bus):
+  while not shared_bus.try_lock():
+    pass
+  try:
+    yield shared_bus
+  finally:
+    shared_bus.unlock()
+
+
+def scan():
+  """
+  The set of addresses that responded on the default bus. The bus is
+  only scanned once, on first use; None is returned if it can't be scanned.
+  """
+  with _probe_lock:
+    if len(_scan) == 0:
+      try:
+        with _locked(bus()) as shared_bus:
+          _scan.append((frozenset(shared_bus.scan()), None))
+      except (OSError, RuntimeError) as error:
+        _scan.append((None, error))
+    return _scan[0][0]
+
+
+def scanned():
+  """
+  The (addresses, error) result of the bus scan, for reporting: addresses
+  is None, and error the reason, if the bus couldn't be scanned. None if
+  the bus hasn't been scanned (e.g. no I2C sensor types are configured).
+  """
+  with _probe_lock:
+    return _scan[0] if len(_scan) > 0 else None
+
+
+def present(address):
+  """True if a device responded at the address in the bus scan (or if the bus couldn't be scanned)."""
+  addresses = scan()
+  return addresses is None or address in addresses
+
+
+def chip_id(address, command, length=1):
+  """
+  Write the command (a register address, or command bytes) to the device at
+  the address and read back length bytes, e.g. a chip ID register. The result
+  is cached, so several drivers can check the same device for a match without
+  re-probing it. Returns None if the device didn't respond.
+  """
+  command = bytes([command]) if isinstance(command, int) else bytes(command)
+  key = (address, command, length)
+  with _probe_lock:
+    if key not in _chip_ids:
+      result = bytearray(length)
+      try:
+        with _locked(bus()) as shared_bus:
+          shared_bus.writeto_then_readfrom(address, command, result)
+      except (OSError, RuntimeError):
+        _chip_ids[key] = None
+      else:
+        _chip_ids[key] = bytes(result)
+    return _chip_ids[key]
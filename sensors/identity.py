@@ -0,0 +1,36 @@
+class SensorIdentity():
+  """
+  Mixin for sensor drivers, providing the serial number and id of the device.
+  Both are computed once and then cached, so using them when publishing each
+  reading costs no bus traffic or string formatting. (Caching also avoids
+  I2C errors causing the serial number to change, which I observed with
+  my BME680.)
+
+  Drivers implement read_serial_number(), which fetches (or derives) the
+  hardware identifier for the device, bypassing the cache, and can set
+  serial_format if the serial number is wider than 32 bits.
+  """
+
+  serial_format = '08x'
+  _cached_serial = None
+  _cached_id = None
+
+  @property
+  def serial_number(self):
+    """The hardware identifier (serial number) for the device."""
+    if self._cached_serial is None:
+      self._cached_serial = self.read_serial_number()
+    return self._cached_serial
+
+  @serial_number.setter
+  def serial_number(self, serial):
+    # Allows a known serial number (e.g. from the enumeration cache) to be used without reading the device
+    self._cached_serial = serial
+    self._cached_id = None
+
+  @property
+  def id(self):
+    """A unique identifier for the device."""
+    if self._cached_id is None:
+      self._cached_id = "{model:s}--{serial:{format}}".format(model=self.model.replace('-',''), serial=self.serial_number, format=self.serial_format).lower()
+    return self._cached_id
@@ -1,19 +1,19 @@
 from typing import Optional
 from datetime import datetime
 from zlib import crc32
-try:
-    from smbus import SMBus
-except ImportError:
-    from smbus2 import SMBus
 import ltr559 as pimoroni_ltr559
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_ADDRESSES = [ 0x23 ]
 
 def enumerate_sensors():
   sensors = []
-  bus = SMBus(1)
+  bus = i2c.smbus(1)
   for i2c_address in I2C_ADDRESSES:
+    if not i2c.present(i2c_address):
+      continue
     try:
       sensor = ltr559(i2c_addr=i2c_address, i2c_dev=bus)
     except (OSError, ValueError, RuntimeError) as error:
@@ -26,12 +26,18 @@ def enumerate_sensors():
   return sensors
 
 
-class ltr559(pimoroni_ltr559.LTR559):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return ltr559(i2c_addr=address, i2c_dev=i2c.smbus(1))
+
+
+class ltr559(SensorIdentity, pimoroni_ltr559.LTR559):
 
   manufacturer = 'LITE-ON'
   model = 'LTR-559'
   supported_measurements = [Measurement.LIGHT,
                             Measurement.PROXIMITY]
+  min_read_interval = 0.1  # Minimum seconds between reads (default ALS integration time)
 
   def __init__(self,
                i2c_addr:  Optional[int]     = I2C_ADDRESSES[0],
@@ -56,12 +62,11 @@ class ltr559(pimoroni_ltr559.LTR559):
     return self.get_proximity(passive=True)
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # Doesn't look like the device supports reading a unique
     # identifier, this cobbles something together from the
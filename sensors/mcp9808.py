@@ -1,17 +1,19 @@
 from typing import Optional
 from zlib import crc32
 from datetime import datetime
-from busio import I2C
-from board import SCL, SDA
 import adafruit_mcp9808
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_ADDRESSES = [ 0x18, 0x19, 0x1A, 0x1B, 0x1C, 0x1D, 0x1E, 0x1F ]
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in I2C_ADDRESSES:
+    if not i2c.present(i2c_address):
+      continue
     try:
       sensor = mcp9808(i2c_dev=bus, i2c_addr=i2c_address)
     except (OSError, AttributeError, ValueError) as error:
@@ -23,11 +25,18 @@ def enumerate_sensors():
   return sensors
 
 
-class mcp9808(adafruit_mcp9808.MCP9808):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return mcp9808(i2c_dev=i2c.bus(), i2c_addr=address)
+
+
+class mcp9808(SensorIdentity, adafruit_mcp9808.MCP9808):
 
   manufacturer = 'Microchip Technology'
   model = 'MCP9808'
   supported_measurements = [Measurement.TEMPERATURE]
+  min_read_interval = 0.25  # Minimum seconds between reads (conversion time at the default 0.0625°C resolution)
+  quantization = { 'temperature': 0.0625 }  # Smallest step between readings
 
   def __init__(self, i2c_dev=None,
                i2c_addr: Optional[int] = I2C_ADDRESSES[0]):
@@ -49,12 +58,11 @@ class mcp9808(adafruit_mcp9808.MCP9808):
     return self._temperature
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # Doesn't look like the device supports reading a unique
     # identifier, this cobbles something together from the
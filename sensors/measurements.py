@@ -30,6 +30,13 @@ class Measurement():
   # the raw gas sensor resistance value based on the individual sensor history:
   #  0% = "lowest air pollution ever measured"
   #  100% = "highest air pollution ever measured"
+  #
+  # Derived on the device from a sensor's own readings (see sensors/derived.py)
+  #
+  DEW_POINT           = { 'name': 'dew_point',           'units': '°C',     'precision': 2,  'ha_device_class': 'temperature',  'ha_title': 'Dew Point'           }
+  ABSOLUTE_HUMIDITY   = { 'name': 'absolute_humidity',   'units': 'g/m³',   'precision': 2,  'ha_device_class': None,           'ha_title': 'Absolute Humidity'   }
+  HEAT_INDEX          = { 'name': 'heat_index',          'units': '°C',     'precision': 2,  'ha_device_class': 'temperature',  'ha_title': 'Heat Index'          }
+  SEA_LEVEL_PRESSURE  = { 'name': 'sea_level_pressure',  'units': 'hPa',    'precision': 2,  'ha_device_class': 'pressure',     'ha_title': 'Sea Level Pressure'  }
 
 
 class MeasurementError(Exception):
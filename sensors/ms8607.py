@@ -1,15 +1,17 @@
 from datetime import datetime
 from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_ms8607
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_ADDRESSES = [ 0x40, 0x76 ]
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
+  if not all(i2c.present(i2c_address) for i2c_address in I2C_ADDRESSES):
+    return sensors
   # The MS8607 is a two-in-one device, occupying fixed I2C addresses 0x40 and 0x76
   try:
     sensor = ms8607(i2c_dev=bus)
@@ -23,13 +25,20 @@ def enumerate_sensors():
   return sensors
 
 
-class ms8607(adafruit_ms8607.MS8607):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  # The MS8607 occupies fixed addresses, so nothing is recorded
+  return ms8607(i2c_dev=i2c.bus())
+
+
+class ms8607(SensorIdentity, adafruit_ms8607.MS8607):
 
   manufacturer = 'TE Connectivity'
   model = 'MS8607'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.PRESSURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 0.035  # Minimum seconds between reads (pressure/temperature plus humidity conversion times)
 
   def __init__(self, i2c_dev):
     super().__init__(i2c_bus=i2c_dev)
@@ -60,12 +69,11 @@ class ms8607(adafruit_ms8607.MS8607):
     return self._h
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return None
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """The hardware identifier (serial number) for the device."""
     # Doesn't look like the device supports reading a unique
     # identifier, this cobbles something together from the
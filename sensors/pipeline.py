@@ -0,0 +1,136 @@
+"""
+Processing stages between reading a sensor (update_sensor()) and
+publishing its readings.
+"""
+import math, time
+from statistics import median
+from sensors.measurements import MeasurementError
+
+MAD_SCALE = 0.6745  # Makes the median absolute deviation comparable to a standard deviation, for normal noise
+
+
+class Oversampler():
+  """
+  Takes several reads of a sensor per update, no faster than the sensor's
+  min_read_interval (its conversion time), and combines them into one
+  reading per measurement: values with a modified z-score (the distance from
+  the median in scaled median absolute deviations) above threshold are
+  rejected as outliers, e.g. the odd spike from a DHT22, and the rest are
+  averaged. Reads that fail are skipped, as long as at least one succeeds.
+
+  Readings from sensors with coarse resolution (which declare it in their
+  quantization attribute) often agree exactly, so the deviation is taken to
+  be at least one quantization step; values a step or so from the median
+  aren't mistaken for outliers. Where the step isn't known, and most of the
+  values agree exactly, none are rejected.
+  """
+
+  def __init__(self, samples, threshold=3.5):
+    self.samples = samples
+    self.threshold = threshold
+
+  def sample(self, sensor, getters, steps=None):
+    """
+    Read the sensor, returning the filtered value for each getter (None
+    where the sensor gave no values), and the number of reads made; raises
+    the last MeasurementError if every read failed. steps are the
+    quantization steps of the getters' values, where known (else 0).
+    """
+    interval = getattr(sensor, 'min_read_interval', 0)
+    values = [ [] for _ in getters ]
+    reads = 0
+    error = None
+    started = None
+    for _ in range(self.samples):
+      if started is not None:
+        # Intervals are measured from the start of each read
+        time.sleep(max(started + interval - time.monotonic(), 0))
+      started = time.monotonic()
+      try:
+        sensor.update_sensor()
+      except MeasurementError as e:
+        error = e
+        continue
+      reads += 1
+      for getter, series in zip(getters, values):
+        value = getter(sensor)
+        if value is not None:
+          series.append(value)
+    if reads == 0:
+      raise error
+    return [ self.filter(series, step) for series, step in zip(values, steps or [ 0 ] * len(values)) ], reads
+
+  def filter(self, values, step=0):
+    """The mean of the values, once outliers have been rejected."""
+    if len(values) == 0:
+      return None
+    if len(values) < 3:
+      # Too few to tell which is the outlier
+      return sum(values) / len(values)
+    middle = median(values)
+    deviation = max(median([ abs(value - middle) for value in values ]), step)
+    if deviation == 0:
+      # Most of the values are identical, and there's no telling whether the
+      # rest are outliers or just a step away, so rejecting them would bias the mean
+      inliers = values
+    else:
+      inliers = [ value for value in values if MAD_SCALE * abs(value - middle) / deviation <= self.threshold ]
+    return sum(inliers) / len(inliers)
+
+
+class ExponentialSmoother():
+  """
+  Exponential moving average of a measurement, with a time constant (in
+  seconds) rather than a fixed weight, so that it behaves the same whatever
+  the update period, and across gaps in the readings.
+  """
+
+  def __init__(self, time_constant):
+    self.time_constant = time_constant
+    self.value = None
+    self.updated = None   # Monotonic time of the last update
+
+  def update(self, value, now):
+    """Add a reading, taken at monotonic time now, returning the smoothed value."""
+    if self.value is None:
+      self.value = value
+    else:
+      weight = 1 - math.exp(-max(now - self.updated, 0) / self.time_constant)
+      self.value += weight * (value - self.value)
+    self.updated = now
+    return self.value
+
+
+class KalmanSmoother():
+  """
+  One-dimensional Kalman filter for a measurement, modelled as a random walk
+  read with noise. The time constant (in seconds) is the time over which the
+  process varies by as much as a reading does through noise; as only that
+  ratio matters, variances are kept relative to the reading noise, and no
+  units are needed. Unlike the EMA, the gain starts high, so the estimate
+  settles quickly after a start (or a long gap), then tightens.
+  """
+
+  def __init__(self, time_constant):
+    self.time_constant = time_constant
+    self.value = None
+    self.variance = None  # Of the estimate, relative to the reading noise
+    self.updated = None   # Monotonic time of the last update
+
+  def update(self, value, now):
+    """Add a reading, taken at monotonic time now, returning the smoothed value."""
+    if self.value is None:
+      self.value, self.variance = value, 1.0
+    else:
+      predicted = self.variance + max(now - self.updated, 0) / self.time_constant
+      gain = predicted / (predicted + 1)
+      self.value += gain * (value - self.value)
+      self.variance = (1 - gain) * predicted
+    self.updated = now
+    return self.value
+
+
+SMOOTHERS = {
+  'ema':    ExponentialSmoother,
+  'kalman': KalmanSmoother
+}
@@ -0,0 +1,96 @@
+import time
+from operator import attrgetter
+
+METADATA = ( 'timestamp', 'samples' )  # Fields of the readings that aren't measurements
+SMOOTHED_SUFFIX = '_smoothed'           # Appended to the names of smoothed measurements
+
+
+class PublishPlan():
+  """
+  Everything the agent needs to publish a sensor's readings, worked out once
+  (after enumeration) so that the update loop only has to execute it: the
+  topics, the offset to apply, a getter and rounding function for each
+  measurement, the oversampler (if any) to read the sensor through, the
+  smoothers for the measurements also published smoothed, and the
+  derivations of the measurements derived from the others.
+  """
+
+  def __init__(self, sensor, offset=0, sampler=None, smoothers=None, derivations=None):
+    self.sensor = sensor
+    self.status_topic = "sensors/{}/status".format(sensor.id)
+    self.state_topic = "sensors/{}/state".format(sensor.id)
+    self.offset = offset
+    smoothers = smoothers or {}  # measurement name -> smoother, for measurements also published smoothed
+    self.getters = [ attrgetter(m['name']) for m in sensor.supported_measurements ]
+    quantization = getattr(sensor, 'quantization', {})
+    self.steps = [ quantization.get(m['name'], 0) for m in sensor.supported_measurements ]
+    self.measurements = [ (m['name'], rounding(m['precision']), smoothers.get(m['name'])) for m in sensor.supported_measurements ]
+    # Everything published, for registering with Home Assistant
+    self.published_measurements = []
+    for measurement in sensor.supported_measurements:
+      self.published_measurements.append(measurement)
+      if measurement['name'] in smoothers:
+        self.published_measurements.append(smoothed(measurement))
+    # (name, function, input names, rounding) for each derived measurement, see sensors/derived.py
+    self.derivations = [ (m['name'], function, inputs, rounding(m['precision'])) for m, function, inputs in derivations or [] ]
+    self.published_measurements.extend(m for m, _, _ in derivations or [])
+    self.sequence = None  # Sequence number of the sensor's last sample read, for sensors that number them
+    self.sampler = sampler
+
+  def read(self):
+    """
+    Update the sensor and return its readings; raises MeasurementError if the
+    sensor can't be read. Returns None if the sensor numbers its samples (e.g.
+    the BME680's BSEC output), and there hasn't been a new one since last read.
+    When oversampling, the readings are the filtered values of several reads,
+    and include the number of reads made (samples).
+    """
+    sensor = self.sensor
+    samples = None
+    if self.sampler is not None:
+      values, samples = self.sampler.sample(sensor, self.getters, self.steps)
+    else:
+      sensor.update_sensor()
+      sequence = getattr(sensor, 'sequence', None)
+      if sequence is not None:
+        if sequence == self.sequence:
+          return None
+        self.sequence = sequence
+      values = [ getter(sensor) for getter in self.getters ]
+    now = time.monotonic()
+    readings = { 'timestamp': str(sensor.timestamp) }
+    offset = self.offset
+    for (name, round_value, smoother), value in zip(self.measurements, values):
+      # Optionally correct the value using offset
+      if value is not None:
+        value += offset
+        readings[name] = round_value(value)
+        if smoother is not None:
+          readings[name + SMOOTHED_SUFFIX] = round_value(smoother.update(value, now))
+    for name, derive, inputs, round_value in self.derivations:
+      arguments = [ readings.get(field) for field in inputs ]
+      if None not in arguments:
+        value = derive(*arguments)
+        if value is not None:
+          readings[name] = round_value(value)
+    if samples is not None:
+      readings['samples'] = samples
+    return readings
+
+
+def smoothed(measurement):
+  """The definition of a measurement's smoothed counterpart."""
+  return { **measurement, 'name': measurement['name'] + SMOOTHED_SUFFIX, 'ha_title': "{} (Smoothed)".format(measurement['ha_title']) }
+
+
+def base_measurement(name):
+  """The name of the measurement a published field is made from, e.g. temperature for temperature_smoothed."""
+  if name.endswith(SMOOTHED_SUFFIX):
+    return name[:-len(SMOOTHED_SUFFIX)]
+  return name
+
+
+def rounding(precision):
+  """A function rounding values to the precision (number of decimal places) of a measurement."""
+  digits = precision if precision > 0 else None
+  return lambda value: round(value, digits)
@@ -0,0 +1,130 @@
+import json
+from datetime import datetime
+from itertools import islice
+from sensors.history import LEVELS, NAME, RAW
+
+FIELDS = {
+  RAW:  [ 'timestamp', 'value' ],
+  '1m': [ 'timestamp', 'min', 'max', 'mean', 'count' ],
+  '1h': [ 'timestamp', 'min', 'max', 'mean', 'count' ]
+}
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+
+class HistoryRequest():
+  """
+  A request for a sensor's readings history, received as JSON on
+  sensors/{id}/history/request, e.g.
+
+    { "request": "backfill-1", "start": "2024-01-01T00:00:00", "end": 1704153600,
+      "resolution": "1m", "measurements": [ "temperature" ], "page_size": 500 }
+
+  start and end are epoch seconds or ISO 8601 timestamps (end defaults to
+  now); resolution is raw (the default), 1m or 1h; measurements defaults to
+  all of the sensor's. The response is published as a series of pages on
+  response_topic (default: sensors/{id}/history/response). A request that
+  can't be answered gets a single error message instead, with an HTTP-style
+  code: 400 for an invalid request, 404 for measurements without history,
+  and 429 if too many requests are waiting.
+  """
+
+  def __init__(self, sensor_id):
+    self.sensor_id = sensor_id
+    self.request = None
+    self.response_topic = "sensors/{}/history/response".format(sensor_id)
+
+  def parse(self, payload):
+    """Parse and check the request, raising ValueError if it's invalid (which can then be reported with error())."""
+    try:
+      request = json.loads(payload)
+    except ValueError as error:
+      raise ValueError("request is not valid JSON ({})".format(error))
+    if not isinstance(request, dict):
+      raise ValueError("request must be a JSON object")
+    self.request = request.get('request')
+    response_topic = request.get('response_topic')
+    if response_topic is not None:
+      if not isinstance(response_topic, str) or response_topic == '' or '+' in response_topic or '#' in response_topic:
+        raise ValueError("response_topic must be a topic name, without wildcards")
+      self.response_topic = response_topic
+    if 'start' not in request:
+      raise ValueError("start of the time range is required")
+    self.start = epoch(request['start'])
+    self.end = epoch(request['end']) if request.get('end') is not None else int(datetime.now().timestamp())
+    self.resolution = request.get('resolution', RAW)
+    if self.resolution not in LEVELS:
+      raise ValueError("resolution must be one of: {}".format(", ".join(LEVELS)))
+    self.measurements = request.get('measurements')
+    if self.measurements is not None and not (isinstance(self.measurements, list) and all(isinstance(name, str) and NAME.fullmatch(name) for name in self.measurements)):
+      raise ValueError("measurements must be a list of measurement names")
+    self.page_size = request.get('page_size', DEFAULT_PAGE_SIZE)
+    if isinstance(self.page_size, bool) or not isinstance(self.page_size, int) or not 0 < self.page_size <= MAX_PAGE_SIZE:
+      raise ValueError("page_size must be a whole number between 1 and {}".format(MAX_PAGE_SIZE))
+
+  def check(self, history):
+    """Raise LookupError if any of the requested measurements has no history for the sensor."""
+    if self.measurements is None:
+      return
+    unknown = sorted(set(self.measurements) - set(history.measurements(self.sensor_id)))
+    if len(unknown) > 0:
+      raise LookupError("no history of measurement(s): {}".format(", ".join(unknown)))
+
+  def pages(self, history):
+    """
+    Generate the response, as JSON pages of at most page_size records, one
+    measurement at a time. Records are read from the history as each page is
+    made, so the whole range is never held in memory.
+    """
+    measurements = self.measurements if self.measurements is not None else history.measurements(self.sensor_id)
+    number = 0
+    pending = None   # Each page is held back until the next is made, so the last can be marked as such
+    for measurement in measurements:
+      records = history.query(self.sensor_id, measurement, self.start, self.end, self.resolution)
+      while True:
+        page = [ [ round(value, 4) if isinstance(value, float) else value for value in record ] for record in islice(records, self.page_size) ]
+        if len(page) == 0:
+          break
+        if pending is not None:
+          yield self.page(number, pending, last=False)
+          number += 1
+        pending = (measurement, page)
+    yield self.page(number, pending, last=True)
+
+  def page(self, number, contents, last):
+    message = {
+      'request':    self.request,
+      'sensor':     self.sensor_id,
+      'page':       number,
+      'last':       last,
+      'resolution': self.resolution,
+      'fields':     FIELDS[self.resolution]
+    }
+    if contents is not None:
+      message['measurement'], message['records'] = contents
+    else:
+      message['records'] = []
+    return json.dumps(message, separators=(',', ':'))
+
+  def error(self, message, code=400):
+    return json.dumps({ 'request': self.request, 'sensor': self.sensor_id, 'code': code, 'error': message })
+
+
+def epoch(value):
+  """Epoch seconds from a number, or an ISO 8601 timestamp; raises ValueError for anything else."""
+  try:
+    if isinstance(value, bool):
+      raise TypeError
+    if isinstance(value, (int, float)):
+      seconds = int(value)
+    elif isinstance(value, str):
+      seconds = int(datetime.fromisoformat(value).timestamp())
+    else:
+      raise TypeError
+  except (ValueError, TypeError, OverflowError, OSError):
+    raise ValueError("invalid timestamp: {}".format(json.dumps(value)[:64]))
+  # History records have 32-bit epochs
+  if not 0 <= seconds < 2**32:
+    raise ValueError("timestamp out of range: {}".format(json.dumps(value)[:64]))
+  return seconds
@@ -0,0 +1,107 @@
+"""
+Registry of sensor types, with cheap probe metadata for each: the bus the
+sensor is found on, and the addresses (and, where addresses are shared,
+chip IDs) it can occupy. The agent only imports a sensor type's module,
+and with it the vendor driver library, once the probe says a sensor of
+that type may be present, because importing every driver library (each
+pulling in its own dependencies) dominates startup on a Pi Zero.
+
+Sensor types that can't be probed cheaply (e.g. the DHT22, which needs its
+driver to bit-bang each GPIO pin), or that aren't in the registry, are
+always imported. Those marked rescan probe part of their bus in the
+background after startup, so they're imported even when the sensors are
+restored from the enumeration cache. The time taken to import each module
+is recorded, so that it can be reported, and regressions spotted:
+
+  python3 -m sensors.registry bme280 ds18b20
+"""
+import sys, time, importlib
+from pathlib import Path
+from . import i2c
+
+W1_DEVICES = Path('/sys/bus/w1/devices')
+
+SENSOR_TYPES = {
+  'aht20':    { 'bus': 'i2c', 'addresses': [ 0x38 ] },
+  # The BME280 and BME680 share addresses, and are told apart by chip ID
+  'bme280':   { 'bus': 'i2c', 'addresses': [ 0x76, 0x77 ], 'chip_id': (0xD0, 1, lambda chip_id: chip_id == bytes([0x60])) },
+  'bme680':   { 'bus': 'i2c', 'addresses': [ 0x76, 0x77 ], 'chip_id': (0xD0, 1, lambda chip_id: chip_id == bytes([0x61])) },
+  'dht22':    { 'bus': 'gpio', 'rescan': True },
+  'ds18b20':  { 'bus': 'w1', 'family': '28' },
+  'hts221':   { 'bus': 'i2c', 'addresses': [ 0x5F ] },
+  # The HTU21D and Si7021 share an address, the HTU21D's serial number has a fixed first byte
+  'htu21d':   { 'bus': 'i2c', 'addresses': [ 0x40 ], 'chip_id': (bytes([0xFC, 0xC9]), 6, lambda chip_id: chip_id[0] == 0x32) },
+  'si7021':   { 'bus': 'i2c', 'addresses': [ 0x40 ], 'chip_id': (bytes([0xFC, 0xC9]), 6, lambda chip_id: chip_id[0] != 0x32) },
+  'mcp9808':  { 'bus': 'i2c', 'addresses': [ 0x18, 0x19, 0x1A, 0x1B, 0x1C, 0x1D, 0x1E, 0x1F ] },
+  # The MS8607 is a two-in-one device, occupying both addresses
+  'ms8607':   { 'bus': 'i2c', 'addresses': [ 0x40, 0x76 ], 'all': True },
+  'sht31d':   { 'bus': 'i2c', 'addresses': [ 0x44, 0x45 ] },
+  'tmp117':   { 'bus': 'i2c', 'addresses': [ 0x48, 0x49 ] },
+  'ltr559':   { 'bus': 'i2c', 'addresses': [ 0x23 ] },
+  'emulator': { 'bus': None }
+}
+
+_import_times = {}  # sensor type -> seconds taken to import its module
+
+
+def present(sensor_type):
+  """
+  True if a sensor of the type may be present, so its module is worth
+  importing. Errs on the side of True when the bus can't be probed.
+  """
+  probe = SENSOR_TYPES.get(sensor_type)
+  if probe is None or probe['bus'] in (None, 'gpio'):
+    return True
+  if probe['bus'] == 'w1':
+    return W1_DEVICES.is_dir() and any(W1_DEVICES.glob("{}-*".format(probe['family'])))
+  try:
+    found = [ address for address in probe['addresses'] if i2c.present(address) and identified(address, probe) ]
+  except ImportError:
+    # No I2C support (e.g. not running on a board), leave it to the module to report
+    return True
+  if probe.get('all', False):
+    return len(found) == len(probe['addresses'])
+  return len(found) > 0
+
+
+def bus(sensor_type):
+  """The bus the sensor type is found on ('i2c', 'w1' or 'gpio'), or None if not known."""
+  return SENSOR_TYPES.get(sensor_type, {}).get('bus')
+
+
+def rescanned(sensor_type):
+  """True if the sensor type probes for sensors in the background after startup (e.g. the DHT22's GPIO pins)."""
+  return SENSOR_TYPES.get(sensor_type, {}).get('rescan', False)
+
+
+def identified(address, probe):
+  if 'chip_id' not in probe:
+    return True
+  command, length, matches = probe['chip_id']
+  chip_id = i2c.chip_id(address, command, length)
+  # If the chip ID couldn't be read, the module gets to try
+  return chip_id is None or matches(chip_id)
+
+
+def load(sensor_type):
+  """Import the module for the sensor type, recording how long that took."""
+  start = time.perf_counter()
+  module = importlib.import_module("sensors.{}".format(sensor_type))
+  # Libraries shared between modules are counted against the first module to import them
+  _import_times.setdefault(sensor_type, time.perf_counter() - start)
+  return module
+
+
+def import_times():
+  """Seconds taken to import each sensor type's module, keyed by sensor type, slowest first."""
+  return dict(sorted(_import_times.items(), key=lambda item: item[1], reverse=True))
+
+
+if __name__ == "__main__":
+  for sensor_type in sys.argv[1:] or SENSOR_TYPES:
+    try:
+      load(sensor_type)
+    except ImportError as error:
+      print("{:<10} not importable: {}".format(sensor_type, error))
+  for sensor_type, seconds in import_times().items():
+    print("{:<10} {:8.3f}s".format(sensor_type, seconds))
@@ -0,0 +1,89 @@
+import time, heapq, itertools, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SensorScheduler:
+  """
+  Polls sensors concurrently on a worker pool, each at its own fixed
+  cadence. Upcoming polls are kept in a deadline-ordered heap, and every
+  sensor's next deadline is measured from its previous one (rather than
+  from when the work finished), so one slow device can't hold up the
+  others or stretch their update periods.
+  """
+
+  def __init__(self, sensors, poll, period, max_workers=None, info=print, clock=time.monotonic):
+    self.poll     = poll      # Callable taking a sensor, run on a worker thread
+    self.info     = info
+    self.clock    = clock
+    self.periods  = {}        # sensor -> update period, in seconds
+    self.queue    = []        # Heap of (deadline, sequence, sensor) entries
+    self.sequence = itertools.count()   # Tie-breaker, sensors themselves aren't orderable
+    self.pending  = {}        # sensor -> Future, for polls still in flight
+    self.overruns = {}        # sensor id -> number of slots overrun
+    self.condition = threading.Condition()  # Guards the queue, and wakes the run loop when sensors are added
+    sensors = list(sensors)
+    self.executor = ThreadPoolExecutor(max_workers=max_workers or max(len(sensors), 1),
+                                       thread_name_prefix='sensor-poll')
+    start = self.clock()
+    for sensor in sensors:
+      # period is either a single value for all sensors, or a callable giving the period for each sensor
+      self.periods[sensor] = period(sensor) if callable(period) else period
+      self.schedule(sensor, start)
+
+  def schedule(self, sensor, deadline):
+    heapq.heappush(self.queue, (deadline, next(self.sequence), sensor))
+
+  def add(self, sensor, period):
+    """Add a sensor (e.g. one discovered after startup), polling it straight away."""
+    with self.condition:
+      self.periods[sensor] = period
+      self.schedule(sensor, self.clock())
+      self.condition.notify()
+
+  def run(self):
+    with self.condition:
+      while True:
+        # Sleep until the next deadline, or until woken because an earlier one was added
+        self.condition.wait(self.dispatch_due())
+
+  def dispatch_due(self):
+    """
+    Dispatch the polls whose deadlines have passed, scheduling each sensor's
+    next; returns the time until the next deadline (None if there are no
+    sensors). Called with the condition held.
+    """
+    while len(self.queue) > 0:
+      deadline, _, sensor = self.queue[0]
+      remaining = deadline - self.clock()
+      if remaining > 0:
+        return remaining
+      heapq.heappop(self.queue)
+      self.dispatch(sensor)
+      period = self.periods[sensor]
+      next_deadline = deadline + period
+      # If the sensor's slots fell behind (e.g. the host was suspended),
+      # skip the missed ones rather than firing them back-to-back
+      behind = self.clock() - next_deadline
+      if behind >= 0:
+        missed = int(behind // period) + 1
+        self.info("Scheduler is running late, skipping {} update slot(s) for sensor {}".format(missed, sensor.id))
+        next_deadline += missed * period
+      self.schedule(sensor, next_deadline)
+    return None
+
+  def dispatch(self, sensor):
+    if sensor in self.pending:
+      # Still busy with the previous slot, don't pile up another poll behind it
+      self.overruns[sensor.id] = self.overruns.get(sensor.id, 0) + 1
+      self.info("Sensor {} overran its {}s update slot ({} overrun(s) so far)".format(sensor.id, self.periods[sensor], self.overruns[sensor.id]))
+      return
+    future = self.executor.submit(self.poll, sensor)
+    self.pending[sensor] = future
+    future.add_done_callback(lambda f, s=sensor: self.completed(s, f))
+
+  def completed(self, sensor, future):
+    self.pending.pop(sensor, None)
+    error = future.exception()
+    if error is not None:
+      self.info("Unexpected error polling sensor {}:\n{}".format(sensor.id,
+        ''.join(traceback.format_exception(type(error), error, error.__traceback__))))
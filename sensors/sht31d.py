@@ -1,16 +1,17 @@
 from typing import Optional
 from datetime import datetime
-from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_sht31d
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in [ adafruit_sht31d._SHT31_DEFAULT_ADDRESS, adafruit_sht31d._SHT31_SECONDARY_ADDRESS ]:
+    if not i2c.present(i2c_address):
+      continue
     try:
       sensor = sht31d(i2c_dev=bus, i2c_addr=i2c_address)
     except (OSError, ValueError, RuntimeError) as error:
@@ -22,16 +23,23 @@ def enumerate_sensors():
   return sensors
 
 
-class sht31d(adafruit_sht31d.SHT31D):
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return sht31d(i2c_dev=i2c.bus(), i2c_addr=address)
+
+
+class sht31d(SensorIdentity, adafruit_sht31d.SHT31D):
 
   manufacturer = 'Sensirion'
   model = 'SHT31-D'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 0.015  # Minimum seconds between reads (high repeatability measurement duration)
 
   def __init__(self, i2c_dev=None,
                i2c_addr: Optional[int] = adafruit_sht31d._SHT31_DEFAULT_ADDRESS):
     super().__init__(i2c_bus=i2c_dev, address=i2c_addr)
+    self.i2c_address = i2c_addr
 
   def update_sensor(self):
     try:
@@ -48,6 +56,11 @@ class sht31d(adafruit_sht31d.SHT31D):
     return self._temperature
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
+
+  def read_serial_number(self):
+    """The hardware identifier (serial number) for the device."""
+    # Read by the Adafruit driver's serial_number property (which SensorIdentity caches)
+    return adafruit_sht31d.SHT31D.serial_number.fget(self)
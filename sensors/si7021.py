@@ -1,17 +1,24 @@
 from datetime import datetime
 from retrying import retry
-from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_si7021
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_ADDRESS = 0x40
+_ID2_CMD = bytearray([0xFC, 0xC9])
+_HTU21D_DEVICE_ID = 0x32
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in [ I2C_ADDRESS ]:
+    if not i2c.present(i2c_address):
+      continue
+    # HTU21D sensors also live at 0x40 and answer the same commands, check the (cached) device ID before probing
+    device_id = i2c.chip_id(i2c_address, _ID2_CMD, 6)
+    if device_id is not None and device_id[0] == _HTU21D_DEVICE_ID:
+      continue
     try:
       sensor = probe_sensor(bus, i2c_address)
     except (OSError, ValueError, RuntimeError) as error:
@@ -23,6 +30,11 @@ def enumerate_sensors():
   return sensors
 
 
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return probe_sensor(i2c.bus(), address)
+
+
 def retry_if_runtime_error(exception):
   """Return True if the exception is a RuntimeError (indicating failed initialisation), False otherwise."""
   return isinstance(exception, RuntimeError)
@@ -38,15 +50,17 @@ def probe_sensor(i2c_bus, i2c_address):
   return sensor
 
 
-class si7021(adafruit_si7021.SI7021):
+class si7021(SensorIdentity, adafruit_si7021.SI7021):
 
   manufacturer = 'Silicon Labs'
   model = 'Si70xx'
   supported_measurements = [Measurement.TEMPERATURE,
                             Measurement.HUMIDITY]
+  min_read_interval = 0.023  # Minimum seconds between reads (12-bit humidity plus 14-bit temperature conversion times)
 
   def __init__(self, i2c_dev, i2c_addr=I2C_ADDRESS):
     super().__init__(i2c_bus=i2c_dev, address=i2c_addr)
+    self.i2c_address = i2c_addr
     self._temperature = None
 
   def update_sensor(self):
@@ -70,6 +84,11 @@ class si7021(adafruit_si7021.SI7021):
     return self.device_identifier
   
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
+
+  def read_serial_number(self):
+    """The hardware identifier (serial number) for the device."""
+    # Read by the Adafruit driver's serial_number property (which SensorIdentity caches)
+    return adafruit_si7021.SI7021.serial_number.fget(self)
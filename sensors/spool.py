@@ -0,0 +1,140 @@
+import json, time, base64, threading
+from pathlib import Path
+
+BACKFILL_SUFFIX = '/backfill'   # Appended to the topic of each stored message when it's drained
+
+
+class Spool():
+  """
+  Bounded, disk-backed store-and-forward queue for state messages published
+  while the MQTT broker is unavailable.
+
+  Messages are appended, one JSON record per line, to numbered segment files
+  in the spool directory, which are drained oldest first (i.e. in timestamp
+  order) once the broker is reachable again, and deleted once drained. New
+  messages are published straight away once the broker is connected, even
+  while draining, so that current state isn't held up behind the backlog
+  (and expired by Home Assistant); the publish function passed to drain()
+  decides where the backlog goes, so that it doesn't overwrite them. When
+  the spool exceeds max_bytes, or a segment's newest message is older than
+  max_age, whole segments are evicted, oldest first.
+  """
+
+  def __init__(self, directory, max_bytes=8*1024*1024, max_age=7*24*3600, segment_bytes=256*1024, info=print):
+    self.directory = Path(directory)
+    self.info = info
+    self.max_bytes = max_bytes
+    self.max_age = max_age
+    self.segment_bytes = segment_bytes
+    self._lock = threading.Lock()
+    self._file = None     # Segment currently being appended to
+    self.directory.mkdir(exist_ok=True)
+    # Segment number -> size in bytes, for segments left over from a previous run too
+    self._segments = { int(path.stem): path.stat().st_size for path in self.directory.glob('*.seg') }
+    self._next_segment = max(self._segments, default=0) + 1
+    self._read_offset = 0  # Position reached in the oldest segment by an interrupted drain
+
+  def pending(self):
+    with self._lock:
+      return len(self._segments) > 0
+
+  def capture(self, topic, payload, qos=0, retain=False, connected=True):
+    """
+    Spool the message if the broker isn't connected. Returns False if the
+    message wasn't spooled, and should be published straight away.
+    """
+    if connected:
+      return False
+    with self._lock:
+      self._append(topic, payload, qos, retain)
+      self._evict()
+      return True
+
+  def drain(self, publish, rate, connected):
+    """
+    Publish the spooled messages, oldest first, at up to rate messages per
+    second, using publish(topic, payload, qos, retain), which returns False if
+    the message couldn't be sent. Stops early (keeping the remaining messages)
+    if that happens, or connected() becomes False.
+    """
+    while True:
+      with self._lock:
+        if len(self._segments) == 0:
+          return True
+        segment = min(self._segments)
+        if self._file is not None and segment == self._next_segment - 1:
+          # Draining has caught up with the segment being appended to, start a new one
+          self._close()
+        offset = self._read_offset
+      with open(self.segment_path(segment), 'rb') as file:
+        file.seek(offset)
+        for line in file:
+          if not connected():
+            return False
+          record = self.decode(line)
+          if record is not None and not publish(record['topic'], record['payload'], record['qos'], record['retain']):
+            return False
+          offset += len(line)
+          with self._lock:
+            if segment not in self._segments:
+              break   # Evicted while being drained
+            self._read_offset = offset
+          time.sleep(1.0 / rate)
+      with self._lock:
+        if segment in self._segments:
+          self._remove(segment)
+
+  def segment_path(self, segment):
+    return self.directory.joinpath("{:010d}.seg".format(segment))
+
+  def _append(self, topic, payload, qos, retain):
+    if self._file is None or self._segments.get(self._next_segment - 1, 0) >= self.segment_bytes:
+      self._close()
+      self._file = open(self.segment_path(self._next_segment), 'ab')
+      self._segments[self._next_segment] = 0
+      self._next_segment += 1
+    record = { 'timestamp': time.time(), 'topic': topic, 'qos': qos, 'retain': retain }
+    if isinstance(payload, (bytes, bytearray)):
+      record['payload_base64'] = base64.b64encode(payload).decode('ascii')
+    else:
+      record['payload'] = str(payload)
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    self._file.write(line)
+    # Flushed to the OS, but not fsync'd; the SD card isn't forced to write each message
+    self._file.flush()
+    self._segments[self._next_segment - 1] += len(line)
+
+  def _close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def _evict(self):
+    now = time.time()
+    while len(self._segments) > 1:
+      oldest = min(self._segments)
+      too_big = sum(self._segments.values()) > self.max_bytes
+      too_old = now - self.segment_path(oldest).stat().st_mtime > self.max_age
+      if not (too_big or too_old):
+        break
+      self.info("Spool is {}, evicting oldest segment {}".format("full" if too_big else "stale", self.segment_path(oldest)))
+      self._remove(oldest)
+
+  def _remove(self, segment):
+    if self._file is not None and segment == self._next_segment - 1:
+      self._close()
+    self.segment_path(segment).unlink(missing_ok=True)
+    del self._segments[segment]
+    # Segments are only ever removed oldest first, so any drain position was in this one
+    self._read_offset = 0
+
+  @staticmethod
+  def decode(line):
+    try:
+      record = json.loads(line)
+      if 'payload_base64' in record:
+        record['payload'] = base64.b64decode(record['payload_base64'])
+      return record
+    except (ValueError, KeyError):
+      # e.g. a partial line left by a crash mid-write
+      return None
@@ -0,0 +1,30 @@
+import time, threading
+
+
+class StatusTracker():
+  """
+  Tracks the availability status (online/offline) last published on each
+  status topic, so that a status is only published again when it changes,
+  or when a refresh is due for consumers that need a periodic heartbeat.
+  """
+
+  def __init__(self, refresh=None):
+    self.refresh = refresh    # Seconds between republishing an unchanged status (None to only publish changes)
+    self._lock = threading.Lock()
+    self._status = {}         # topic -> (status, monotonic time it was last published)
+
+  def update(self, topic, status):
+    """Record the status for the topic, returning True if it should be published."""
+    now = time.monotonic()
+    with self._lock:
+      previous = self._status.get(topic)
+      if previous is not None and previous[0] == status:
+        if not self.refresh or now - previous[1] < self.refresh:
+          return False
+      self._status[topic] = (status, now)
+      return True
+
+  def current(self):
+    """The latest status for each topic, e.g. to republish everything after reconnecting to the broker."""
+    with self._lock:
+      return { topic: status for topic, (status, _) in self._status.items() }
@@ -1,18 +1,19 @@
 from typing import Optional
 from datetime import datetime
-from zlib import crc32
-from busio import I2C
-from board import SCL, SDA
 import adafruit_tmp117
 from .measurements import Measurement, MeasurementError
+from .identity import SensorIdentity
+from . import i2c
 
 I2C_DEFAULT_ADDRESS = 0x48
 I2C_SECONDARY_ADDRESS = 0x49
 
 def enumerate_sensors():
   sensors = []
-  bus = I2C(SCL, SDA)
+  bus = i2c.bus()
   for i2c_address in [ I2C_DEFAULT_ADDRESS, I2C_SECONDARY_ADDRESS ]:
+    if not i2c.present(i2c_address):
+      continue
     try:
       sensor = tmp117(i2c_dev=bus, i2c_addr=i2c_address)
     except (OSError, AttributeError, ValueError) as error:
@@ -25,6 +26,11 @@ def enumerate_sensors():
   return sensors
 
 
+def restore_sensor(address):
+  """Re-create a sensor from its address in the enumeration cache, without probing the bus."""
+  return tmp117(i2c_dev=i2c.bus(), i2c_addr=address)
+
+
 def _convert_to_integer(bytes_to_convert):
     """Use bitwise operators to convert the bytes into integers."""
     integer = None
@@ -37,15 +43,18 @@ def _convert_to_integer(bytes_to_convert):
     return integer
 
 
-class tmp117(adafruit_tmp117.TMP117):
+class tmp117(SensorIdentity, adafruit_tmp117.TMP117):
 
   manufacturer = 'Texas Instruments'
   model = 'TMP117'
   supported_measurements = [Measurement.TEMPERATURE]
+  min_read_interval = 1.0  # Minimum seconds between reads (default conversion cycle, of 8 averaged conversions)
+  quantization = { 'temperature': 0.0078125 }  # Smallest step between readings
 
   def __init__(self, i2c_dev=None,
                i2c_addr: Optional[int] = I2C_DEFAULT_ADDRESS):
     super().__init__(i2c_bus=i2c_dev, address=i2c_addr)
+    self.i2c_address = i2c_addr
 
   def update_sensor(self):
     try:
@@ -62,12 +71,11 @@ class tmp117(adafruit_tmp117.TMP117):
     return self._temperature
 
   @property
-  def id(self):
-    """A unique identifier for the device."""
-    return "{model:s}--{serial:08x}".format(model=self.model.replace('-',''), serial=self.serial_number).lower()
+  def bus_address(self):
+    """The address of the device on its bus, as recorded in the enumeration cache."""
+    return self.i2c_address
 
-  @property
-  def serial_number(self):
+  def read_serial_number(self):
     """
     48-bit factory-set unique ID
     See: https://e2e.ti.com/support/sensors/f/1023/t/815716?TMP117-Reading-Serial-Number-from-EEPROM
@@ -0,0 +1,97 @@
+import io, os, tempfile, time, unittest
+from sensors.bsec import BsecReader, BsecSupervisor
+from sensors.measurements import Measurement
+
+
+class BsecSupervisorStalenessTest(unittest.TestCase):
+
+  def supervisor(self, sample_interval):
+    reader = BsecReader([Measurement.TEMPERATURE, Measurement.AIR_QUALITY])
+    return BsecSupervisor(['bsec'], reader, '/nonexistent/bsec_iaq.state', sample_interval=sample_interval)
+
+  def test_ulp_mode_is_not_stale_between_samples(self):
+    # In ULP mode samples are 300s apart, which mustn't look like a stalled process
+    supervisor = self.supervisor(sample_interval=300)
+    supervisor.started = time.monotonic() - 3600
+    supervisor.reader.received = time.monotonic() - 299
+    self.assertFalse(supervisor.stale())
+    supervisor.reader.received = time.monotonic() - 2999
+    self.assertFalse(supervisor.stale())
+
+  def test_ulp_mode_is_stale_after_stale_samples_intervals(self):
+    supervisor = self.supervisor(sample_interval=300)
+    supervisor.started = time.monotonic() - 3600
+    supervisor.reader.received = time.monotonic() - 3001
+    self.assertTrue(supervisor.stale())
+
+  def test_ulp_mode_allows_for_the_first_sample(self):
+    supervisor = self.supervisor(sample_interval=300)
+    supervisor.started = time.monotonic() - 600
+    self.assertFalse(supervisor.stale())
+
+  def test_lp_mode_is_stale_after_stale_samples_intervals(self):
+    supervisor = self.supervisor(sample_interval=3)
+    supervisor.started = time.monotonic() - 600
+    supervisor.reader.received = time.monotonic() - 31
+    self.assertTrue(supervisor.stale())
+
+
+class BsecReaderTest(unittest.TestCase):
+
+  def test_only_parsed_samples_count_as_received(self):
+    reader = BsecReader([Measurement.TEMPERATURE])
+    reader.read(io.BytesIO(b'garbage\n{"temperature": "hot"}\n'))
+    self.assertIsNone(reader.received)
+    self.assertEqual(reader.sequence, 0)
+    reader.read(io.BytesIO(b'{"temperature": 21.5}\n'))
+    self.assertIsNotNone(reader.received)
+    self.assertEqual(reader.sample()[2], (21.5,))
+
+
+class BsecSupervisorCheckpointTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.state_file = os.path.join(self.directory.name, 'bsec_iaq.state')
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def supervisor(self, version):
+    reader = BsecReader([Measurement.TEMPERATURE])
+    return BsecSupervisor(['bsec'], reader, self.state_file, version=version, info=lambda message: None)
+
+  def write(self, path, content):
+    with open(path, 'w') as f:
+      f.write(content)
+
+  def read(self, path):
+    with open(path) as f:
+      return f.read()
+
+  def test_checkpoint_is_restored_for_the_same_version(self):
+    self.write(self.state_file, 'calibrated')
+    self.supervisor('2.0.6.4').checkpoint()
+    os.remove(self.state_file)
+    self.supervisor('2.0.6.4').restore_checkpoint()
+    self.assertEqual(self.read(self.state_file), 'calibrated')
+
+  def test_checkpoint_from_another_version_is_not_restored(self):
+    self.write(self.state_file, 'calibrated by 1.4.9.2')
+    self.supervisor('1.4.9.2').checkpoint()
+    # The state file is wiped when the library is upgraded
+    os.remove(self.state_file)
+    self.supervisor('2.0.6.4').restore_checkpoint()
+    self.assertFalse(os.path.exists(self.state_file))
+
+  def test_existing_state_is_not_overwritten(self):
+    self.write(self.state_file, 'old')
+    supervisor = self.supervisor('2.0.6.4')
+    supervisor.checkpoint()
+    self.write(self.state_file, 'newer')
+    supervisor.restore_checkpoint()
+    self.assertEqual(self.read(self.state_file), 'newer')
+
+
+if __name__ == '__main__':
+  unittest.main()
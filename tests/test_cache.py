@@ -0,0 +1,40 @@
+import tempfile, unittest
+from pathlib import Path
+from sensors.cache import EnumerationCache
+
+
+class Sensor():
+  bus_address = 0x76
+  serial_number = 0x1234
+  id = 'bme280_1234'
+
+
+class EnumerationCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.messages = []
+    self.cache = EnumerationCache(Path(self.directory.name) / 'sensors.json', info=self.messages.append)
+    self.cache.save([ 'bme280' ], [ ('bme280', Sensor()) ], [ 0x40, 0x76 ])
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def test_used_while_the_i2c_bus_is_unchanged(self):
+    records = self.cache.load([ 'bme280' ], [ 0x40, 0x76 ])
+    self.assertEqual(records, [ { 'type': 'bme280', 'address': 0x76, 'serial': 0x1234, 'id': 'bme280_1234' } ])
+
+  def test_ignored_once_a_device_is_added_or_removed(self):
+    self.assertIsNone(self.cache.load([ 'bme280' ], [ 0x40, 0x44, 0x76 ]))
+    self.assertIsNone(self.cache.load([ 'bme280' ], [ 0x76 ]))
+    self.assertEqual(len(self.messages), 2)
+
+  def test_ignored_if_the_bus_can_no_longer_be_scanned(self):
+    self.assertIsNone(self.cache.load([ 'bme280' ], None))
+
+  def test_ignored_for_other_sensor_types(self):
+    self.assertIsNone(self.cache.load([ 'bme280', 'dht22' ], [ 0x40, 0x76 ]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,83 @@
+import random, unittest
+from datetime import datetime
+from sensors.deadband import DeadbandFilter
+from sensors.derived import derivations
+from sensors.measurements import Measurement
+from sensors.publish import PublishPlan
+
+
+class JitteringSensor():
+  """A temperature and humidity sensor whose readings jitter well within the deadbands."""
+
+  id = 'jitter--00000001'
+  supported_measurements = [Measurement.TEMPERATURE, Measurement.HUMIDITY]
+
+  def __init__(self):
+    self.random = random.Random(1)
+
+  def update_sensor(self):
+    self.temperature = 21.0 + self.random.uniform(-0.1, 0.1)
+    self.humidity = 45.0 + self.random.uniform(-0.5, 0.5)
+    self.timestamp = datetime.now().isoformat(timespec='seconds')
+
+
+class DeadbandDerivedMeasurementsTest(unittest.TestCase):
+
+  def published(self, plan, deadband, count=20):
+    return sum(1 for _ in range(count) if deadband.update(plan.state_topic, plan.read()))
+
+  def test_derived_measurements_follow_their_inputs(self):
+    sensor = JitteringSensor()
+    plan = PublishPlan(sensor, derivations=derivations(sensor.supported_measurements, [ 'dew_point', 'absolute_humidity', 'heat_index' ]))
+    deadband = DeadbandFilter({ 'temperature': 0.5, 'humidity': 2 }, max_silence=3600)
+    self.assertIn('dew_point', plan.read())
+    self.assertEqual(self.published(plan, deadband), 1)
+
+  def test_derived_measurements_with_their_own_deadband(self):
+    sensor = JitteringSensor()
+    plan = PublishPlan(sensor, derivations=derivations(sensor.supported_measurements, [ 'dew_point' ]))
+    # The dew point moves by more than its (tiny) deadband, even though temperature and humidity don't
+    deadband = DeadbandFilter({ 'temperature': 0.5, 'humidity': 2, 'dew_point': 0.001 }, max_silence=3600)
+    self.assertGreater(self.published(plan, deadband), 1)
+
+  def test_measured_changes_still_publish(self):
+    sensor = JitteringSensor()
+    plan = PublishPlan(sensor, derivations=derivations(sensor.supported_measurements, [ 'dew_point' ]))
+    deadband = DeadbandFilter({ 'temperature': 0.5, 'humidity': 2 }, max_silence=3600)
+    self.assertTrue(deadband.update(plan.state_topic, plan.read()))
+    sensor.update_sensor = lambda: setattr(sensor, 'temperature', 25.0)
+    self.assertTrue(deadband.update(plan.state_topic, plan.read()))
+
+
+class LightSensor():
+
+  id = 'light--00000001'
+  supported_measurements = [Measurement.LIGHT]
+
+  def __init__(self):
+    self.light = 100.0
+
+  def update_sensor(self):
+    self.light += 1
+    self.timestamp = datetime.now().isoformat(timespec='seconds')
+
+
+class DeadbandUnlistedMeasurementsTest(unittest.TestCase):
+
+  def published(self, plan, deadband, count=20):
+    return sum(1 for _ in range(count) if deadband.update(plan.state_topic, plan.read()))
+
+  def test_unlisted_measurements_follow_the_listed_ones(self):
+    # Humidity jitters, but only temperature has a deadband
+    sensor = JitteringSensor()
+    deadband = DeadbandFilter({ 'temperature': 0.5 }, max_silence=3600)
+    self.assertEqual(self.published(PublishPlan(sensor), deadband), 1)
+
+  def test_sensors_without_listed_measurements_publish_on_any_change(self):
+    sensor = LightSensor()
+    deadband = DeadbandFilter({ 'temperature': 0.5 }, max_silence=3600)
+    self.assertEqual(self.published(PublishPlan(sensor), deadband), 20)
+
+
+if __name__ == '__main__':
+  unittest.main()
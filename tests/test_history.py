@@ -0,0 +1,140 @@
+import random, tempfile, unittest
+from datetime import datetime
+from pathlib import Path
+from sensors.history import History, MINUTE, HOUR
+
+BASE = 472222 * 3600  # An epoch on the hour, in November 2023
+
+
+class HistoryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def history(self, **kwargs):
+    return History(self.directory.name, **kwargs)
+
+  def fill(self, history, epochs, name='temperature'):
+    ring = history.ring('s1', name)
+    for epoch in epochs:
+      ring.add(epoch, float(epoch - BASE))
+    return ring
+
+  def test_raw_ring_wraps_keeping_the_newest(self):
+    # Room for an hour of raw readings, one every 60s
+    history = self.history(days=1/24, resolution=60)
+    self.fill(history, range(BASE, BASE + 7200, 60))
+    history.flush()
+    records = list(history.query('s1', 'temperature', 0, 2**32 - 1))
+    self.assertEqual([ epoch for epoch, _ in records ], list(range(BASE + 3600, BASE + 7200, 60)))
+
+  def test_wraps_across_flushes(self):
+    history = self.history(days=1/24, resolution=60)
+    for hour in range(3):
+      self.fill(history, range(BASE + hour * 3600, BASE + (hour + 1) * 3600, 60))
+      history.flush()
+    records = list(history.query('s1', 'temperature', 0, 2**32 - 1))
+    self.assertEqual(len(records), 60)
+    self.assertEqual(records[0][0], BASE + 7200)
+
+  def test_query_range_is_inclusive(self):
+    history = self.history(resolution=60)
+    self.fill(history, range(BASE, BASE + 3600, 60))
+    history.flush()
+    records = list(history.query('s1', 'temperature', BASE + 600, BASE + 1200))
+    self.assertEqual([ epoch for epoch, _ in records ], list(range(BASE + 600, BASE + 1260, 60)))
+
+  def test_unflushed_records_are_queried(self):
+    history = self.history(resolution=60)
+    self.fill(history, range(BASE, BASE + 600, 60))
+    history.flush()
+    self.fill(history, range(BASE + 600, BASE + 1200, 60))
+    records = list(history.query('s1', 'temperature', 0, 2**32 - 1))
+    self.assertEqual([ epoch for epoch, _ in records ], list(range(BASE, BASE + 1200, 60)))
+
+  def test_rollups(self):
+    history = self.history(resolution=10)
+    # A reading every 10s for two and a half hours, valued at its offset from BASE
+    self.fill(history, range(BASE, BASE + 9000, 10))
+    history.flush()
+    minutes = list(history.query('s1', 'temperature', BASE, BASE + 119, MINUTE))
+    self.assertEqual(minutes, [ (BASE, 0.0, 50.0, 25.0, 6), (BASE + 60, 60.0, 110.0, 85.0, 6) ])
+    # The buckets in progress aren't recorded until they're complete
+    hours = list(history.query('s1', 'temperature', 0, 2**32 - 1, HOUR))
+    self.assertEqual([ (epoch, count) for epoch, _, _, _, count in hours ], [ (BASE, 360), (BASE + 3600, 360) ])
+    self.assertEqual(hours[1][1:4], (3600.0, 7190.0, 5395.0))
+
+  def test_reopened_after_restart(self):
+    history = self.history(resolution=60)
+    self.fill(history, range(BASE, BASE + 600, 60))
+    history.flush()
+    reopened = self.history(resolution=60)
+    self.assertEqual(reopened.measurements('s1'), [ 'temperature' ])
+    self.assertEqual(len(list(reopened.query('s1', 'temperature', 0, 2**32 - 1))), 10)
+    # The raw grid carries on from the last record, rather than starting again
+    ring = reopened.ring('s1', 'temperature')
+    ring.add(BASE + 545, 0.0)
+    ring.add(BASE + 600, 0.0)
+    reopened.flush()
+    self.assertEqual([ epoch for epoch, _ in reopened.query('s1', 'temperature', BASE + 540, 2**32 - 1) ], [ BASE + 540, BASE + 600 ])
+
+  def test_reopened_with_other_retention_starts_afresh(self):
+    history = self.history(days=1, resolution=60)
+    self.fill(history, range(BASE, BASE + 600, 60))
+    history.flush()
+    reopened = self.history(days=2, resolution=60)
+    self.assertEqual(list(reopened.query('s1', 'temperature', 0, 2**32 - 1)), [])
+
+  def test_jittery_readings_are_all_kept(self):
+    # Readings every 30s, with up to 3s of jitter either way, truncated to whole seconds
+    history = self.history(resolution=30)
+    jitter = random.Random(1)
+    epochs = [ int(BASE + 30 * i + jitter.uniform(-3, 3)) for i in range(200) ]
+    self.fill(history, epochs)
+    history.flush()
+    self.assertEqual(len(list(history.query('s1', 'temperature', 0, 2**32 - 1))), 200)
+
+  def test_readings_faster_than_the_resolution_are_thinned(self):
+    history = self.history(resolution=30)
+    self.fill(history, range(BASE, BASE + 600, 10))
+    history.flush()
+    epochs = [ epoch for epoch, _ in history.query('s1', 'temperature', 0, 2**32 - 1) ]
+    # One every 30s on average, on the grid from the first, each at most half the resolution early
+    self.assertEqual(len(epochs), 21)
+    self.assertGreaterEqual(min(b - a for a, b in zip(epochs, epochs[1:])), 15)
+
+  def test_reading_just_after_a_gap_is_thinned(self):
+    history = self.history(resolution=30)
+    self.fill(history, [ BASE, BASE + 3600, BASE + 3601, BASE + 3615 ])
+    history.flush()
+    self.assertEqual([ epoch for epoch, _ in history.query('s1', 'temperature', 0, 2**32 - 1) ], [ BASE, BASE + 3600, BASE + 3615 ])
+
+  def test_record_skips_metadata_and_smoothed_measurements(self):
+    history = self.history(resolution=30)
+    timestamp = datetime.fromtimestamp(BASE).isoformat()
+    history.record('s1', { 'timestamp': timestamp, 'samples': 3, 'temperature': 21.5, 'temperature_smoothed': 21.4 })
+    history.flush()
+    self.assertEqual(history.measurements('s1'), [ 'temperature' ])
+    self.assertEqual(list(history.query('s1', 'temperature', 0, 2**32 - 1)), [ (BASE, 21.5) ])
+
+  def test_measurement_names_cant_reach_other_files(self):
+    history = self.history(resolution=30)
+    self.fill(history, range(BASE, BASE + 600, 60))
+    history.flush()
+    for name in ('../s1/temperature', '/etc/passwd', 'Temperature', ''):
+      with self.assertRaises(ValueError):
+        history.query('s2', name, 0, 2**32 - 1)
+    self.assertFalse(Path(self.directory.name, 's2').exists())
+
+  def test_queries_for_unknown_measurements_open_nothing(self):
+    history = self.history(resolution=30)
+    self.assertEqual(list(history.query('s1', 'humidity', 0, 2**32 - 1)), [])
+    self.assertEqual(history._rings, {})
+    self.assertEqual(history.measurements('s1'), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
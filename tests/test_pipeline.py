@@ -0,0 +1,130 @@
+import random, unittest
+from sensors.measurements import MeasurementError
+from sensors.pipeline import Oversampler, ExponentialSmoother, KalmanSmoother
+
+
+class SequenceSensor():
+  """Gives the next of a list of readings (or raises its MeasurementError) on each read."""
+
+  def __init__(self, readings):
+    self.readings = iter(readings)
+
+  def update_sensor(self):
+    reading = next(self.readings)
+    if isinstance(reading, MeasurementError):
+      raise reading
+    self.temperature = reading
+
+
+TEMPERATURE = [ lambda sensor: sensor.temperature ]
+
+
+class OversamplerTest(unittest.TestCase):
+
+  def test_outliers_are_rejected(self):
+    # The odd spike, e.g. from a DHT22
+    self.assertAlmostEqual(Oversampler(5).filter([ 21.0, 21.1, 20.9, 21.0, 85.0 ]), 21.0)
+    self.assertAlmostEqual(Oversampler(5).filter([ 21.0, 21.1, 20.9, 21.0, -40.0 ]), 21.0)
+
+  def test_noise_is_averaged_not_rejected(self):
+    noise = random.Random(1)
+    values = [ 21.0 + noise.gauss(0, 0.1) for _ in range(9) ]
+    self.assertAlmostEqual(Oversampler(9).filter(values), sum(values) / len(values))
+
+  def test_threshold(self):
+    values = [ 20.0, 20.1, 20.2, 20.3, 20.4, 21.0 ]
+    # 21.0 has a modified z-score of 0.6745 * 0.75 / 0.15 = 3.4
+    self.assertAlmostEqual(Oversampler(6, threshold=3.5).filter(values), sum(values) / 6)
+    self.assertAlmostEqual(Oversampler(6, threshold=3.0).filter(values), sum(values[:-1]) / 5)
+
+  def test_all_equal_values(self):
+    self.assertEqual(Oversampler(5).filter([ 21.5 ] * 5), 21.5)
+
+  def test_mostly_equal_values_without_a_known_step_arent_biased(self):
+    # MAD is 0, so there's no telling the odd one out from noise; none are rejected
+    self.assertAlmostEqual(Oversampler(5).filter([ 21.5, 21.5, 21.5, 21.6, 21.6 ]), 21.54)
+
+  def test_quantized_values_a_step_away_arent_rejected(self):
+    # A sensor with 0.1 resolution reads 21.5 and 21.6 either side of 21.54
+    self.assertAlmostEqual(Oversampler(5).filter([ 21.5, 21.5, 21.6, 21.5, 21.6 ], step=0.1), 21.54)
+    self.assertAlmostEqual(Oversampler(5).filter([ 21.5, 21.5, 21.5, 21.5, 21.6 ], step=0.1), 21.52)
+
+  def test_quantized_outliers_are_still_rejected(self):
+    self.assertAlmostEqual(Oversampler(5).filter([ 21.5, 21.5, 21.6, 21.5, 25.0 ], step=0.1), 21.525)
+
+  def test_too_few_values_to_reject_any(self):
+    self.assertEqual(Oversampler(2).filter([ 20.0, 30.0 ]), 25.0)
+    self.assertEqual(Oversampler(2).filter([ 20.0 ]), 20.0)
+    self.assertIsNone(Oversampler(2).filter([]))
+
+  def test_failed_reads_are_skipped(self):
+    sensor = SequenceSensor([ 21.0, MeasurementError("CRC error"), 21.2, 21.1 ])
+    values, reads = Oversampler(4).sample(sensor, TEMPERATURE)
+    self.assertEqual(reads, 3)
+    self.assertAlmostEqual(values[0], 21.1)
+
+  def test_every_read_failing_raises(self):
+    sensor = SequenceSensor([ MeasurementError("no response") ] * 3)
+    with self.assertRaises(MeasurementError):
+      Oversampler(3).sample(sensor, TEMPERATURE)
+
+  def test_steps_are_used_per_getter(self):
+    # Without the step, MAD is 0 and the spike is kept; with it, the spike is rejected
+    values, _ = Oversampler(4).sample(SequenceSensor([ 21.5, 21.5, 21.5, 25.0 ]), TEMPERATURE)
+    self.assertAlmostEqual(values[0], 22.375)
+    values, _ = Oversampler(4).sample(SequenceSensor([ 21.5, 21.5, 21.5, 25.0 ]), TEMPERATURE, steps=[ 0.1 ])
+    self.assertAlmostEqual(values[0], 21.5)
+
+
+class ExponentialSmootherTest(unittest.TestCase):
+
+  def test_first_sample_is_passed_through(self):
+    self.assertEqual(ExponentialSmoother(300).update(21.0, 1000.0), 21.0)
+
+  def test_one_time_constant_closes_most_of_a_step(self):
+    smoother = ExponentialSmoother(300)
+    smoother.update(20.0, 1000.0)
+    self.assertAlmostEqual(smoother.update(30.0, 1300.0), 20.0 + 10 * 0.6321, places=3)
+
+  def test_independent_of_update_period(self):
+    fast, slow = ExponentialSmoother(300), ExponentialSmoother(300)
+    fast.update(20.0, 0.0)
+    slow.update(20.0, 0.0)
+    for now in range(10, 610, 10):
+      fast.update(30.0, now)
+    slow.update(30.0, 300.0)
+    self.assertAlmostEqual(fast.value, slow.update(30.0, 600.0))
+
+  def test_clock_going_backwards_changes_nothing(self):
+    smoother = ExponentialSmoother(300)
+    smoother.update(20.0, 1000.0)
+    self.assertEqual(smoother.update(30.0, 900.0), 20.0)
+
+
+class KalmanSmootherTest(unittest.TestCase):
+
+  def test_first_sample_is_passed_through(self):
+    smoother = KalmanSmoother(300)
+    self.assertEqual(smoother.update(21.0, 1000.0), 21.0)
+    self.assertEqual(smoother.variance, 1.0)
+
+  def test_settles_on_a_constant(self):
+    smoother = KalmanSmoother(300)
+    for now in range(0, 3000, 10):
+      value = smoother.update(21.0, now)
+    self.assertAlmostEqual(value, 21.0)
+
+  def test_gain_tightens_then_reopens_after_a_gap(self):
+    smoother = KalmanSmoother(300)
+    smoother.update(20.0, 0.0)
+    for now in range(10, 3000, 10):
+      smoother.update(20.0, now)
+    self.assertLess(smoother.variance, 1.0)
+    # A step soon after is mostly smoothed away, one after a long gap mostly followed
+    self.assertLess(smoother.update(30.0, 3000.0) - 20.0, 5.0)
+    smoother.update(20.0, 3010.0)
+    self.assertGreater(smoother.update(30.0, 3010.0 + 3600) - 20.0, 5.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
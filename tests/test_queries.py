@@ -0,0 +1,177 @@
+import json, tempfile, threading, unittest
+from queue import Queue
+from sensors.agent import SensorAgent
+from sensors.history import History
+from sensors.queries import HistoryRequest
+
+BASE = 472222 * 3600  # An epoch on the hour, in November 2023
+
+
+class HistoryRequestTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.history = History(self.directory.name, resolution=10)
+    for name, count in (('temperature', 1200), ('humidity', 300)):
+      ring = self.history.ring('s1', name)
+      for i in range(count):
+        ring.add(BASE + i * 10, float(i))
+    self.history.flush()
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def request(self, **fields):
+    request = HistoryRequest('s1')
+    request.parse(json.dumps({ 'request': 'r1', 'start': BASE, 'end': BASE + 86400, **fields }))
+    return request
+
+  def pages(self, request):
+    return [ json.loads(page) for page in request.pages(self.history) ]
+
+  def test_defaults(self):
+    request = self.request()
+    self.assertEqual((request.resolution, request.page_size, request.measurements), ('raw', 500, None))
+    self.assertEqual(request.response_topic, 'sensors/s1/history/response')
+
+  def test_paging(self):
+    pages = self.pages(self.request(measurements=[ 'temperature' ]))
+    self.assertEqual([ page['page'] for page in pages ], [ 0, 1, 2 ])
+    self.assertEqual([ page['last'] for page in pages ], [ False, False, True ])
+    self.assertEqual([ len(page['records']) for page in pages ], [ 500, 500, 200 ])
+    self.assertEqual(pages[0]['records'][0], [ BASE, 0.0 ])
+    self.assertEqual(pages[2]['records'][-1], [ BASE + 11990, 1199.0 ])
+    self.assertEqual(pages[0]['fields'], [ 'timestamp', 'value' ])
+
+  def test_pages_are_per_measurement(self):
+    pages = self.pages(self.request(page_size=1000))
+    self.assertEqual([ (page['measurement'], len(page['records'])) for page in pages ], [ ('humidity', 300), ('temperature', 1000), ('temperature', 200) ])
+
+  def test_rollups(self):
+    pages = self.pages(self.request(resolution='1m', measurements=[ 'humidity' ]))
+    self.assertEqual(pages[0]['fields'], [ 'timestamp', 'min', 'max', 'mean', 'count' ])
+    self.assertEqual(pages[0]['records'][0], [ BASE, 0.0, 5.0, 2.5, 6 ])
+
+  def test_empty_range(self):
+    pages = self.pages(self.request(start=BASE - 3600, end=BASE - 1))
+    self.assertEqual(pages, [ { 'request': 'r1', 'sensor': 's1', 'page': 0, 'last': True, 'resolution': 'raw', 'fields': [ 'timestamp', 'value' ], 'records': [] } ])
+
+  def test_iso_timestamps(self):
+    request = self.request(start='2023-11-14T22:00:00+00:00', end='2023-11-14T23:00:00+00:00')
+    self.assertEqual((request.start, request.end), (BASE, BASE + 3600))
+
+  def test_malformed_requests(self):
+    for payload in (b'\xff\xfe', b'not json', b'[1, 2]', b'null', b'{}',
+                    b'{"start": true}', b'{"start": [1]}', b'{"start": 1e300}', b'{"start": -1}', b'{"start": "yesterday"}',
+                    b'{"start": 0, "end": 4294967296}',
+                    b'{"start": 0, "resolution": "1d"}',
+                    b'{"start": 0, "measurements": "temperature"}',
+                    b'{"start": 0, "measurements": [1]}',
+                    b'{"start": 0, "measurements": ["../s2/temperature"]}',
+                    b'{"start": 0, "measurements": ["Temperature"]}',
+                    b'{"start": 0, "page_size": 0}', b'{"start": 0, "page_size": 1001}',
+                    b'{"start": 0, "page_size": true}', b'{"start": 0, "page_size": "5"}', b'{"start": 0, "page_size": 2.5}',
+                    b'{"start": 0, "response_topic": "sensors/#"}', b'{"start": 0, "response_topic": ""}', b'{"start": 0, "response_topic": 5}'):
+      with self.subTest(payload=payload), self.assertRaises(ValueError):
+        HistoryRequest('s1').parse(payload)
+
+  def test_unknown_measurements(self):
+    with self.assertRaises(LookupError):
+      self.request(measurements=[ 'temperature', 'pressure' ]).check(self.history)
+    self.request(measurements=[ 'temperature' ]).check(self.history)
+    self.request().check(self.history)
+
+  def test_error(self):
+    request = HistoryRequest('s1')
+    with self.assertRaises(ValueError) as raised:
+      request.parse(b'{"request": "r2"}')
+    self.assertEqual(json.loads(request.error(str(raised.exception))), { 'request': 'r2', 'sensor': 's1', 'code': 400, 'error': 'start of the time range is required' })
+
+
+class FakeResult():
+
+  def __init__(self, rc=0):
+    self.rc = rc
+
+  def wait_for_publish(self, timeout=None):
+    pass
+
+  def is_published(self):
+    return True
+
+
+class FakeClient():
+
+  def __init__(self):
+    self.published = []
+    self.condition = threading.Condition()
+
+  def publish(self, topic, payload=None, qos=0, retain=False):
+    with self.condition:
+      self.published.append((topic, json.loads(payload)))
+      self.condition.notify_all()
+    return FakeResult()
+
+  def wait_for(self, count):
+    with self.condition:
+      return self.condition.wait_for(lambda: len(self.published) >= count, timeout=5)
+
+
+class AgentHistoryRequestTest(unittest.TestCase):
+  """Bad history requests are answered with errors, and don't kill the MQTT or responder threads."""
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.client = FakeClient()
+    # Only the parts of the agent that handle history requests
+    agent = SensorAgent.__new__(SensorAgent)
+    agent.config = { **SensorAgent.default_config, 'verbose': False }
+    agent.history = History(self.directory.name, resolution=10)
+    agent.history_requests = Queue(maxsize=2)
+    agent.mqtt_client = self.client
+    agent.mqtt_connected = True
+    ring = agent.history.ring('s1', 'temperature')
+    for i in range(10):
+      ring.add(BASE + i * 10, float(i))
+    self.agent = agent
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def test_malformed_requests_are_answered_with_errors(self):
+    for payload in (b'\xff\xfe', b'[]', b'{"start": {}}', b'{"start": 0, "measurements": ["../s2/temperature"]}'):
+      self.agent.mqtt_on_message('sensors/s1/history/request', payload)
+    self.assertEqual([ (topic, response['code']) for topic, response in self.client.published ], [ ('sensors/s1/history/response', 400) ] * 4)
+    self.assertTrue(self.agent.history_requests.empty())
+
+  def test_unknown_measurements_are_answered_with_errors(self):
+    self.agent.mqtt_on_message('sensors/s1/history/request', b'{"request": "r1", "start": 0, "measurements": ["pressure"]}')
+    self.assertEqual(self.client.published[0][1], { 'request': 'r1', 'sensor': 's1', 'code': 404, 'error': 'no history of measurement(s): pressure' })
+    self.assertEqual(self.agent.history._rings.keys(), { ('s1', 'temperature') })
+
+  def test_too_many_requests_are_answered_with_errors(self):
+    for _ in range(3):
+      self.agent.mqtt_on_message('sensors/s1/history/request', b'{"start": 0}')
+    self.assertEqual([ response['code'] for _, response in self.client.published ], [ 429 ])
+
+  def test_unexpected_errors_dont_escape_the_mqtt_callback(self):
+    self.agent.history_requests = None
+    self.agent.mqtt_on_message('sensors/s1/history/request', b'{"start": 0}')
+
+  def test_responder_survives_a_failing_request(self):
+    def fail(history):
+      raise RuntimeError("e.g. a bug in paging")
+    failing = HistoryRequest('s1')
+    failing.parse(b'{"request": "failing", "start": 0}')
+    failing.pages = fail
+    self.agent.history_requests.put(failing)
+    self.agent.mqtt_on_message('sensors/s1/history/request', b'{"request": "r2", "start": 0}')
+    responder = threading.Thread(target=self.agent.answer_history_requests, daemon=True)
+    responder.start()
+    self.assertTrue(self.client.wait_for(1))
+    topic, page = self.client.published[0]
+    self.assertEqual((page['request'], page['last'], len(page['records'])), ('r2', True, 10))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,163 @@
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+from sensors.pipeline import Oversampler
+from sensors.scheduler import SensorScheduler
+
+
+class FakeClock():
+
+  def __init__(self, now=1000.0):
+    self.now = now
+
+  def __call__(self):
+    return self.now
+
+
+class ManualExecutor():
+  """Runs nothing until told to, so polls can be left in flight."""
+
+  def __init__(self):
+    self.running = []   # (future, sensor) of polls submitted but not finished
+
+  def submit(self, poll, sensor):
+    future = Future()
+    self.running.append((future, sensor))
+    return future
+
+  def finish(self):
+    running, self.running = self.running, []
+    for future, sensor in running:
+      future.set_result(None)
+
+
+class FakeTime():
+  """Stands in for the time module, sleeping by moving the clock on."""
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def monotonic(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+class Sensor():
+
+  def __init__(self, id):
+    self.id = id
+
+
+class SensorSchedulerTest(unittest.TestCase):
+
+  def scheduler(self, sensors, period):
+    self.clock = FakeClock()
+    self.messages = []
+    self.executor = ManualExecutor()
+    scheduler = SensorScheduler(sensors, poll=None, period=period, info=self.messages.append, clock=self.clock)
+    scheduler.executor.shutdown()
+    scheduler.executor = self.executor
+    return scheduler
+
+  def advance(self, scheduler, seconds, step=1.0):
+    """Run the scheduler for seconds of fake time, finishing every poll straight away; returns the sensors polled, in order."""
+    polled = []
+    end = self.clock.now + seconds
+    while True:
+      scheduler.dispatch_due()
+      polled.extend(sensor.id for _, sensor in self.executor.running)
+      self.executor.finish()
+      if self.clock.now >= end:
+        return polled
+      self.clock.now = min(self.clock.now + step, end)
+
+  def test_sensors_are_polled_straight_away(self):
+    scheduler = self.scheduler([ Sensor('a'), Sensor('b') ], period=30)
+    self.assertEqual(sorted(self.advance(scheduler, 0)), [ 'a', 'b' ])
+
+  def test_per_sensor_periods(self):
+    periods = { 'fast': 5, 'slow': 30 }
+    scheduler = self.scheduler([ Sensor('fast'), Sensor('slow') ], period=lambda sensor: periods[sensor.id])
+    polled = self.advance(scheduler, 60)
+    self.assertEqual(polled.count('fast'), 13)   # At 0, 5, ... 60
+    self.assertEqual(polled.count('slow'), 3)    # At 0, 30, 60
+
+  def test_deadlines_are_measured_from_the_previous_deadline(self):
+    scheduler = self.scheduler([ Sensor('a') ], period=10)
+    # Checked late, every 3s, so each poll starts up to 2s after its deadline
+    polled = self.advance(scheduler, 99, step=3)
+    self.assertEqual(len(polled), 10)   # At 0, 12, 21, 30, 42, 51, 60, 72, 81, 90; no drift
+    self.assertEqual(self.messages, [])
+
+  def test_overrunning_poll_is_reported_and_not_piled_up(self):
+    scheduler = self.scheduler([ Sensor('stuck') ], period=10)
+    scheduler.dispatch_due()
+    for _ in range(3):
+      self.clock.now += 10
+      scheduler.dispatch_due()
+    # Only the first poll was submitted, the three slots since were overruns
+    self.assertEqual(len(self.executor.running), 1)
+    self.assertEqual(scheduler.overruns, { 'stuck': 3 })
+    self.assertIn("Sensor stuck overran its 10s update slot (3 overrun(s) so far)", self.messages)
+    # Once the poll finishes, the next slot polls again
+    self.executor.finish()
+    self.clock.now += 10
+    scheduler.dispatch_due()
+    self.assertEqual(len(self.executor.running), 1)
+
+  def test_missed_slots_are_skipped(self):
+    scheduler = self.scheduler([ Sensor('a') ], period=10)
+    scheduler.dispatch_due()
+    self.executor.finish()
+    # e.g. the host was suspended for 55s: the slots at 10-40s are skipped, and one poll made for the slot at 50s
+    self.clock.now += 55
+    scheduler.dispatch_due()
+    self.assertEqual(len(self.executor.running), 1)
+    self.assertEqual(self.messages, [ "Scheduler is running late, skipping 4 update slot(s) for sensor a" ])
+    # Back on the original cadence, at 60s
+    self.executor.finish()
+    self.assertEqual(scheduler.dispatch_due(), 5)
+
+  def test_added_sensor_is_polled_straight_away(self):
+    scheduler = self.scheduler([ Sensor('a') ], period=10)
+    self.advance(scheduler, 3)
+    scheduler.add(Sensor('new'), 10)
+    self.assertEqual(self.advance(scheduler, 0), [ 'new' ])
+
+
+class SlowSensor():
+  """Takes a second to read, and must be left 2.1s between reads (from the start of each), like a DHT22."""
+  min_read_interval = 2.1
+
+  def __init__(self, time):
+    self.time = time
+    self.reads = []   # Times each read started
+
+  def update_sensor(self):
+    self.reads.append(self.time.now)
+    self.time.now += 1
+    self.value = 20.0
+
+
+class MinReadIntervalTest(unittest.TestCase):
+
+  def test_reads_are_spaced_by_min_read_interval(self):
+    time = FakeTime()
+    sensor = SlowSensor(time)
+    with mock.patch('sensors.pipeline.time', time):
+      values, reads = Oversampler(3).sample(sensor, [ lambda sensor: sensor.value ])
+    self.assertEqual((values, reads), ([ 20.0 ], 3))
+    self.assertEqual([ round(b - a, 6) for a, b in zip(sensor.reads, sensor.reads[1:]) ], [ 2.1, 2.1 ])
+
+  def test_no_wait_after_the_last_read(self):
+    time = FakeTime()
+    sensor = SlowSensor(time)
+    with mock.patch('sensors.pipeline.time', time):
+      Oversampler(1).sample(sensor, [ lambda sensor: sensor.value ])
+    self.assertEqual(time.now, 1001.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,119 @@
+import os, tempfile, time, unittest
+from pathlib import Path
+from sensors.spool import Spool
+
+RATE = 1000000  # Messages per second, so that tests don't wait between messages
+
+
+class SpoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.messages = []
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def spool(self, **kwargs):
+    return Spool(self.directory.name, info=self.messages.append, **kwargs)
+
+  def segments(self):
+    return sorted(path.name for path in Path(self.directory.name).glob('*.seg'))
+
+  def store(self, spool, count, topic='sensors/s1/state'):
+    for i in range(count):
+      self.assertTrue(spool.capture(topic, '{{"i": {}}}'.format(i), connected=False))
+
+  def drain(self, spool):
+    sent = []
+    def publish(topic, payload, qos, retain):
+      sent.append((topic, payload))
+      return True
+    self.assertTrue(spool.drain(publish, RATE, lambda: True))
+    return sent
+
+  def test_nothing_is_stored_while_connected(self):
+    spool = self.spool()
+    self.assertFalse(spool.capture('sensors/s1/state', '{}', connected=True))
+    self.assertFalse(spool.pending())
+
+  def test_segments_rotate_at_segment_bytes(self):
+    spool = self.spool(segment_bytes=200)
+    self.store(spool, 20)
+    self.assertGreater(len(self.segments()), 1)
+    for name in self.segments()[:-1]:
+      # A segment is only closed once it has reached the size
+      self.assertGreaterEqual(os.path.getsize(os.path.join(self.directory.name, name)), 200)
+
+  def test_drains_oldest_first_across_segments(self):
+    spool = self.spool(segment_bytes=200)
+    self.store(spool, 20)
+    sent = self.drain(spool)
+    self.assertEqual([ payload for _, payload in sent ], [ '{{"i": {}}}'.format(i) for i in range(20) ])
+    self.assertFalse(spool.pending())
+    self.assertEqual(self.segments(), [])
+
+  def test_segments_left_by_a_previous_run_are_drained(self):
+    spool = self.spool(segment_bytes=200)
+    self.store(spool, 20)
+    spool._close()
+    sent = self.drain(self.spool(segment_bytes=200))
+    self.assertEqual(len(sent), 20)
+
+  def test_oldest_segments_are_evicted_beyond_max_bytes(self):
+    spool = self.spool(segment_bytes=200, max_bytes=600)
+    self.store(spool, 100)
+    self.assertLessEqual(sum(os.path.getsize(os.path.join(self.directory.name, name)) for name in self.segments()), 600 + 200)
+    self.assertTrue(any(message.startswith("Spool is full") for message in self.messages))
+    # The newest messages are kept, still in order
+    sent = [ payload for _, payload in self.drain(spool) ]
+    self.assertEqual(sent[-1], '{"i": 99}')
+    self.assertEqual(sent, sorted(sent, key=lambda payload: int(payload[6:-1])))
+    self.assertNotIn('{"i": 0}', sent)
+
+  def test_stale_segments_are_evicted(self):
+    spool = self.spool(segment_bytes=200, max_age=3600)
+    self.store(spool, 10)
+    oldest = os.path.join(self.directory.name, self.segments()[0])
+    os.utime(oldest, (time.time() - 7200, time.time() - 7200))
+    self.store(spool, 1)
+    self.assertFalse(os.path.exists(oldest))
+    self.assertTrue(any(message.startswith("Spool is stale") for message in self.messages))
+
+  def test_binary_payloads_are_replayed_unchanged(self):
+    spool = self.spool()
+    payload = bytes(range(256))
+    spool.capture('sensors/s1/state/cbor', payload, qos=1, retain=False, connected=False)
+    spool.capture('sensors/s1/state', 'text', connected=False)
+    sent = self.drain(spool)
+    self.assertEqual(sent, [ ('sensors/s1/state/cbor', payload), ('sensors/s1/state', 'text') ])
+    self.assertIsInstance(sent[0][1], bytes)
+
+  def test_interrupted_drain_resumes_where_it_stopped(self):
+    spool = self.spool(segment_bytes=200)
+    self.store(spool, 20)
+    sent = []
+    def publish(topic, payload, qos, retain):
+      if len(sent) == 7:
+        return False  # e.g. paho's queue is full
+      sent.append(payload)
+      return True
+    self.assertFalse(spool.drain(publish, RATE, lambda: True))
+    self.assertTrue(spool.pending())
+    sent.extend(payload for _, payload in self.drain(spool))
+    self.assertEqual(sent, [ '{{"i": {}}}'.format(i) for i in range(20) ])
+
+  def test_drain_stops_when_disconnected(self):
+    spool = self.spool()
+    self.store(spool, 5)
+    sent = []
+    def publish(topic, payload, qos, retain):
+      sent.append(payload)
+      return True
+    self.assertFalse(spool.drain(publish, RATE, lambda: len(sent) < 2))
+    self.assertEqual(len(sent), 2)
+    self.assertEqual(len(self.drain(spool)), 3)
+
+
+if __name__ == '__main__':
+  unittest.main()